@@ -0,0 +1,211 @@
+import os
+
+# Transcription engines behind models.get_model(). Each one loads a model and
+# turns a transcription into Whisper's segment dicts (id, start, end, text and,
+# with word timestamps, words), so everything downstream is engine-agnostic.
+
+DEFAULT_BACKEND = os.environ.get("UPSHIRSA_BACKEND", "whisper")
+
+# Directory of CTranslate2 models converted with ct2-transformers-converter, one
+# subdirectory per size (e.g. models/ct2/base next to the code). Absolute, so the
+# daemon finds them whatever directory it was started in. Sizes without one are
+# fetched from the Hugging Face hub by faster-whisper on first use.
+CT2_MODEL_DIR = os.path.abspath(os.environ.get(
+    "UPSHIRSA_CT2_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "ct2"),
+))
+# Weight type on CPU; int8 is several times faster than fp32 at nearly the same accuracy
+CT2_COMPUTE_TYPE = os.environ.get("UPSHIRSA_CT2_COMPUTE_TYPE", "int8")
+# Rough int8 model sizes in MB for the model cache, when there is no local directory to measure
+CT2_APPROX_MB = {'tiny': 40, 'base': 75, 'small': 250, 'medium': 770, 'large': 1550}
+
+
+class WhisperBackend:
+    """openai-whisper on PyTorch: fp32 on CPU, fp16 on GPU."""
+
+    name = "whisper"
+    # Decodes several windows in one pass, see batching.py
+    batches = True
+
+    def default_device(self):
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    def load(self, model_size, device, fp16):
+        import whisper
+        model = whisper.load_model(model_size, device=device)
+        return model.half() if fp16 else model
+
+    def memory_mb(self, model, model_size):
+        total = 0
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+        return total / (1024 * 1024)
+
+    def transcribe(self, model, audio, fp16, options):
+        return model.transcribe(audio, fp16=fp16, **options)['segments']
+
+    def transcribe_batch(self, model, windows, fp16, options):
+        # Decodes up to 30 s windows as one batch through the encoder and
+        # decoder, at the first temperature of the profile. Windows Whisper
+        # would have retried at a higher temperature are transcribed again on
+        # their own, so the result matches transcribe() on each window.
+        import torch
+        from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE, log_mel_spectrogram, pad_or_trim
+        from whisper.decoding import DecodingOptions
+        from whisper.tokenizer import get_tokenizer
+
+        temperature = options.get('temperature', 0.0)
+        if isinstance(temperature, (list, tuple)):
+            temperature = temperature[0]
+        decode_options = {'task': "transcribe", 'language': options.get('language'), 'temperature': temperature,
+                          'beam_size': options.get('beam_size'), 'without_timestamps': False, 'fp16': fp16}
+        if temperature > 0 and options.get('best_of') is not None:
+            decode_options['best_of'] = options['best_of']
+        mels = []
+        for window in windows:
+            mel = log_mel_spectrogram(torch.from_numpy(window), model.dims.n_mels, padding=N_SAMPLES)
+            mels.append(pad_or_trim(mel, N_FRAMES))
+        batch = torch.stack(mels).to(model.device)
+        if fp16:
+            batch = batch.half()
+        results = model.decode(batch, DecodingOptions(**decode_options))
+        tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, task="transcribe")
+
+        transcripts = []
+        for window, mel, result in zip(windows, mels, results):
+            duration = len(window) / SAMPLE_RATE
+            # Whisper's own thresholds: silence is dropped, poor decodes are retried
+            if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+                transcripts.append([])
+                continue
+            if result.compression_ratio > 2.4 or result.avg_logprob < -1.0:
+                transcripts.append(self.transcribe(model, window, fp16, options))
+                continue
+            segments = _timestamped_segments(result, tokenizer, duration)
+            if segments and options.get('word_timestamps'):
+                from whisper.timing import add_word_timestamps
+                add_word_timestamps(segments=segments, model=model, tokenizer=tokenizer, mel=mel,
+                                    num_frames=min(len(window) // HOP_LENGTH, N_FRAMES), last_speech_timestamp=0.0)
+            transcripts.append(segments)
+        return transcripts
+
+
+def _timestamped_segments(result, tokenizer, duration):
+    # Splits a decoded window at its timestamp tokens, the way whisper.transcribe
+    # does; text after the last closed segment runs to the end of the window
+    tokens = list(result.tokens)
+    begin = tokenizer.timestamp_begin
+    cuts = [i + 1 for i in range(len(tokens) - 1) if tokens[i] >= begin and tokens[i + 1] >= begin]
+    pieces = []
+    last = 0
+    for cut in cuts:
+        pieces.append(tokens[last:cut])
+        last = cut
+    if last < len(tokens):
+        pieces.append(tokens[last:])
+
+    segments = []
+    for piece in pieces:
+        text_tokens = [token for token in piece if token < tokenizer.eot]
+        text = tokenizer.decode(text_tokens)
+        if not text.strip():
+            continue
+        stamps = [(token - begin) * 0.02 for token in piece if token >= begin]
+        start = stamps[0] if stamps else 0.0
+        end = stamps[-1] if len(stamps) > 1 else duration
+        segments.append({
+            'id': len(segments),
+            'seek': 0,
+            'start': min(start, duration),
+            'end': min(max(end, start), duration),
+            'text': text,
+            'tokens': piece,
+            'temperature': result.temperature,
+            'avg_logprob': result.avg_logprob,
+            'compression_ratio': result.compression_ratio,
+            'no_speech_prob': result.no_speech_prob,
+        })
+    return segments
+
+
+class CTranslate2Backend:
+    """faster-whisper: the same Whisper weights on CTranslate2, int8 on CPU."""
+
+    name = "faster-whisper"
+    batches = False
+
+    def default_device(self):
+        try:
+            import ctranslate2
+            return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        except ImportError:
+            return "cpu"
+
+    def model_path(self, model_size):
+        local = os.path.join(CT2_MODEL_DIR, model_size)
+        return local if os.path.isdir(local) else model_size
+
+    def load(self, model_size, device, fp16):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("The faster-whisper backend needs the faster-whisper package (pip install faster-whisper)")
+        compute_type = "float16" if fp16 else CT2_COMPUTE_TYPE
+        return WhisperModel(self.model_path(model_size), device=device, compute_type=compute_type)
+
+    def memory_mb(self, model, model_size):
+        path = self.model_path(model_size)
+        if os.path.isdir(path):
+            return sum(
+                os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+            ) / (1024 * 1024)
+        return CT2_APPROX_MB.get(model_size.split('.')[0].split('-')[0], 0)
+
+    def options(self, options):
+        # Whisper's decoding defaults where faster-whisper's differ: greedy
+        # search unless a beam is asked for
+        options = dict(options)
+        options['beam_size'] = options.get('beam_size') or 1
+        if options.get('best_of') is None:
+            options.pop('best_of', None)
+        return options
+
+    def transcribe(self, model, audio, fp16, options):
+        segments, _ = model.transcribe(audio, **self.options(options))
+        # faster-whisper yields segments lazily; decoding happens in this loop
+        result = []
+        for index, segment in enumerate(segments):
+            converted = {
+                'id': index,
+                'seek': segment.seek,
+                'start': segment.start,
+                'end': segment.end,
+                'text': segment.text,
+                'tokens': list(segment.tokens),
+                'temperature': segment.temperature,
+                'avg_logprob': segment.avg_logprob,
+                'compression_ratio': segment.compression_ratio,
+                'no_speech_prob': segment.no_speech_prob,
+            }
+            if segment.words is not None:
+                converted['words'] = [
+                    {'word': word.word, 'start': word.start, 'end': word.end, 'probability': word.probability}
+                    for word in segment.words
+                ]
+            result.append(converted)
+        return result
+
+    def transcribe_batch(self, model, windows, fp16, options):
+        # CTranslate2 already decodes each window with all the cores it is
+        # given, so windows are simply taken one after another
+        return [self.transcribe(model, window, fp16, options) for window in windows]
+
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend(), CTranslate2Backend())}
+
+
+def get_backend(name=None):
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]
@@ -0,0 +1,255 @@
+import os
+import glob
+import json
+import time
+import queue
+import threading
+
+import metrics
+from jobs import VideoJob
+from profiles import DEFAULT_PROFILE
+from sources import Leases
+from utils import (
+    VIDEO_OUTPUTS,
+    decode_audio_store,
+    download_youtube_audio,
+    download_youtube_video,
+    is_playlist_url,
+    list_playlist_urls,
+    load_cached_transcript,
+    render_video,
+    resolve_outputs,
+    store_cached_transcript,
+    transcribe_decoded,
+    transcript_options,
+    write_transcripts,
+    youtube_video_id,
+)
+
+VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.webm', '.mov', '.avi', '.m4v', '.flv', '.wmv', '.mpg', '.mpeg', '.ts'}
+
+_STOP = object()
+
+
+def _is_url(source):
+    return source.startswith(("http://", "https://"))
+
+
+def collect_sources(specs):
+    # Each spec is a directory, a glob, a text file listing paths/URLs, a
+    # playlist URL, a single URL or a single file
+    sources = []
+    for spec in specs:
+        if _is_url(spec):
+            sources.extend(list_playlist_urls(spec) if is_playlist_url(spec) else [spec])
+        elif os.path.isdir(spec):
+            for name in sorted(os.listdir(spec)):
+                path = os.path.join(spec, name)
+                if os.path.isfile(path) and os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+                    sources.append(path)
+        elif any(ch in spec for ch in '*?['):
+            sources.extend(sorted(p for p in glob.glob(spec, recursive=True) if os.path.isfile(p)))
+        elif spec.endswith('.txt') and os.path.isfile(spec):
+            with open(spec, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f]
+            sources.extend(collect_sources([line for line in lines if line and not line.startswith('#')]))
+        else:
+            sources.append(spec)
+    # Keep the first occurrence of duplicates
+    return list(dict.fromkeys(sources))
+
+
+class BatchItem:
+    def __init__(self, index, source):
+        self.index = index
+        self.source = source
+        self.is_url = _is_url(source)
+        self.source_id = youtube_video_id(source) if self.is_url else None
+        self.status = "pending"
+        self.stage = None
+        self.error = None
+        self.timings = {}
+        self.job = None
+        self.video_path = None if self.is_url else source
+        # Keeps the item's download in the source store until it is encoded
+        self.leases = Leases()
+        self.audio = None
+        self.cache_key = None
+        self.segments = None
+        self.metrics = metrics.begin_job(f"batch-{index}", source)
+
+    def report(self):
+        outputs = []
+        if self.job is not None and self.status == "done":
+            outputs = list(self.job.outputs.values())
+        return {
+            'source': self.source,
+            'status': self.status,
+            'failed_stage': self.stage if self.status == "failed" else None,
+            'error': self.error,
+            'timings': {name: round(seconds, 3) for name, seconds in self.timings.items()},
+            'outputs': outputs,
+        }
+
+
+class StagedExecutor:
+    """Runs items through a chain of stages, each with its own bounded worker pool.
+
+    Stages are connected by bounded queues, so a slow stage applies
+    backpressure instead of letting decoded audio pile up in memory, while
+    faster stages keep working on the next items.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        # stages: list of (name, fn, workers); fn(item) mutates the item
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.done = []
+        self.done_lock = threading.Lock()
+
+    def _worker(self, index):
+        name, fn, _ = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                break
+            if item.status != "failed":
+                item.stage = name
+                item.status = "running"
+                started = time.perf_counter()
+                try:
+                    with metrics.use_job(item.metrics):
+                        fn(item)
+                except Exception as e:
+                    item.status = "failed"
+                    item.error = str(e)
+                    print(f"[{item.index}] {name} failed for {item.source}: {e}")
+                item.timings[name] = time.perf_counter() - started
+            if outbox is not None:
+                outbox.put(item)
+            else:
+                with self.done_lock:
+                    self.done.append(item)
+
+    def run(self, items):
+        threads = []
+        for index, (_, _, workers) in enumerate(self.stages):
+            stage_threads = [
+                threading.Thread(target=self._worker, args=(index,), daemon=True) for _ in range(max(1, workers))
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        for item in items:
+            self.queues[0].put(item)
+        # Stop the stages in order, so every item has left a stage before the
+        # next one is told to stop
+        for index, stage_threads in enumerate(threads):
+            for _ in stage_threads:
+                self.queues[index].put(_STOP)
+            for thread in stage_threads:
+                thread.join()
+        return sorted(self.done, key=lambda item: item.index)
+
+
+def run_batch(specs, selected_quality="720p", output_dir="output", model_size="base",
+              workers=1, chunk_length=300, use_cache=True, vad=False, profile=DEFAULT_PROFILE, backend=None,
+              subtitle_mode="burn", outputs=None, compact_pdf=False, burn_segments=1, preset=None, crf=None,
+              download_workers=2, decode_workers=2, transcribe_workers=1, output_workers=2, encode_workers=1):
+    outputs = resolve_outputs(outputs, subtitle_mode)
+    needs_video = bool(outputs & VIDEO_OUTPUTS)
+    os.makedirs(output_dir, exist_ok=True)
+    options = transcript_options(chunk_length, vad, profile, backend)
+
+    def download(item):
+        if not item.is_url:
+            if not os.path.isfile(item.source):
+                raise FileNotFoundError(f"No such file: {item.source}")
+            return
+        if use_cache and item.source_id:
+            # Looked up by video id before downloading anything: a transcript-only
+            # item that was transcribed before needs no download at all
+            item.cache_key, item.segments = load_cached_transcript(model_size, options, source_id=item.source_id)
+            if item.segments is not None and not needs_video:
+                return
+        # Transcript-only runs never need the video stream. Downloads stay in
+        # the shared source store for later runs (see sources.py).
+        if not needs_video:
+            item.video_path = download_youtube_audio(item.source, leases=item.leases)
+        else:
+            item.video_path = download_youtube_video(item.source, selected_quality, leases=item.leases)
+
+    def decode(item):
+        # Named after the video id when the download was skipped, as process_youtube_url does
+        item.job = VideoJob(item.video_path or f"{item.source_id or 'youtube'}.mp4", output_dir=output_dir)
+        if item.segments is not None:
+            item.job.segments = item.segments
+            return
+        item.audio = decode_audio_store(item.video_path)
+        if use_cache and item.cache_key is None:
+            item.cache_key, item.job.segments = load_cached_transcript(model_size, options, audio=item.audio)
+
+    def transcribe(item):
+        if item.job.segments is None:
+            item.job.segments = transcribe_decoded(item.audio, model_size=model_size, workers=workers,
+                                                   chunk_length=chunk_length, vad=vad, profile=profile,
+                                                   backend=backend)
+            if use_cache:
+                store_cached_transcript(item.cache_key, item.job.segments)
+        # The decoded audio is the largest thing an item holds; drop it as soon as possible
+        if item.audio is not None:
+            item.audio.remove()
+            item.audio = None
+
+    def transcripts(item):
+        write_transcripts(item.job, outputs, compact_pdf=compact_pdf)
+
+    def encode(item):
+        try:
+            if needs_video:
+                render_video(item.job, item.video_path, outputs, burn_segments=burn_segments, preset=preset, crf=crf)
+            item.status = "done"
+        finally:
+            item.job.cleanup()
+            item.leases.release()
+
+    stages = [
+        ("download", download, download_workers),
+        ("decode", decode, decode_workers),
+        ("transcribe", transcribe, transcribe_workers),
+        ("transcripts", transcripts, output_workers),
+        ("encode", encode, encode_workers),
+    ]
+    items = [BatchItem(index, source) for index, source in enumerate(collect_sources(specs), start=1)]
+    print(f"Processing {len(items)} item(s)")
+    results = StagedExecutor(stages).run(items)
+    for item in results:
+        metrics.finish_job(item.metrics, item.status)
+        # Failed items skip the encode stage, so clean up after them here
+        if item.status == "failed":
+            if item.audio is not None:
+                item.audio.remove()
+            if item.job is not None:
+                item.job.cleanup()
+            item.leases.release()
+    return results
+
+
+def print_report(results, report_path=None):
+    print()
+    print(f"{'#':>4}  {'status':<7} {'time':>8}  source")
+    for item in results:
+        total = sum(item.timings.values())
+        print(f"{item.index:>4}  {item.status:<7} {total:>7.1f}s  {item.source}")
+        if item.status == "failed":
+            print(f"      failed in {item.stage}: {item.error}")
+    failed = sum(1 for item in results if item.status != "done")
+    print(f"\n{len(results) - failed} succeeded, {failed} failed")
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump([item.report() for item in results], f, indent=2)
+        print(f"Report written to {report_path}")
+    return failed
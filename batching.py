@@ -0,0 +1,112 @@
+import os
+import time
+import queue
+import threading
+
+from backends import get_backend
+from models import _model_key, get_model
+
+# Shared inference service: every job in the process hands its audio over in
+# windows of at most WINDOW_SECONDS, and one thread per model decodes whatever
+# windows are waiting as a single batch. Several short clips in flight (web UI
+# requests, batch mode's transcribe workers) then share each pass through the
+# encoder and decoder instead of queueing for the model one at a time.
+# The service is per process: the bot and the worker daemon run every job in a
+# worker process of its own, so their jobs only batch their own windows.
+
+# Windows decoded together at most (1 disables batching)
+MAX_BATCH = int(os.environ.get("UPSHIRSA_BATCH_SIZE", "8"))
+# How long the first window of a batch waits for others to join it, in ms
+MAX_WAIT_MS = float(os.environ.get("UPSHIRSA_BATCH_WAIT_MS", "50"))
+# Whisper's input length; consecutive windows overlap by WINDOW_OVERLAP seconds
+WINDOW_SECONDS = 30
+WINDOW_OVERLAP = 5
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def enabled(backend=None):
+    # Only backends that decode a batch in one pass gain anything from it
+    return MAX_BATCH > 1 and get_backend(backend).batches
+
+
+class _Request:
+    def __init__(self, window, options):
+        self.window = window
+        self.options = options
+        self.segments = None
+        self.error = None
+        self.done = threading.Event()
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.segments
+
+
+class BatchService:
+    """Collects windows for one model and decodes them in batches on its own thread."""
+
+    def __init__(self, model_size, device=None, fp16=False, backend=None):
+        self.model_args = (model_size, device, fp16, backend)
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.windows = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, window, options):
+        # Returns at once; call result() on the returned request to wait for the segments
+        request = _Request(window, options)
+        self.queue.put(request)
+        return request
+
+    def _collect(self):
+        # The first window waits at most MAX_WAIT_MS for others to fill the batch
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + MAX_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Only windows decoded with the same options can share a batch
+            groups = {}
+            for request in batch:
+                groups.setdefault(repr(sorted(request.options.items())), []).append(request)
+            for group in groups.values():
+                try:
+                    # Looked up per batch, so an evicted model is reloaded rather than kept alive here
+                    model_size, device, fp16, backend = self.model_args
+                    model = get_model(model_size, device=device, fp16=fp16, backend=backend)
+                    results = model.transcribe_batch([request.window for request in group], **group[0].options)
+                    for request, segments in zip(group, results):
+                        request.segments = segments
+                except Exception as e:
+                    for request in group:
+                        request.error = e
+                finally:
+                    self.batches += 1
+                    self.windows += len(group)
+                    for request in group:
+                        request.done.set()
+
+
+def get_service(model_size, device=None, fp16=None, backend=None):
+    # Jobs naming the same model in different ways must still share a service
+    key = _model_key(model_size, device, fp16, get_backend(backend))
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = _services[key] = BatchService(*key)
+        return service
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import argparse
+import resource
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def generate_audio(path, duration):
+    # Speech-band noise compresses poorly enough to be a realistic decode, and
+    # FLAC keeps a 3-hour file small and quick to write
+    subprocess.run(
+        ['ffmpeg', '-nostdin', '-y', '-loglevel', 'error', '-f', 'lavfi',
+         '-i', f'anoisesrc=d={duration}:c=pink:r=16000:a=0.3', '-ac', '1', '-c:a', 'flac', path],
+        check=True,
+    )
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def child(mode, path, model, chunk_length):
+    # Runs in a fresh process so ru_maxrss only covers this mode
+    import numpy  # noqa: F401  counted in the baseline, not against the feed
+    import utils
+    baseline = peak_rss_mb()
+    if mode == 'windows':
+        # Everything transcribe_video does around the model: decode to the
+        # store, fingerprint it for the cache and load every window in turn
+        store = utils.decode_audio_store(path)
+        try:
+            store.fingerprint()
+            for _, window in utils.split_audio(store, chunk_length=chunk_length):
+                window.load()
+        finally:
+            store.remove()
+    elif mode == 'in-memory':
+        audio = utils.decode_audio(path)
+        utils.split_audio(audio, chunk_length=chunk_length)
+    else:
+        utils.transcribe_video(path, model_size=model, chunk_length=chunk_length, use_cache=False)
+    print(json.dumps({'baseline_mb': baseline, 'peak_mb': peak_rss_mb()}))
+
+
+def measure(mode, path, args):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, '--input', path,
+         '--model', args.model, '--chunk-length', str(args.chunk_length)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{mode} run failed: {result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that peak memory does not grow with the audio duration")
+    parser.add_argument('--hours', type=float, default=3.0, help="Length of the generated input")
+    parser.add_argument('--input', type=str, default=None, help="Use this file instead of generating one")
+    parser.add_argument('--chunk-length', type=int, default=300, help="Seconds of audio per window")
+    parser.add_argument('--max-rss-mb', type=float, default=float(os.environ.get("UPSHIRSA_AUDIO_RSS_MB", 150)),
+                        help="Ceiling for the growth of peak RSS over the import baseline")
+    parser.add_argument('--model', type=str, default='',
+                        help="Also run the full transcription with this (downloaded) Whisper model")
+    parser.add_argument('--in-memory', action='store_true', help="Also measure decoding the whole waveform into memory")
+    parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.input, args.model, args.chunk_length)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.input
+        if path is None:
+            path = os.path.join(tmp, "long.flac")
+            print(f"Generating {args.hours:g} h of audio...")
+            generate_audio(path, int(args.hours * 3600))
+
+        modes = ['windows'] + (['in-memory'] if args.in_memory else []) + (['transcribe'] if args.model else [])
+        failures = 0
+        for mode in modes:
+            result = measure(mode, path, args)
+            growth = result['peak_mb'] - result['baseline_mb']
+            status = "ok"
+            # Only the windowed feed is held to the ceiling; the model itself and
+            # the in-memory comparison are reported for reference
+            if mode == 'windows' and growth > args.max_rss_mb:
+                status = f"OVER CEILING ({args.max_rss_mb:.0f} MB)"
+                failures += 1
+            print(f"{mode:<10} peak {result['peak_mb']:8.1f} MB  (+{growth:.1f} MB over imports)  {status}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+# Keep the per-stage metrics lines out of the benchmark output
+os.environ.setdefault("UPSHIRSA_METRICS_LOG", "off")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import BACKENDS
+from models import get_model
+from profiles import DEFAULT_PROFILE, PROFILES
+from utils import SAMPLE_RATE, decode_audio, transcribe_audio, create_srt, create_pdf
+
+SEGMENT_KEYS = (('id', int), ('start', float), ('end', float), ('text', str))
+WORD_KEYS = (('word', str), ('start', float), ('end', float))
+
+
+def segment_errors(segments):
+    # Everything downstream (subtitles, PDF, stitching, cache) relies on these fields
+    errors = []
+    if not isinstance(segments, list):
+        return [f"expected a list of segments, got {type(segments).__name__}"]
+    for index, segment in enumerate(segments):
+        for key, kind in SEGMENT_KEYS:
+            value = segment.get(key)
+            if not isinstance(value, kind) and not (kind is float and isinstance(value, int)):
+                errors.append(f"segment {index}: '{key}' is {value!r}")
+        if segment.get('end', 0) < segment.get('start', 0):
+            errors.append(f"segment {index} ends before it starts")
+        for word in segment.get('words') or []:
+            for key, kind in WORD_KEYS:
+                value = word.get(key)
+                if not isinstance(value, kind) and not (kind is float and isinstance(value, int)):
+                    errors.append(f"segment {index}: word '{key}' is {value!r}")
+    return errors
+
+
+def available(name, model_size):
+    try:
+        get_model(model_size, backend=name)
+        return True
+    except Exception as e:
+        print(f"{name:<15} skipped: {e}")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time every installed transcription backend")
+    parser.add_argument('input', type=str, help="Audio or video file to transcribe (real speech gives meaningful numbers)")
+    parser.add_argument('--model', type=str, default="base", help="Whisper model size")
+    parser.add_argument('--backends', type=str, nargs='+', default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    parser.add_argument('--profile', type=str, default=DEFAULT_PROFILE, choices=sorted(PROFILES))
+    parser.add_argument('--max-seconds', type=int, default=None, help="Only use the first N seconds of the input")
+    parser.add_argument('--output', type=str, default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    audio = decode_audio(args.input)
+    if args.max_seconds:
+        audio = audio[:args.max_seconds * SAMPLE_RATE]
+    duration = len(audio) / SAMPLE_RATE
+    print(f"Input: {args.input} ({duration:.0f} s of audio, model {args.model}, profile {args.profile})")
+
+    results = {}
+    failed = False
+    workspace = tempfile.mkdtemp(prefix="upshirsa_backends_")
+    for name in args.backends:
+        # Loading happens here, so the timing below is transcription alone
+        if not available(name, args.model):
+            continue
+        started = time.perf_counter()
+        segments = transcribe_audio(audio, model_size=args.model, profile=args.profile, backend=name)
+        elapsed = time.perf_counter() - started
+        errors = segment_errors(segments)
+        if not errors:
+            # The writers must accept the segments as they are
+            try:
+                create_srt(segments, os.path.join(workspace, f"{name}.srt"))
+                create_pdf(segments, os.path.join(workspace, f"{name}.pdf"))
+            except Exception as e:
+                errors.append(f"writing outputs failed: {e}")
+        words = sum(len(segment['text'].split()) for segment in segments) if not errors else 0
+        results[name] = {'wall_s': round(elapsed, 3), 'rtf': round(elapsed / duration, 4) if duration else None,
+                         'segments': len(segments), 'words': words, 'errors': errors}
+        status = "ok" if not errors else "FAILED"
+        print(f"{name:<15} wall={elapsed:8.1f}s  rtf={elapsed / duration if duration else 0:6.3f}  "
+              f"segments={len(segments):<5} words={words:<6} {status}")
+        for error in errors[:10]:
+            print(f"    {error}")
+        failed = failed or bool(errors)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'input': args.input, 'duration_s': duration, 'model': args.model, 'profile': args.profile,
+                       'results': results}, f, indent=2)
+    if not results:
+        print("No backend could be loaded")
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+# Keep the per-stage metrics lines out of the benchmark output
+os.environ.setdefault("UPSHIRSA_METRICS_LOG", "off")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batching
+from models import get_model
+from profiles import DEFAULT_PROFILE, PROFILES
+from utils import SAMPLE_RATE, decode_audio, transcribe_audio
+
+
+def run_concurrent(clips, model_size, profile):
+    # Every clip is its own job on its own thread, all started at once
+    latencies = [None] * len(clips)
+
+    def job(index):
+        started = time.perf_counter()
+        transcribe_audio(clips[index], model_size=model_size, profile=profile)
+        latencies[index] = time.perf_counter() - started
+
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(len(clips))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate throughput of concurrent short jobs, with and without batching")
+    parser.add_argument('input', type=str, help="Audio or video file; clips are cut from it (real speech gives meaningful numbers)")
+    parser.add_argument('--model', type=str, default="base", help="Whisper model size")
+    parser.add_argument('--profile', type=str, default=DEFAULT_PROFILE, choices=sorted(PROFILES))
+    parser.add_argument('--jobs', type=int, default=8, help="Concurrent clips")
+    parser.add_argument('--clip-seconds', type=int, default=30, help="Length of each clip")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8], help="Batch sizes to compare (1: no batching)")
+    parser.add_argument('--wait-ms', type=float, default=batching.MAX_WAIT_MS, help="Batch wait time")
+    parser.add_argument('--output', type=str, default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    audio = decode_audio(args.input)
+    step = args.clip_seconds * SAMPLE_RATE
+    clips = [audio[(i * step) % max(len(audio) - step, 1):][:step] for i in range(args.jobs)]
+    audio_seconds = sum(len(clip) for clip in clips) / SAMPLE_RATE
+    print(f"Input: {args.input}, {args.jobs} concurrent {args.clip_seconds} s clips, model {args.model}, profile {args.profile}")
+
+    get_model(args.model)
+    batching.MAX_WAIT_MS = args.wait_ms
+    results = {}
+    for batch_size in args.batch_sizes:
+        batching.MAX_BATCH = batch_size
+        # One untimed clip so the service thread and any lazy imports are warm
+        transcribe_audio(clips[0], model_size=args.model, profile=args.profile)
+        wall, latencies = run_concurrent(clips, args.model, args.profile)
+        results[batch_size] = {'wall_s': round(wall, 3), 'audio_s_per_s': round(audio_seconds / wall, 3),
+                               'latency_p50_s': round(latencies[len(latencies) // 2], 3),
+                               'latency_max_s': round(latencies[-1], 3)}
+        print(f"batch {batch_size:<3} wall={wall:7.1f}s  throughput={audio_seconds / wall:6.2f} audio s/s  "
+              f"latency p50={latencies[len(latencies) // 2]:6.1f}s max={latencies[-1]:6.1f}s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'input': args.input, 'jobs': args.jobs, 'clip_seconds': args.clip_seconds, 'model': args.model,
+                       'profile': args.profile, 'wait_ms': args.wait_ms, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import shutil
+from datetime import timedelta
+
+import ffmpeg
+import srt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import embed_subtitles_hardcode, embed_subtitles_hardcode_parallel
+
+
+def generate_video(path, duration, size="1280x720", rate=30):
+    # Synthetic input: moving test pattern plus a tone, keyframe every 2 seconds
+    video = ffmpeg.input(f"testsrc2=size={size}:rate={rate}", format='lavfi', t=duration)
+    audio = ffmpeg.input("sine=frequency=440", format='lavfi', t=duration)
+    (
+        ffmpeg.output(video, audio, path, vcodec='libx264', preset='ultrafast', g=rate * 2, pix_fmt='yuv420p', acodec='aac')
+        .run(overwrite_output=True, quiet=True)
+    )
+
+
+def generate_srt(path, duration, cue_length=2.5):
+    cues = []
+    start = 0.0
+    while start + cue_length <= duration:
+        cues.append(srt.Subtitle(
+            index=len(cues) + 1,
+            start=timedelta(seconds=start),
+            end=timedelta(seconds=start + cue_length),
+            content=f"Subtitle line number {len(cues) + 1}",
+        ))
+        start += cue_length + 0.5
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(srt.compose(cues))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-process vs segment-parallel subtitle burn-in")
+    parser.add_argument('--input', type=str, default=None, help="Video to burn (default: generate one)")
+    parser.add_argument('--srt', type=str, default=None, help="Subtitles to burn (default: generate them)")
+    parser.add_argument('--duration', type=int, default=600, help="Length of the generated video in seconds")
+    parser.add_argument('--size', type=str, default="1280x720", help="Resolution of the generated video")
+    parser.add_argument('--segments', type=int, nargs='+', default=[2, 4, os.cpu_count() or 1], help="Segment counts to try")
+    parser.add_argument('--preset', type=str, default="veryfast", help="x264 preset")
+    parser.add_argument('--crf', type=int, default=23, help="x264 CRF")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="upshirsa_bench_")
+    try:
+        video_path = args.input or os.path.join(work_dir, "input.mp4")
+        if not args.input:
+            print(f"Generating {args.duration} s {args.size} test video...")
+            generate_video(video_path, args.duration, size=args.size)
+        srt_path = args.srt or os.path.join(work_dir, "input.srt")
+        if not args.srt:
+            generate_srt(srt_path, float(ffmpeg.probe(video_path)['format']['duration']))
+
+        output_path = os.path.join(work_dir, "output.mp4")
+        started = time.perf_counter()
+        embed_subtitles_hardcode(video_path, srt_path, output_path, preset=args.preset, crf=args.crf)
+        baseline = time.perf_counter() - started
+        print(f"single    wall={baseline:8.1f}s")
+
+        for segments in sorted(set(args.segments)):
+            started = time.perf_counter()
+            embed_subtitles_hardcode_parallel(
+                video_path, srt_path, output_path, segments=segments, preset=args.preset, crf=args.crf, work_dir=work_dir,
+            )
+            elapsed = time.perf_counter() - started
+            print(f"parallel  segments={segments:<3} wall={elapsed:8.1f}s  speedup={baseline / elapsed:5.2f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
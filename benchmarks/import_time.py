@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that take seconds or hundreds of MB to import; none of them may be
+# loaded just by importing utils or by printing the CLI help
+HEAVY_MODULES = ('torch', 'whisper', 'yt_dlp', 'numpy', 'fpdf', 'moviepy', 'gradio', 'telegram')
+
+CHECKS = {
+    'import utils': [sys.executable, '-c', "import sys, json, utils; print(json.dumps(sorted(sys.modules)))"],
+    'main.py --help': [sys.executable, os.path.join(ROOT, 'main.py'), '--help'],
+}
+
+
+def measure(command, repeat):
+    # Best of N: the minimum is the least noisy estimate of the real cost
+    best = None
+    output = ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+        output = result.stdout
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when startup imports get slower than a budget")
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get("UPSHIRSA_IMPORT_BUDGET_MS", 400)),
+                        help="Wall-clock budget per check, including interpreter startup")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per check; the fastest counts")
+    args = parser.parse_args()
+
+    baseline, _ = measure([sys.executable, '-c', 'pass'], args.repeat)
+    print(f"{'interpreter startup':<20} {baseline * 1000:8.1f} ms")
+
+    failures = 0
+    for name, command in CHECKS.items():
+        elapsed, output = measure(command, args.repeat)
+        status = "ok"
+        if elapsed * 1000 > args.budget_ms:
+            status = f"OVER BUDGET ({args.budget_ms:.0f} ms)"
+            failures += 1
+        print(f"{name:<20} {elapsed * 1000:8.1f} ms  {status}")
+        if name == 'import utils':
+            loaded = set(json.loads(output.strip().splitlines()[-1]))
+            heavy = sorted(m for m in HEAVY_MODULES if m in loaded)
+            if heavy:
+                print(f"{'':<20} heavy modules loaded eagerly: {', '.join(heavy)}")
+                failures += 1
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+# Keep the per-stage metrics lines out of the benchmark output
+os.environ.setdefault("UPSHIRSA_METRICS_LOG", "off")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from burn_parallel import generate_video, generate_srt
+from models import get_model
+from utils import (
+    create_pdf,
+    create_srt,
+    decode_audio,
+    embed_subtitles_hardcode,
+    embed_subtitles_hardcode_parallel,
+    embed_subtitles_soft,
+    extract_audio,
+    process_video,
+    transcribe_audio,
+)
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven wizards quietly judge boxing matches "
+    "and every video needs subtitles that arrive on time without dropping frames or words"
+).split()
+
+
+def synthetic_segments(word_count, words_per_segment=12, word_length=0.35, seed=0):
+    # Whisper-shaped segments with word timestamps, deterministic for a given seed
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    while word_count > 0:
+        n = min(words_per_segment, word_count)
+        words = []
+        for _ in range(n):
+            word = rng.choice(WORDS)
+            words.append({'word': f" {word}", 'start': round(t, 3), 'end': round(t + word_length, 3)})
+            t += word_length + 0.05
+        segments.append({
+            'start': words[0]['start'],
+            'end': words[-1]['end'],
+            'text': "".join(w['word'] for w in words),
+            'words': words,
+        })
+        word_count -= n
+        t += 0.5
+    return segments
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return {'median_s': round(statistics.median(times), 4), 'min_s': round(min(times), 4), 'runs': len(times)}
+
+
+def run_case(results, name, fn, repeat):
+    try:
+        results[name] = measure(fn, repeat)
+        print(f"{name:<55} {results[name]['median_s']:10.3f}s")
+    except Exception as e:
+        # Keep going so one broken stage doesn't hide the others
+        results[name] = {'error': str(e)}
+        print(f"{name:<55} {'failed':>11}  {e}")
+
+
+def ffmpeg_version():
+    try:
+        output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+        return output.splitlines()[0] if output else None
+    except OSError:
+        return None
+
+
+def run(args):
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="upshirsa_bench_")
+    try:
+        for words in args.words:
+            segments = synthetic_segments(words)
+            srt_path = os.path.join(work_dir, "synthetic.srt")
+            pdf_path = os.path.join(work_dir, "synthetic.pdf")
+            run_case(results, f"create_srt/words={words}", lambda: create_srt(segments, srt_path), args.repeat)
+            run_case(results, f"create_pdf/words={words}", lambda: create_pdf(segments, pdf_path), args.repeat)
+
+        if args.model:
+            # Model loading is measured once on its own, not inside every transcription
+            run_case(results, f"load_model/{args.model}", lambda: get_model(args.model), 1)
+
+        for size in args.resolutions:
+            for duration in args.lengths:
+                case = f"{size}/{duration}s"
+                video_path = os.path.join(work_dir, f"input_{size}_{duration}.mp4")
+                srt_path = os.path.join(work_dir, f"input_{size}_{duration}.srt")
+                generate_video(video_path, duration, size=size)
+                generate_srt(srt_path, duration)
+                output_path = os.path.join(work_dir, "output.mp4")
+
+                run_case(results, f"decode_audio/{case}", lambda: decode_audio(video_path), args.repeat)
+                run_case(results, f"extract_audio/{case}",
+                         lambda: extract_audio(video_path, os.path.join(work_dir, "audio.wav")), args.repeat)
+                if args.model:
+                    audio = decode_audio(video_path)
+                    run_case(results, f"transcribe_audio/{args.model}/{case}",
+                             lambda: transcribe_audio(audio, model_size=args.model), args.repeat)
+                run_case(results, f"embed_subtitles_hardcode/{case}",
+                         lambda: embed_subtitles_hardcode(video_path, srt_path, output_path, preset=args.preset),
+                         args.repeat)
+                if args.burn_segments > 1:
+                    run_case(results, f"embed_subtitles_hardcode_parallel/x{args.burn_segments}/{case}",
+                             lambda: embed_subtitles_hardcode_parallel(video_path, srt_path, output_path,
+                                                                       segments=args.burn_segments,
+                                                                       preset=args.preset, work_dir=work_dir),
+                             args.repeat)
+                run_case(results, f"embed_subtitles_soft/{case}",
+                         lambda: embed_subtitles_soft(video_path, srt_path, output_path), args.repeat)
+                if args.model:
+                    run_case(results, f"process_video/{args.model}/{case}",
+                             lambda: end_to_end(video_path, work_dir, args), args.repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'ffmpeg': ffmpeg_version(),
+            'args': {k: v for k, v in vars(args).items() if k != 'func'},
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def end_to_end(video_path, work_dir, args):
+    # process_video deletes its input, so give it a copy; the cache would
+    # turn every run after the first into a lookup
+    copy_path = os.path.join(work_dir, "e2e_" + os.path.basename(video_path))
+    shutil.copy(video_path, copy_path)
+    job = process_video(copy_path, output_dir=os.path.join(work_dir, "output"), model_size=args.model,
+                        use_cache=False, preset=args.preset)
+    shutil.rmtree(job.output_dir, ignore_errors=True)
+
+
+def compare(args):
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'benchmark':<55} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for name in sorted(set(baseline) | set(candidate)):
+        old = baseline.get(name, {}).get('median_s')
+        new = candidate.get(name, {}).get('median_s')
+        if old is None or new is None:
+            # A benchmark that used to pass but now fails counts as a regression
+            flag = "  REGRESSION" if old is not None and name in candidate else ""
+            regressions += bool(flag)
+            print(f"{name:<55} {old if old is not None else '-':>10} {new if new is not None else '-':>10}{flag}")
+            continue
+        change = (new - old) / old if old else 0.0
+        # Small absolute differences are noise, whatever the ratio says
+        flag = ""
+        if change > args.threshold and new - old > args.min_delta:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -args.threshold and old - new > args.min_delta:
+            flag = "  improved"
+        print(f"{name:<55} {old:10.3f} {new:10.3f} {change:+8.1%}{flag}")
+    print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for each pipeline stage and the whole pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_run = subparsers.add_parser('run', help="Run the benchmarks on generated inputs")
+    parser_run.add_argument('--output', type=str, default="bench_results.json", help="Where to write the JSON results")
+    parser_run.add_argument('--lengths', type=int, nargs='+', default=[30, 120], help="Generated video lengths in seconds")
+    parser_run.add_argument('--resolutions', type=str, nargs='+', default=["640x360", "1280x720"],
+                            help="Generated video resolutions")
+    parser_run.add_argument('--words', type=int, nargs='+', default=[10000, 100000],
+                            help="Word counts for the synthetic SRT/PDF transcripts")
+    parser_run.add_argument('--model', type=str, default="tiny",
+                            help="Whisper model for transcription benchmarks; it must already be downloaded. "
+                                 "Pass '' to skip transcription and process_video")
+    parser_run.add_argument('--burn-segments', type=int, default=os.cpu_count() or 1,
+                            help="Segments for the parallel burn-in benchmark (1 skips it)")
+    parser_run.add_argument('--preset', type=str, default="veryfast", help="x264 preset for burned-in output")
+    parser_run.add_argument('--repeat', type=int, default=3, help="Runs per benchmark; the median is reported")
+    parser_run.set_defaults(func=run)
+
+    parser_compare = subparsers.add_parser('compare', help="Compare two result files and flag regressions")
+    parser_compare.add_argument('baseline', type=str, help="Results of the reference run")
+    parser_compare.add_argument('candidate', type=str, help="Results of the run to check")
+    parser_compare.add_argument('--threshold', type=float, default=0.10, help="Relative slowdown that counts as a regression")
+    parser_compare.add_argument('--min-delta', type=float, default=0.05, help="Ignore changes smaller than this many seconds")
+    parser_compare.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Keep the per-stage metrics lines out of the benchmark output
+os.environ.setdefault("UPSHIRSA_METRICS_LOG", "off")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import get_model
+from profiles import PROFILES
+from subtitles import interpolate_words
+from utils import SAMPLE_RATE, decode_audio, transcribe_audio
+
+
+def interpolation_error(segments):
+    # Mean distance between Whisper's word start times and the ones the fast
+    # profile would estimate from the same segments
+    errors = []
+    for segment in segments:
+        words = [w for w in segment.get('words') or [] if w['word'].strip()]
+        estimated = interpolate_words(segment)
+        if len(words) != len(estimated):
+            continue
+        errors += [abs(w['start'] - e['start']) for w, e in zip(words, estimated)]
+    return sum(errors) / len(errors) if errors else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Real-time factor of each decoding profile")
+    parser.add_argument('input', type=str, help="Audio or video file to transcribe (real speech gives meaningful numbers)")
+    parser.add_argument('--model', type=str, default="base", help="Whisper model size")
+    parser.add_argument('--profiles', type=str, nargs='+', default=sorted(PROFILES), choices=sorted(PROFILES))
+    parser.add_argument('--max-seconds', type=int, default=None, help="Only use the first N seconds of the input")
+    parser.add_argument('--output', type=str, default=None, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    audio = decode_audio(args.input)
+    if args.max_seconds:
+        audio = audio[:args.max_seconds * SAMPLE_RATE]
+    duration = len(audio) / SAMPLE_RATE
+    print(f"Input: {args.input} ({duration:.0f} s of audio, model {args.model})")
+
+    # Load the model up front so the first profile isn't charged for it
+    get_model(args.model)
+    results = {}
+    for profile in args.profiles:
+        started = time.perf_counter()
+        segments = transcribe_audio(audio, model_size=args.model, profile=profile)
+        elapsed = time.perf_counter() - started
+        words = sum(len(segment['text'].split()) for segment in segments)
+        results[profile] = {'wall_s': round(elapsed, 3), 'rtf': round(elapsed / duration, 4),
+                            'segments': len(segments), 'words': words}
+        line = f"{profile:<10} wall={elapsed:8.1f}s  rtf={elapsed / duration:6.3f}  segments={len(segments):<5} words={words}"
+        error = interpolation_error(segments)
+        if error is not None:
+            results[profile]['interpolated_word_error_s'] = round(error, 3)
+            line += f"  interpolated word-start error={error:.3f}s"
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'input': args.input, 'duration_s': duration, 'model': args.model, 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
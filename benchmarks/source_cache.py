@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sources
+
+# Checks the metadata cache, request coalescing and the source store with a
+# local stand-in for yt-dlp, so nothing here touches the network. Exits
+# non-zero if any request extracts or downloads more often than it should.
+
+VIDEO_URLS = (
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?t=42",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+)
+FORMAT = ('720p', 'bestvideo[height<=720]+bestaudio/best[height<=720]', ['mp4'])
+
+
+class StandIn:
+    """Counts calls; each one takes long enough for concurrent requests to overlap."""
+
+    def __init__(self, delay=0.2, size=1024 * 1024):
+        self.delay = delay
+        self.size = size
+        self.extractions = 0
+        self.downloads = 0
+        self.lock = threading.Lock()
+
+    def extract(self, video_url):
+        with self.lock:
+            self.extractions += 1
+        time.sleep(self.delay)
+        return {'id': sources.youtube_video_id(video_url), 'duration': 60, 'formats': [{'height': 720, 'ext': 'mp4'}]}
+
+    def download(self, info_dict, format_spec, outtmpl, possible_exts):
+        with self.lock:
+            self.downloads += 1
+        time.sleep(self.delay)
+        path = outtmpl.replace('%(ext)s', 'mp4')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * self.size)
+        return path
+
+
+def fetch(stand_in, video_url):
+    variant, format_spec, exts = FORMAT
+    return sources.fetch_source(video_url, variant, format_spec, exts,
+                                extractor=stand_in.extract, downloader=stand_in.download)
+
+
+def concurrent(count, fn):
+    results = [None] * count
+
+    def run(index):
+        results[index] = fn(index)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    workspace = tempfile.mkdtemp(prefix="upshirsa_sources_")
+    sources.SOURCE_DIR = os.path.join(workspace, "sources")
+    sources.METADATA_DIR = os.path.join(workspace, "metadata")
+    stand_in = StandIn()
+    failures = []
+
+    def check(name, ok, detail):
+        print(f"{name:<52} {'ok' if ok else 'FAILED'}  ({detail})")
+        if not ok:
+            failures.append(name)
+
+    # Eight requests at once, through different URL forms of the same video
+    started = time.perf_counter()
+    paths = concurrent(8, lambda i: fetch(stand_in, VIDEO_URLS[i % len(VIDEO_URLS)]))
+    elapsed = time.perf_counter() - started
+    check("concurrent requests: one extraction, one download",
+          stand_in.extractions == 1 and stand_in.downloads == 1 and len(set(paths)) == 1,
+          f"{stand_in.extractions} extraction(s), {stand_in.downloads} download(s), {elapsed:.2f}s")
+
+    # Planning the quality and then downloading, as a bot job does
+    stand_in = StandIn()
+    sources.get_info(VIDEO_URLS[0], extractor=stand_in.extract)
+    fetch(stand_in, VIDEO_URLS[1])
+    check("repeat request: no extraction, no download", stand_in.extractions == 0 and stand_in.downloads == 0,
+          f"{stand_in.extractions} extraction(s), {stand_in.downloads} download(s)")
+
+    # A new process (the worker after the bot planned the job) reads the metadata from disk
+    sources._memory.clear()
+    sources.get_info(VIDEO_URLS[2], extractor=stand_in.extract)
+    check("metadata shared through the disk cache", stand_in.extractions == 0,
+          f"{stand_in.extractions} extraction(s)")
+
+    # Expired metadata is extracted again, exactly once
+    ttl = sources.METADATA_TTL_S
+    sources.METADATA_TTL_S = 0
+    sources.get_info(VIDEO_URLS[0], extractor=stand_in.extract)
+    sources.METADATA_TTL_S = ttl
+    sources.get_info(VIDEO_URLS[0], extractor=stand_in.extract)
+    check("expired metadata extracted again once", stand_in.extractions == 1, f"{stand_in.extractions} extraction(s)")
+
+    # The store keeps the most recently used downloads under its cap
+    stand_in = StandIn(delay=0)
+    sources.MAX_SOURCE_MB = 2.5
+    ids = ["aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"]
+    for video_id in ids:
+        fetch(stand_in, f"https://youtu.be/{video_id}")
+        time.sleep(0.05)
+    fetch(stand_in, "https://youtu.be/dQw4w9WgXcQ")
+    kept = sorted(name.split('.')[0] for name in os.listdir(sources.SOURCE_DIR) if not name.startswith('.'))
+    check("LRU store stays under its cap", kept == sorted(["ccccccccccc", "dQw4w9WgXcQ"]), f"kept {kept}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
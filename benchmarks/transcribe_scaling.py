@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import get_model
+from utils import SAMPLE_RATE, decode_audio, transcribe_audio, transcribe_audio_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wall-clock scaling of parallel transcription")
+    parser.add_argument('input', type=str, help="Audio or video file to transcribe")
+    parser.add_argument('--model', type=str, default="base", help="Whisper model size")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Worker counts to try")
+    parser.add_argument('--chunk-length', type=int, default=300, help="Seconds of audio per chunk")
+    parser.add_argument('--max-seconds', type=int, default=None, help="Only use the first N seconds of the input")
+    args = parser.parse_args()
+
+    audio = decode_audio(args.input)
+    if args.max_seconds:
+        audio = audio[:args.max_seconds * SAMPLE_RATE]
+    duration = len(audio) / SAMPLE_RATE
+    print(f"Input: {args.input} ({duration:.0f} s of audio, {os.cpu_count()} cores)")
+
+    # Load the in-process model up front so the single worker run isn't charged for it
+    get_model(args.model)
+    baseline = None
+    for workers in args.workers:
+        started = time.perf_counter()
+        if workers == 1:
+            segments = transcribe_audio(audio, model_size=args.model)
+        else:
+            segments = transcribe_audio_parallel(audio, model_size=args.model, workers=workers, chunk_length=args.chunk_length)
+        elapsed = time.perf_counter() - started
+        if baseline is None:
+            baseline = elapsed
+        print(
+            f"workers={workers:<3} wall={elapsed:8.1f}s  rtf={elapsed / duration:6.3f}  "
+            f"speedup={baseline / elapsed:5.2f}x  segments={len(segments)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
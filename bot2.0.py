@@ -12,9 +12,15 @@ from telegram.ext import (
 )
 from utils import (
     process_video,
-    fetch_video_info,
-    download_youtube_video,
+    plan_youtube,
+    process_youtube_url,
+    resolve_outputs,
+    OUTPUT_KINDS,
+    PROFILES,
+    VIDEO_OUTPUTS,
 )
+from scheduler import JobScheduler, JobCancelled
+import metrics
 import asyncio
 
 # Configure logging
@@ -24,6 +30,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Telegram's 50 MB upload limit, minus room for the container; jobs are planned to fit it
+TELEGRAM_TARGET_MB = 48
+
+# Subtitle modes /subtitles offers; /outputs picks individual files instead
+SUBTITLE_MODES = ('burn', 'soft')
+
 # Define conversation states
 CHOOSING, PROCESS_VIDEO, PROCESS_YOUTUBE = range(3)
 
@@ -60,13 +72,46 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "🛠 *Upshirsa Subtitle Generator Bot Help*\n\n"
         "*Commands:*\n"
         "/start - Show welcome message and options\n"
-        "/help - Show this help message\n\n"
+        "/help - Show this help message\n"
+        "/cancel - Cancel your queued or running jobs\n"
+        "/subtitles burn|soft - Burn subtitles into the video, or add them as a track (faster)\n"
+        "/outputs burned|muxed|pdf|srt|vtt|txt|json ... - Choose exactly which files you get back\n"
+        "/profile fast|accurate - Faster transcription with estimated word timing, or the full one\n\n"
         "*How to use:*\n"
         "• Click on 'Send Video' to upload a video file.\n"
         "• Click on 'Send YouTube Link' to provide a YouTube URL.\n"
     )
     await update.message.reply_markdown(help_message)
 
+async def subtitles_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Chooses between burned-in subtitles and a soft subtitle track."""
+    if not context.args or context.args[0] not in SUBTITLE_MODES:
+        current = context.user_data.get('subtitle_mode', 'burn')
+        await update.message.reply_text(f"Usage: /subtitles burn|soft (currently: {current})")
+        return
+    context.user_data['subtitle_mode'] = context.args[0]
+    context.user_data.pop('outputs', None)
+    await update.message.reply_text(f"✅ Subtitle mode set to: {context.args[0]}")
+
+async def outputs_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Chooses which files jobs produce; anything not listed is never computed."""
+    choices = [arg.lower() for arg in context.args or []]
+    if not choices or any(choice not in OUTPUT_KINDS for choice in choices):
+        current = " ".join(context.user_data.get('outputs') or []) or f"/subtitles {context.user_data.get('subtitle_mode', 'burn')}"
+        await update.message.reply_text(f"Usage: /outputs {' '.join(OUTPUT_KINDS)} (currently: {current})")
+        return
+    context.user_data['outputs'] = sorted(set(choices))
+    await update.message.reply_text(f"✅ Outputs set to: {' '.join(context.user_data['outputs'])}")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Chooses between fast and accurate transcription."""
+    if not context.args or context.args[0] not in PROFILES:
+        current = context.user_data.get('profile', 'accurate')
+        await update.message.reply_text(f"Usage: /profile {'|'.join(sorted(PROFILES))} (currently: {current})")
+        return
+    context.user_data['profile'] = context.args[0]
+    await update.message.reply_text(f"✅ Transcription profile set to: {context.args[0]}")
+
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handles button clicks and sets the conversation state."""
     query = update.callback_query
@@ -84,56 +129,93 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await query.edit_message_text(text="❌ *Invalid selection. Please try again.*", parse_mode='Markdown')
         return CHOOSING
 
-async def send_files(update: Update, context: ContextTypes.DEFAULT_TYPE, video_path, pdf_path):
-    """Sends the processed video and PDF transcript to the user."""
-    # Verify files exist
-    if not os.path.exists(video_path):
-        logger.error(f"Processed video file does not exist: {video_path}")
-        await update.message.reply_text("❌ Processed video file not found.")
-        return
+async def send_files(update: Update, context: ContextTypes.DEFAULT_TYPE, outputs):
+    """Sends every file the job produced: videos as videos, everything else as documents."""
+    captions = {
+        'burned': "🎥 *Here is your video with embedded subtitles!*",
+        'muxed': "🎥 *Here is your video with a subtitle track!*",
+        'pdf': "📄 *Here is the PDF transcript!*",
+    }
+    for kind, path in outputs.items():
+        # Verify the file exists
+        if not os.path.exists(path):
+            logger.error(f"Output file does not exist: {path}")
+            await update.message.reply_text(f"❌ The {kind} output was not found.")
+            continue
+
+        size = os.path.getsize(path) / (1024 * 1024)  # MB
+        logger.info(f"Sending {kind}: {path} ({size:.2f} MB)")
+
+        # Check against Telegram's limit (50 MB for regular users)
+        if size > 50:
+            await update.message.reply_text(f"❌ The {kind} output is too large to send (over 50 MB). Please try processing a shorter video.")
+            logger.error(f"{kind} size exceeds limit: {size:.2f} MB")
+            continue
 
-    if not os.path.exists(pdf_path):
-        logger.error(f"PDF transcript file does not exist: {pdf_path}")
-        await update.message.reply_text("❌ PDF transcript file not found.")
-        return
+        try:
+            with open(path, 'rb') as f:
+                if kind in VIDEO_OUTPUTS:
+                    await update.message.reply_video(
+                        video=InputFile(f),
+                        caption=captions[kind],
+                        parse_mode='Markdown'
+                    )
+                else:
+                    await update.message.reply_document(
+                        document=InputFile(f),
+                        filename=os.path.basename(path),
+                        caption=captions.get(kind, f"📄 *Here is the {kind.upper()} file!*")
+                    )
+            logger.info(f"Successfully sent {kind}: {path}")
+        except Exception as e:
+            logger.error(f"Error sending {kind}: {e}")
+            await update.message.reply_text(f"❌ An error occurred while sending the {kind} output: {e}")
+
+async def queue_job(update: Update, context: ContextTypes.DEFAULT_TYPE, fn, *args, cleanup_paths=(), **kwargs) -> None:
+    """Queues a processing job and delivers its results in the background."""
+    scheduler = context.application.bot_data['scheduler']
+    user_id = update.effective_user.id
+    job = await scheduler.submit(user_id, fn, *args, **kwargs)
+    position = scheduler.position(job)
+    if position > 1:
+        await update.message.reply_text(f"📥 Your job is queued at position {position}. Send /cancel to abort it.")
+    else:
+        await update.message.reply_text("🔄 Processing the video. This might take a few moments... Send /cancel to abort it.")
+    context.application.create_task(deliver_job(update, context, job, cleanup_paths))
+
+async def deliver_job(update: Update, context: ContextTypes.DEFAULT_TYPE, job, cleanup_paths=()) -> None:
+    """Waits for a queued job, sends its files and cleans up."""
+    try:
+        video_job = await job.result()
+        outputs = video_job.outputs
+        logger.info(f"Generated outputs: {outputs}")
 
-    # Get file sizes
-    video_size = os.path.getsize(video_path) / (1024 * 1024)  # MB
-    pdf_size = os.path.getsize(pdf_path) / (1024 * 1024)      # MB
-    logger.info(f"Sending video: {video_path} ({video_size:.2f} MB)")
-    logger.info(f"Sending PDF: {pdf_path} ({pdf_size:.2f} MB)")
+        # Send the files
+        await send_files(update, context, outputs)
 
-    # Check PDF size against Telegram's limit (50 MB for regular users)
-    if pdf_size > 50:
-        await update.message.reply_text("❌ The generated PDF is too large to send (over 50 MB). Please try processing a shorter video.")
-        logger.error(f"PDF size exceeds limit: {pdf_size:.2f} MB")
+    except JobCancelled:
+        logger.info(f"Job {job.job_id} cancelled by user {job.user_id}")
         return
 
-    # Send Video
-    try:
-        with open(video_path, 'rb') as video_file:
-            await update.message.reply_video(
-                video=InputFile(video_file),
-                caption="🎥 *Here is your video with embedded subtitles!*",
-                parse_mode='Markdown'
-            )
-        logger.info(f"Successfully sent video: {video_path}")
     except Exception as e:
-        logger.error(f"Error sending video: {e}")
-        await update.message.reply_text(f"❌ An error occurred while sending the video: {e}")
+        logger.error(f"Error processing video: {e}")
+        await update.message.reply_text(f"❌ An error occurred while processing the video: {e}")
 
-    # Send PDF
-    try:
-        with open(pdf_path, 'rb') as pdf_file:
-            await update.message.reply_document(
-                document=InputFile(pdf_file),
-                filename=os.path.basename(pdf_path),
-                caption="📄 *Here is the PDF transcript!*"
-            )
-        logger.info(f"Successfully sent PDF: {pdf_path}")
-    except Exception as e:
-        logger.error(f"Error sending PDF: {e}")
-        await update.message.reply_text(f"❌ An error occurred while sending the PDF transcript: {e}")
+    finally:
+        # Clean up temporary files
+        try:
+            paths = list(cleanup_paths)
+            if 'outputs' in locals():
+                paths += list(outputs.values())
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+                    logger.debug(f"Removed file: {path}")
+        except Exception as cleanup_error:
+            logger.error(f"Error cleaning up files: {cleanup_error}")
+
+    # Return to the main menu
+    await start(update, context)
 
 async def handle_video_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Processes the uploaded video."""
@@ -161,36 +243,19 @@ async def handle_video_upload(update: Update, context: ContextTypes.DEFAULT_TYPE
         await new_file.download_to_drive(video_path)
         logger.info(f"Downloaded video to: {video_path}")
 
-        # Process the video using utils.py in a separate thread
-        await update.message.reply_text("🔄 Processing the video. This might take a few moments...")
-        processed_video_path, output_pdf_path = await asyncio.to_thread(process_video, video_path)
-        logger.info(f"Processed video at: {processed_video_path}")
-        logger.info(f"Generated PDF at: {output_pdf_path}")
-
-        # Send the files
-        await send_files(update, context, processed_video_path, output_pdf_path)
+        # Hand the video to the worker pool; results are sent when it finishes
+        await queue_job(
+            update, context, process_video, video_path, cleanup_paths=[video_path],
+            subtitle_mode=context.user_data.get('subtitle_mode', 'burn'),
+            outputs=context.user_data.get('outputs'),
+            profile=context.user_data.get('profile', 'accurate'),
+        )
 
     except Exception as e:
         logger.error(f"Error processing video: {e}")
         await update.message.reply_text(f"❌ An error occurred while processing the video: {e}")
+        await start(update, context)
 
-    finally:
-        # Clean up temporary files
-        try:
-            if os.path.exists(video_path):
-                os.remove(video_path)
-                logger.debug(f"Removed temporary video file: {video_path}")
-            if 'processed_video_path' in locals() and os.path.exists(processed_video_path):
-                os.remove(processed_video_path)
-                logger.debug(f"Removed processed video file: {processed_video_path}")
-            if 'output_pdf_path' in locals() and os.path.exists(output_pdf_path):
-                os.remove(output_pdf_path)
-                logger.debug(f"Removed PDF transcript file: {output_pdf_path}")
-        except Exception as cleanup_error:
-            logger.error(f"Error cleaning up files: {cleanup_error}")
-
-    # Return to the main menu
-    await start(update, context)
     return CHOOSING
 
 async def handle_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -204,58 +269,37 @@ async def handle_youtube_url(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await update.message.reply_text("✅ YouTube link received! Fetching video information...")
 
     try:
-        # Fetch available qualities
-        qualities = fetch_video_info(youtube_url)
-        if isinstance(qualities, str):
-            # An error occurred
-            await update.message.reply_text(f"❌ {qualities}")
-            return CHOOSING
-
-        if not qualities:
-            await update.message.reply_text("❌ No valid video qualities found.")
-            return CHOOSING
-
-        # Select the highest available quality
-        selected_quality = qualities[0]  # Assuming qualities are sorted from highest to lowest
-        await update.message.reply_text(f"🔍 Selected quality: {selected_quality}\n🔄 Processing video... Please wait.")
-
-        # Download the YouTube video
-        video_path = download_youtube_video(youtube_url, selected_quality)
-        logger.info(f"Downloaded YouTube video to: {video_path}")
-
-        # Process the video
-        processed_video_path, output_pdf_path = await asyncio.to_thread(process_video, video_path)
-        logger.info(f"Processed video at: {processed_video_path}")
-        logger.info(f"Generated PDF at: {output_pdf_path}")
-
-        # Send the files
-        await send_files(update, context, processed_video_path, output_pdf_path)
+        options = {
+            'subtitle_mode': context.user_data.get('subtitle_mode', 'burn'),
+            'outputs': context.user_data.get('outputs'),
+            'profile': context.user_data.get('profile', 'accurate'),
+        }
+        # Plan the quality from the video's length and the upload limit before
+        # downloading anything; fetched off the event loop so other chats keep responding
+        plan = await asyncio.to_thread(
+            plan_youtube, youtube_url, resolve_outputs(options['outputs'], options['subtitle_mode']),
+            target_mb=TELEGRAM_TARGET_MB,
+        )
+        await update.message.reply_text(f"🔍 {plan.describe()}")
+        if not plan.fits:
+            await update.message.reply_text("⚠️ The video can't fit Telegram's limit, so you'll get the transcripts only.")
+
+        # Download and process in the worker pool so the downloads can be cancelled too
+        await queue_job(update, context, process_youtube_url, youtube_url, plan.quality, **plan.apply(options))
 
     except Exception as e:
         logger.error(f"Error processing YouTube video: {e}")
         await update.message.reply_text(f"❌ An error occurred while processing the YouTube video: {e}")
+        await start(update, context)
 
-    finally:
-        # Clean up temporary files
-        try:
-            if 'video_path' in locals() and os.path.exists(video_path):
-                os.remove(video_path)
-                logger.debug(f"Removed temporary YouTube video file: {video_path}")
-            if 'processed_video_path' in locals() and os.path.exists(processed_video_path):
-                os.remove(processed_video_path)
-                logger.debug(f"Removed processed video file: {processed_video_path}")
-            if 'output_pdf_path' in locals() and os.path.exists(output_pdf_path):
-                os.remove(output_pdf_path)
-                logger.debug(f"Removed PDF transcript file: {output_pdf_path}")
-        except Exception as cleanup_error:
-            logger.error(f"Error cleaning up files: {cleanup_error}")
-
-    # Return to the main menu
-    await start(update, context)
     return CHOOSING
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Cancels and ends the conversation."""
+    """Cancels the user's jobs and ends the conversation."""
+    scheduler = context.application.bot_data['scheduler']
+    cancelled = await scheduler.cancel_user(update.effective_user.id)
+    if cancelled:
+        await update.message.reply_text(f"🛑 Cancelled {cancelled} job(s).")
     await update.message.reply_text(
         "Operation cancelled. To start again, type /start.",
         reply_markup=InlineKeyboardMarkup([
@@ -269,6 +313,19 @@ async def main_menu_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await start(update, context)
     return CHOOSING
 
+async def start_scheduler(application) -> None:
+    """Starts the worker pool once the bot's event loop is running."""
+    scheduler = JobScheduler()
+    await scheduler.start()
+    application.bot_data['scheduler'] = scheduler
+    metrics.start_metrics_server(9464)
+
+async def stop_scheduler(application) -> None:
+    """Stops the worker pool when the bot shuts down."""
+    scheduler = application.bot_data.get('scheduler')
+    if scheduler:
+        await scheduler.shutdown()
+
 def main():
     """Starts the bot."""
     application = (
@@ -276,6 +333,8 @@ def main():
         .token(BOT_TOKEN)
         .read_timeout(30)    # Set read timeout to 30 seconds
         .write_timeout(30)   # Set write timeout to 30 seconds
+        .post_init(start_scheduler)
+        .post_shutdown(stop_scheduler)
         .build()
     )
 
@@ -305,6 +364,10 @@ def main():
     # Register handlers
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("subtitles", subtitles_command))
+    application.add_handler(CommandHandler("outputs", outputs_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("cancel", cancel))
 
     # Start the Bot
     logger.info("Starting Upshirsa Subtitle Generator Bot...")
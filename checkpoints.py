@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import shutil
+import threading
+
+from storage import atomic_write_json, cache_dir
+
+# One directory per unfinished job: its manifest, transcript and chunk checkpoints.
+# On disk rather than tmpfs, since the point is to survive a crash.
+JOBS_DIR = cache_dir("UPSHIRSA_JOBS_DIR", "jobs")
+# Unfinished jobs untouched for this long are given up and removed (0 keeps them)
+JOB_TTL_S = float(os.environ.get("UPSHIRSA_JOB_TTL_S", 7 * 24 * 3600))
+
+
+def save_json(path, data):
+    # A crash never leaves half a file
+    atomic_write_json(path, data)
+
+
+def load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _jsonable(options):
+    # Sets (e.g. outputs) are stored as sorted lists
+    return {k: sorted(v) if isinstance(v, (set, frozenset)) else v for k, v in options.items()}
+
+
+class JobManifest:
+    """Record of a job's completed stages and their artifacts, kept until the job succeeds.
+
+    Rerunning a job with the same id skips every stage whose artifacts still
+    exist; see ``main.py resume``.
+    """
+
+    def __init__(self, job_id, data, jobs_dir=None):
+        self.job_id = job_id
+        self.dir = os.path.join(jobs_dir or JOBS_DIR, job_id)
+        self.path = os.path.join(self.dir, "manifest.json")
+        self.data = data
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, job_id, jobs_dir=None):
+        path = os.path.join(jobs_dir or JOBS_DIR, job_id, "manifest.json")
+        data = load_json(path)
+        return cls(job_id, data, jobs_dir) if data else None
+
+    @classmethod
+    def open(cls, job_id, command, args, options, jobs_dir=None):
+        # Resume the job if a manifest exists, otherwise start a new one
+        manifest = cls.load(job_id, jobs_dir)
+        if manifest is not None:
+            print(f"Resuming job {job_id}, finished stages: {', '.join(manifest.data['stages']) or 'none'}")
+            return manifest
+        prune_jobs(jobs_dir)
+        manifest = cls(job_id, {
+            'job_id': job_id,
+            'command': command,
+            'args': list(args),
+            'options': _jsonable(options),
+            'status': "running",
+            'stages': {},
+            'error': None,
+            'created': time.time(),
+        }, jobs_dir)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        with self.lock:
+            self.data['updated'] = time.time()
+            save_json(self.path, self.data)
+
+    def file(self, name):
+        return os.path.join(self.dir, name)
+
+    @property
+    def chunk_dir(self):
+        return self.file("chunks")
+
+    def done(self, stage):
+        # The stage's artifacts, or None if it has to run (again)
+        artifacts = self.data['stages'].get(stage)
+        if artifacts is None:
+            return None
+        paths = [p for p in artifacts.values() if isinstance(p, str)]
+        paths += [p for v in artifacts.values() if isinstance(v, dict) for p in v.values()]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        return artifacts
+
+    def complete(self, stage, **artifacts):
+        with self.lock:
+            self.data['stages'][stage] = artifacts
+        self.save()
+
+    def save_segments(self, segments):
+        save_json(self.file("transcript.json"), segments)
+        self.complete('transcribe', transcript=self.file("transcript.json"))
+
+    def load_segments(self):
+        if self.done('transcribe') is None:
+            return None
+        return load_json(self.file("transcript.json"))
+
+    def fail(self, error):
+        with self.lock:
+            self.data['status'] = "failed"
+            self.data['error'] = str(error)
+        self.save()
+
+    def finish(self):
+        # A finished job has nothing to resume
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def prune_jobs(jobs_dir=None, max_age=None):
+    # Failed and cancelled jobs nobody resumed within JOB_TTL_S, with their checkpoints
+    jobs_dir = jobs_dir or JOBS_DIR
+    max_age = JOB_TTL_S if max_age is None else max_age
+    if not max_age or not os.path.isdir(jobs_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(jobs_dir):
+        try:
+            age = time.time() - os.path.getmtime(os.path.join(jobs_dir, name, "manifest.json"))
+        except OSError:
+            continue
+        if age > max_age:
+            shutil.rmtree(os.path.join(jobs_dir, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def list_jobs(jobs_dir=None):
+    jobs_dir = jobs_dir or JOBS_DIR
+    prune_jobs(jobs_dir)
+    if not os.path.isdir(jobs_dir):
+        return []
+    manifests = [JobManifest.load(name, jobs_dir) for name in sorted(os.listdir(jobs_dir))]
+    return sorted((m for m in manifests if m is not None), key=lambda m: m.data.get('created', 0))
+
+
+def chunk_checkpoint_path(checkpoint_dir, offset, model_size, chunk_length, overlap, vad=False, profile="accurate",
+                          backend=None):
+    # The settings and the chunk's start (in ms) are part of the name so a
+    # checkpoint is never reused for a different chunk
+    mode = "vad" if vad else "full"
+    engine = f"{backend}_" if backend and backend != "whisper" else ""
+    return os.path.join(
+        checkpoint_dir,
+        f"chunk_{engine}{model_size}_{profile}_{chunk_length}_{overlap}_{mode}_{int(round(offset * 1000)):010d}.json",
+    )
@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import socket
+import asyncio
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# host:port the worker daemon listens on; clients use the same setting to find it
+DAEMON_ADDRESS = os.environ.get("UPSHIRSA_DAEMON", "127.0.0.1:8765")
+CONNECT_TIMEOUT = 1.0
+
+# The options a client may pass: what main.py and ui.py send, including the
+# options a resumed job's manifest recorded
+JOB_OPTIONS = frozenset({
+    'model_size', 'workers', 'chunk_length', 'use_cache', 'vad', 'profile', 'backend', 'subtitle_mode', 'outputs',
+    'compact_pdf', 'burn_segments', 'preset', 'crf', 'video_bitrate', 'output_dir', 'use_tmpfs', 'job_id',
+})
+# Jobs a client may submit: their positional arguments and options
+# (download_dir only appears in manifests of older YouTube jobs)
+COMMANDS = {
+    'local': (('video_path',), JOB_OPTIONS),
+    'youtube': (('video_url', 'selected_quality'), JOB_OPTIONS | {'target_mb', 'time_budget', 'download_dir'}),
+}
+# Job ids name a directory under the jobs directory
+_JOB_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+class JobFailed(RuntimeError):
+    """A job the daemon ran failed; job_id is what ``main.py resume`` takes."""
+
+    def __init__(self, message, job_id=None):
+        super().__init__(message)
+        self.job_id = job_id
+
+
+def _address(address=None):
+    host, port = (address or DAEMON_ADDRESS).rsplit(":", 1)
+    return host, int(port)
+
+
+def check_request(request):
+    # (command, args, options) of a client's request; ValueError if it isn't one
+    # the CLI or the UI would send, before anything reaches a worker
+    if not isinstance(request, dict) or request.get('command') not in COMMANDS:
+        raise ValueError(f"unknown command, expected one of {sorted(COMMANDS)}")
+    command = request['command']
+    arg_names, allowed = COMMANDS[command]
+    args = request.get('args') or []
+    if not isinstance(args, list) or len(args) != len(arg_names) or not all(isinstance(a, str) for a in args):
+        raise ValueError(f"'{command}' takes {', '.join(arg_names)}")
+    options = request.get('options') or {}
+    if not isinstance(options, dict):
+        raise ValueError("options must be an object")
+    unknown = sorted(set(options) - allowed)
+    if unknown:
+        raise ValueError(f"unknown option(s) {', '.join(unknown)}")
+    if options.get('job_id') is not None and not _JOB_ID_PATTERN.fullmatch(str(options['job_id'])):
+        raise ValueError(f"invalid job id {options['job_id']!r}")
+    if options.get('output_dir') is not None and not os.path.isabs(str(options['output_dir'])):
+        raise ValueError("output_dir must be an absolute path")
+    return command, args, dict(options)
+
+
+def _job_function(command):
+    # Imported on demand: clients never need utils (and with it torch and whisper)
+    from utils import process_video, process_youtube_url
+    return {'local': process_video, 'youtube': process_youtube_url}[command]
+
+
+class WorkerDaemon:
+    """Owns a warm worker pool and runs the jobs clients submit over a local socket.
+
+    A client sends one JSON line describing the job and gets JSON lines back:
+    its queue position, every stage as it finishes, then the outputs or the
+    error. Closing the connection cancels the job.
+    """
+
+    def __init__(self, workers=None, address=None):
+        from scheduler import JobScheduler
+        self.host, self.port = _address(address)
+        self.scheduler = JobScheduler(workers=workers)
+        self.clients = itertools.count(1)
+
+    async def serve(self):
+        await self.scheduler.start()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Worker daemon listening on {self.host}:{self.port} with {self.scheduler.worker_count} worker(s)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.scheduler.shutdown()
+
+    async def _send(self, writer, message):
+        writer.write((json.dumps(message) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        from scheduler import JobCancelled
+        from jobs import new_job_id
+        try:
+            line = await reader.readline()
+            if not line:
+                # A client checking that the daemon is up (see available())
+                writer.close()
+                return
+            request = json.loads(line)
+            command, args, options = check_request(request)
+            fn = _job_function(command)
+            # Each connection is its own user, so the pool round-robins between clients
+            user_id = request.get('user') or f"client-{next(self.clients)}"
+        except (ValueError, ConnectionError) as e:
+            try:
+                await self._send(writer, {'event': 'error', 'error': f"Bad request: {e}"})
+            except ConnectionError:
+                pass
+            writer.close()
+            return
+
+        # The job id is fixed here, so a client can resume a failed or cancelled job
+        job_id = options.setdefault('job_id', new_job_id())
+        job = await self.scheduler.submit(user_id, fn, *args, **options)
+        logger.info(f"Job {job.job_id} ({command}) queued for {user_id}")
+        hangup = asyncio.ensure_future(reader.read())
+        try:
+            await self._send(writer, {'event': 'queued', 'position': self.scheduler.position(job), 'job_id': job_id})
+            while True:
+                event = asyncio.ensure_future(job.events.get())
+                await asyncio.wait({event, job.future, hangup}, return_when=asyncio.FIRST_COMPLETED)
+                if event.done():
+                    await self._send(writer, event.result())
+                    continue
+                event.cancel()
+                if hangup.done() and not job.future.done():
+                    raise ConnectionResetError("client disconnected")
+                break
+            while not job.events.empty():
+                await self._send(writer, job.events.get_nowait())
+            try:
+                result = job.future.result()
+                await self._send(writer, {'event': 'done', 'outputs': result.outputs})
+            except JobCancelled:
+                await self._send(writer, {'event': 'error', 'error': "Job was cancelled", 'job_id': job_id})
+            except Exception as e:
+                await self._send(writer, {'event': 'error', 'error': str(e), 'job_id': job_id})
+        except (ConnectionError, OSError):
+            # Nobody is waiting for the result any more
+            logger.info(f"Client for job {job.job_id} went away, cancelling it")
+            await self.scheduler.cancel_user(user_id)
+        finally:
+            hangup.cancel()
+            writer.close()
+
+
+def serve(workers=None, address=None):
+    asyncio.run(WorkerDaemon(workers=workers, address=address).serve())
+
+
+def available(address=None):
+    # True if a worker daemon answers at address
+    try:
+        socket.create_connection(_address(address), timeout=CONNECT_TIMEOUT).close()
+    except OSError:
+        return False
+    return True
+
+
+def submit(command, args, options=None, address=None, on_event=None):
+    # Runs a job on the daemon and returns its outputs ({kind: path}).
+    # Raises DaemonUnavailable when no daemon is listening.
+    host, port = _address(address)
+    try:
+        sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT)
+    except OSError as e:
+        raise DaemonUnavailable(f"No worker daemon at {host}:{port}: {e}")
+    sock.settimeout(None)
+    with sock, sock.makefile('rw', encoding='utf-8') as stream:
+        stream.write(json.dumps({'command': command, 'args': list(args), 'options': options or {}}) + "\n")
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            if event['event'] == 'done':
+                return event['outputs']
+            if event['event'] == 'error':
+                raise JobFailed(event['error'], event.get('job_id'))
+            if on_event is not None:
+                on_event(event)
+    raise RuntimeError("Worker daemon closed the connection before the job finished")
+
+
+def run_job(command, args, options=None, use_daemon=True, on_event=None):
+    # Prefer a running daemon (warm models, shared queue); otherwise run here.
+    # Paths are made absolute because the daemon has its own working directory.
+    options = dict(options or {})
+    if options.get('output_dir'):
+        options['output_dir'] = os.path.abspath(options['output_dir'])
+    if command == 'local':
+        args = [os.path.abspath(args[0])] + list(args[1:])
+    if use_daemon:
+        try:
+            return submit(command, args, options, on_event=on_event)
+        except DaemonUnavailable:
+            logger.debug("No worker daemon running, processing in this process")
+    return _job_function(command)(*args, **options).outputs
+
+
+def describe_event(event):
+    # One-line progress text for a streamed event
+    if event['event'] == 'queued':
+        job = f"Job {event['job_id']}: " if event.get('job_id') else ""
+        return job + (f"queued at position {event['position']}" if event['position'] > 1 else "started")
+    if event['event'] == 'stage':
+        return f"{event['stage']} {event['status']} in {event['wall_s']:.1f}s"
+    if event['event'] == 'job':
+        return f"Job {event['status']} in {event['wall_s']:.1f}s"
+    return json.dumps(event)
@@ -0,0 +1,70 @@
+import os
+import uuid
+import shutil
+import tempfile
+
+# Put intermediates on tmpfs when available unless UPSHIRSA_TMPFS=0
+USE_TMPFS = os.environ.get("UPSHIRSA_TMPFS", "1") != "0"
+TMPFS_DIR = "/dev/shm"
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+def _workspace_root(use_tmpfs):
+    if use_tmpfs and os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK):
+        return TMPFS_DIR
+    return None  # the system temp dir
+
+
+class VideoJob:
+    """One run of the pipeline: a private workspace plus uniquely named outputs.
+
+    Every intermediate file lives in the workspace, so concurrent jobs never
+    share a path, and cleanup() removes all of them at once.
+    """
+
+    def __init__(self, video_path, output_dir="output", use_tmpfs=None, job_id=None):
+        if use_tmpfs is None:
+            use_tmpfs = USE_TMPFS
+        self.job_id = job_id or new_job_id()
+        self.output_dir = output_dir
+        self.workspace = tempfile.mkdtemp(prefix=f"upshirsa_{self.job_id}_", dir=_workspace_root(use_tmpfs))
+        self.segments = None
+        # kind -> path of every artifact the job produced (see outputs.OUTPUT_KINDS)
+        self.outputs = {}
+
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        self.name = f"{stem}_{self.job_id}"
+        self.srt_path = self.path("subtitles.srt")
+        self.ass_path = self.path("subtitles.ass")
+        self.output_srt_path = self.output_path("subtitles", ".srt")
+        self.output_vtt_path = self.output_path("subtitles", ".vtt")
+        self.output_txt_path = self.output_path("transcript", ".txt")
+        self.output_json_path = self.output_path("transcript", ".json")
+        self.output_pdf_path = self.output_path("transcript", ".pdf")
+        self.use_video(video_path)
+
+    def use_video(self, video_path):
+        # The video may only arrive after the job started (e.g. a parallel download)
+        self.video_path = video_path
+        self.output_video_path = self.output_path("output", os.path.splitext(video_path)[1])
+
+    def output_path(self, prefix, ext):
+        return os.path.join(self.output_dir, f"{prefix}_{self.name}{ext}")
+
+    def path(self, filename):
+        return os.path.join(self.workspace, filename)
+
+    def cleanup(self):
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+    def __repr__(self):
+        return f"VideoJob({self.job_id!r}, {self.video_path!r})"
@@ -1,14 +1,102 @@
 import os
+import sys
 import argparse
-from utils import extract_audio, transcribe_audio, create_srt, embed_subtitles_hardcode, create_pdf, fetch_video_info, download_youtube_video, process_video
+import daemon
+from outputs import SUBTITLE_MODES, OUTPUT_KINDS
+from profiles import PROFILES, DEFAULT_PROFILE
+from backends import BACKENDS, DEFAULT_BACKEND
 
-def process_youtube_video(video_url, selected_quality, model_size="base"):
+# utils, batch and transcript_cache are imported where they are used: when a
+# worker daemon runs the job, this process never loads torch or Whisper
+
+def print_progress(event):
+    print(daemon.describe_event(event))
+
+def run_job(command, job_args, args):
+    options = dict(processing_options(args), output_dir="output")
+    if command == 'youtube':
+        options['target_mb'] = args.target_mb
+        options['time_budget'] = args.time_budget
     try:
-        video_path = download_youtube_video(video_url, selected_quality)
-        process_video(video_path, model_size=model_size)
+        outputs = daemon.run_job(command, job_args, options, use_daemon=not args.no_daemon, on_event=print_progress)
+    except daemon.JobFailed as e:
+        # Jobs run in this process print this themselves (see utils._job_failed)
+        if e.job_id:
+            print(f"Job {e.job_id} failed: {e}")
+            print(f"Resume it with: python main.py resume {e.job_id}")
+        raise
+    for kind, path in outputs.items():
+        print(f"{kind}: {path}")
+
+def resume_job(job_id, args):
+    import checkpoints
+    if job_id is None:
+        jobs = checkpoints.list_jobs()
+        if not jobs:
+            print("No unfinished jobs.")
+        for manifest in jobs:
+            data = manifest.data
+            print(f"{manifest.job_id}  {data['command']:<8} {data['status']:<8} {data['args'][0]}"
+                  + (f"  ({data['error']})" if data.get('error') else ""))
+        return
+    manifest = checkpoints.JobManifest.load(job_id)
+    if manifest is None:
+        print(f"No unfinished job {job_id} in {checkpoints.JOBS_DIR}")
+        sys.exit(1)
+    # Same job id and options as the original run, so its finished stages are reused
+    options = dict(manifest.data['options'], job_id=job_id)
+    outputs = daemon.run_job(manifest.data['command'], manifest.data['args'], options,
+                             use_daemon=not args.no_daemon, on_event=print_progress)
+    for kind, path in outputs.items():
+        print(f"{kind}: {path}")
+
+def process_youtube_video(video_url, selected_quality, args):
+    try:
+        run_job('youtube', [video_url, selected_quality], args)
     except Exception as e:
         print(f"Error processing YouTube video: {e}")
 
+def add_processing_arguments(parser):
+    parser.add_argument('--model', type=str, default="base", help="Whisper model size")
+    parser.add_argument('--workers', type=int, default=1, help="Transcription processes for long videos")
+    parser.add_argument('--chunk-length', type=int, default=300, help="Seconds of audio transcribed at a time; chunks run in parallel with --workers")
+    parser.add_argument('--no-cache', action='store_true', help="Always transcribe, ignoring the transcript cache")
+    parser.add_argument('--profile', type=str, choices=sorted(PROFILES), default=DEFAULT_PROFILE,
+                        help="'fast': greedy decoding without word timestamps (word times are interpolated); "
+                             "'accurate': full decoding with word-level timestamps")
+    parser.add_argument('--backend', type=str, choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help="Transcription engine: 'whisper' (PyTorch) or 'faster-whisper' (CTranslate2, int8 on CPU)")
+    parser.add_argument('--vad', action='store_true',
+                        help="Transcribe only the speech: skip silence and background detected by a fast energy-based pass")
+    parser.add_argument('--subtitles', type=str, choices=SUBTITLE_MODES, default="burn",
+                        help="Burn subtitles into the frames, mux them as a soft track without re-encoding, "
+                             "or 'none' for just the SRT and PDF")
+    parser.add_argument('--outputs', type=str, nargs='+', choices=OUTPUT_KINDS, default=None,
+                        help="Exactly which files to produce (overrides --subtitles); only the stages they need run, "
+                             "e.g. '--outputs srt' never touches the video encoder")
+    parser.add_argument('--no-daemon', action='store_true', help="Process in this process even if a worker daemon is running")
+    parser.add_argument('--compact-pdf', action='store_true', help="Put timestamps and text on one row (about half the pages)")
+    parser.add_argument('--burn-segments', type=int, default=1, help="Burn subtitles in N keyframe-aligned pieces in parallel")
+    parser.add_argument('--preset', type=str, default=None, help="x264 preset for burned-in output (e.g. veryfast)")
+    parser.add_argument('--crf', type=int, default=None, help="x264 CRF for burned-in output (lower is better quality)")
+
+def processing_options(args):
+    return {
+        'model_size': args.model,
+        'workers': args.workers,
+        'chunk_length': args.chunk_length,
+        'use_cache': not args.no_cache,
+        'vad': args.vad,
+        'profile': args.profile,
+        'backend': args.backend,
+        'subtitle_mode': args.subtitles,
+        'outputs': args.outputs,
+        'compact_pdf': args.compact_pdf,
+        'burn_segments': args.burn_segments,
+        'preset': args.preset,
+        'crf': args.crf,
+    }
+
 def main():
     parser = argparse.ArgumentParser(description="Video Transcriber CLI")
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -16,23 +104,81 @@ def main():
     # Subparser for processing a local video file
     parser_local = subparsers.add_parser('local', help="Process a local video file")
     parser_local.add_argument('video_path', type=str, help="Path to the local video file")
-    parser_local.add_argument('--model', type=str, default="base", help="Whisper model size")
+    add_processing_arguments(parser_local)
 
     # Subparser for processing a YouTube video
     parser_youtube = subparsers.add_parser('youtube', help="Process a YouTube video")
     parser_youtube.add_argument('video_url', type=str, help="URL of the YouTube video")
-    parser_youtube.add_argument('--quality', type=str, required=True, help="Desired video quality (e.g., 720p)")
-    parser_youtube.add_argument('--model', type=str, default="base", help="Whisper model size")
+    parser_youtube.add_argument('--quality', type=str, default="auto",
+                                help="Video quality (e.g., 720p), or 'auto' to plan it from the size and time budgets")
+    parser_youtube.add_argument('--target-mb', type=float, default=None,
+                                help="With --quality auto: largest output video in MB (default 48, 0 for no limit)")
+    parser_youtube.add_argument('--time-budget', type=float, default=None,
+                                help="With --quality auto: seconds to spend downloading and encoding (default 900, 0 for no limit)")
+    add_processing_arguments(parser_youtube)
+
+    # Subparser for processing many videos as a pipeline
+    parser_batch = subparsers.add_parser('batch', help="Process a directory, glob, URL list file or playlist")
+    parser_batch.add_argument('sources', type=str, nargs='+', help="Directories, globs, .txt files of paths/URLs, or URLs")
+    parser_batch.add_argument('--quality', type=str, default="720p", help="Video quality for YouTube items (e.g., 720p)")
+    parser_batch.add_argument('--download-workers', type=int, default=2, help="Parallel downloads")
+    parser_batch.add_argument('--decode-workers', type=int, default=2, help="Parallel audio decodes")
+    parser_batch.add_argument('--transcribe-workers', type=int, default=1, help="Parallel transcriptions")
+    parser_batch.add_argument('--output-workers', type=int, default=2, help="Parallel SRT/PDF writers")
+    parser_batch.add_argument('--encode-workers', type=int, default=1, help="Parallel video encodes")
+    parser_batch.add_argument('--report', type=str, default=None, help="Write a JSON status report to this file")
+    add_processing_arguments(parser_batch)
+
+    # Subparser for clearing the transcript cache
+    subparsers.add_parser('purge-cache', help="Delete all cached transcripts and stored downloads")
+
+    # Subparser for the long-running worker service the other commands submit to
+    parser_daemon = subparsers.add_parser('daemon', help="Keep models warm and run submitted jobs until stopped")
+    parser_daemon.add_argument('--workers', type=int, default=None, help="Worker processes (default: from CPU count and memory)")
+    parser_daemon.add_argument('--address', type=str, default=None, help=f"host:port to listen on (default {daemon.DAEMON_ADDRESS})")
+
+    # Subparser for continuing a job that failed or was interrupted
+    parser_resume = subparsers.add_parser('resume', help="Resume an unfinished job, or list them without a job id")
+    parser_resume.add_argument('job_id', type=str, nargs='?', default=None, help="Job id printed when the job failed")
+    parser_resume.add_argument('--no-daemon', action='store_true', help="Process in this process even if a worker daemon is running")
 
     args = parser.parse_args()
 
+    if args.command == 'daemon':
+        daemon.serve(workers=args.workers, address=args.address)
+        return
+
+    if args.command == 'purge-cache':
+        import transcript_cache
+        import sources
+        removed = transcript_cache.purge()
+        print(f"Removed {removed} cached transcript(s) from {transcript_cache.CACHE_DIR}")
+        removed = sources.purge()
+        print(f"Removed {removed} stored download(s) from {sources.SOURCE_DIR}")
+        return
+
+    if args.command == 'resume':
+        resume_job(args.job_id, args)
+        return
+
     os.makedirs("output", exist_ok=True)
     os.makedirs("temp_video", exist_ok=True)
 
     if args.command == 'local':
-        process_video(args.video_path, model_size=args.model)
+        run_job('local', [args.video_path], args)
     elif args.command == 'youtube':
-        process_youtube_video(args.video_url, args.quality, model_size=args.model)
+        process_youtube_video(args.video_url, args.quality, args)
+    elif args.command == 'batch':
+        from batch import run_batch, print_report
+        results = run_batch(
+            args.sources, selected_quality=args.quality,
+            download_workers=args.download_workers, decode_workers=args.decode_workers,
+            transcribe_workers=args.transcribe_workers, output_workers=args.output_workers,
+            encode_workers=args.encode_workers, **processing_options(args),
+        )
+        # Non-zero exit when any item failed, so schedulers notice partial failures
+        if print_report(results, args.report):
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
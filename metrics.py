@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# Where stage/job events go as JSON lines: "-" for stderr, a file path, or "off"
+METRICS_LOG = os.environ.get("UPSHIRSA_METRICS_LOG", "-")
+
+# Upper bounds of the stage duration histogram, in seconds
+BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_current_job = contextvars.ContextVar("upshirsa_job", default=None)
+_stage_depth = contextvars.ContextVar("upshirsa_stage_depth", default=0)
+_log_lock = threading.Lock()
+_listeners = []
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _cpu_seconds():
+    # Our own CPU plus finished child processes (ffmpeg); with several jobs in
+    # one process this is shared, so per-stage CPU is only exact when jobs run alone
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def emit(event):
+    event = dict(event, ts=round(time.time(), 3), pid=os.getpid())
+    registry.record(event)
+    for listener in _listeners:
+        listener(event)
+    if METRICS_LOG == "off":
+        return
+    line = json.dumps(event, ensure_ascii=False)
+    with _log_lock:
+        if METRICS_LOG == "-":
+            print(line, file=sys.stderr, flush=True)
+        else:
+            with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class JobMetrics:
+    def __init__(self, job_id, source=None):
+        self.job_id = job_id
+        self.source = source
+        self.stages = {}
+        self.audio_seconds = None
+        self.speech_seconds = None
+        self.started = time.perf_counter()
+        self.cpu_started = _cpu_seconds()
+
+
+def begin_job(job_id, source=None):
+    return JobMetrics(job_id, source)
+
+
+def finish_job(metrics, status):
+    event = {
+        "event": "job",
+        "job": metrics.job_id,
+        "source": metrics.source,
+        "status": status,
+        "wall_s": round(time.perf_counter() - metrics.started, 3),
+        "cpu_s": round(_cpu_seconds() - metrics.cpu_started, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "stages": {name: round(seconds, 3) for name, seconds in metrics.stages.items()},
+    }
+    if metrics.audio_seconds:
+        event["audio_s"] = round(metrics.audio_seconds, 3)
+        transcribe = metrics.stages.get("transcribe_audio")
+        if transcribe is not None:
+            # Real-time factor: seconds of transcription per second of audio
+            event["rtf"] = round(transcribe / metrics.audio_seconds, 4)
+        if metrics.speech_seconds is not None:
+            event["speech_s"] = round(metrics.speech_seconds, 3)
+            event["skipped_ratio"] = round(max(1 - metrics.speech_seconds / metrics.audio_seconds, 0.0), 4)
+    emit(event)
+
+
+@contextmanager
+def use_job(metrics):
+    # Attribute stages run in this thread to a job started elsewhere
+    token = _current_job.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_job.reset(token)
+
+
+@contextmanager
+def job(job_id, source=None):
+    metrics = begin_job(job_id, source)
+    status = "failed"
+    try:
+        with use_job(metrics):
+            yield metrics
+        status = "done"
+    finally:
+        finish_job(metrics, status)
+
+
+@contextmanager
+def stage(name):
+    # Nested stages (a stage calling another instrumented function) are only
+    # counted once, at the outermost level
+    depth = _stage_depth.get()
+    token = _stage_depth.set(depth + 1)
+    if depth:
+        try:
+            yield
+        finally:
+            _stage_depth.reset(token)
+        return
+    started = time.perf_counter()
+    cpu_started = _cpu_seconds()
+    status = "failed"
+    try:
+        yield
+        status = "done"
+    finally:
+        _stage_depth.reset(token)
+        wall = time.perf_counter() - started
+        current = _current_job.get()
+        if current is not None:
+            current.stages[name] = current.stages.get(name, 0.0) + wall
+        emit({
+            "event": "stage",
+            "job": current.job_id if current else None,
+            "stage": name,
+            "status": status,
+            "wall_s": round(wall, 3),
+            "cpu_s": round(_cpu_seconds() - cpu_started, 3),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+        })
+
+
+def timed(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def note_audio_duration(seconds):
+    current = _current_job.get()
+    if current is not None:
+        current.audio_seconds = seconds
+
+
+def note_speech_duration(seconds):
+    # Seconds of audio voice activity detection left for transcription
+    current = _current_job.get()
+    if current is not None:
+        current.speech_seconds = seconds
+
+
+def add_listener(listener):
+    # listener(event) is called for every emitted event; worker processes use
+    # it to stream their events to the parent (see record_event)
+    _listeners.append(listener)
+
+
+def record_event(event):
+    # Fold an event emitted by another process into this process's registry
+    registry.record(event)
+
+
+class Registry:
+    """In-memory aggregates of the emitted events, exported in Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_count = {}
+        self.stage_sum = {}
+        self.stage_cpu = {}
+        self.stage_buckets = {}
+        self.jobs = {}
+        self.audio_seconds = 0.0
+        self.skipped_seconds = 0.0
+        self.last_rtf = None
+        self.peak_rss_mb = 0.0
+
+    def record(self, event):
+        with self.lock:
+            self.peak_rss_mb = max(self.peak_rss_mb, event.get("peak_rss_mb", 0.0))
+            if event.get("event") == "stage":
+                key = (event["stage"], event["status"])
+                self.stage_count[key] = self.stage_count.get(key, 0) + 1
+                self.stage_sum[key] = self.stage_sum.get(key, 0.0) + event["wall_s"]
+                self.stage_cpu[key] = self.stage_cpu.get(key, 0.0) + event["cpu_s"]
+                buckets = self.stage_buckets.setdefault(key, [0] * len(BUCKETS))
+                for i, bound in enumerate(BUCKETS):
+                    if event["wall_s"] <= bound:
+                        buckets[i] += 1
+            elif event.get("event") == "job":
+                self.jobs[event["status"]] = self.jobs.get(event["status"], 0) + 1
+                self.audio_seconds += event.get("audio_s", 0.0)
+                if "speech_s" in event:
+                    self.skipped_seconds += max(event.get("audio_s", 0.0) - event["speech_s"], 0.0)
+                if "rtf" in event:
+                    self.last_rtf = event["rtf"]
+
+    def render(self):
+        with self.lock:
+            lines = [
+                "# HELP upshirsa_stage_seconds Wall time spent in each pipeline stage.",
+                "# TYPE upshirsa_stage_seconds histogram",
+            ]
+            for (name, status), count in sorted(self.stage_count.items()):
+                labels = f'stage="{name}",status="{status}"'
+                for bound, value in zip(BUCKETS, self.stage_buckets[(name, status)]):
+                    lines.append(f'upshirsa_stage_seconds_bucket{{{labels},le="{bound}"}} {value}')
+                lines.append(f'upshirsa_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"upshirsa_stage_seconds_sum{{{labels}}} {self.stage_sum[(name, status)]:.3f}")
+                lines.append(f"upshirsa_stage_seconds_count{{{labels}}} {count}")
+            lines += [
+                "# HELP upshirsa_stage_cpu_seconds_total CPU time spent in each pipeline stage.",
+                "# TYPE upshirsa_stage_cpu_seconds_total counter",
+            ]
+            for (name, status), seconds in sorted(self.stage_cpu.items()):
+                lines.append(f'upshirsa_stage_cpu_seconds_total{{stage="{name}",status="{status}"}} {seconds:.3f}')
+            lines += [
+                "# HELP upshirsa_jobs_total Finished jobs by status.",
+                "# TYPE upshirsa_jobs_total counter",
+            ]
+            for status, count in sorted(self.jobs.items()):
+                lines.append(f'upshirsa_jobs_total{{status="{status}"}} {count}')
+            lines += [
+                "# HELP upshirsa_audio_seconds_total Seconds of audio processed.",
+                "# TYPE upshirsa_audio_seconds_total counter",
+                f"upshirsa_audio_seconds_total {self.audio_seconds:.3f}",
+                "# HELP upshirsa_skipped_audio_seconds_total Seconds of audio voice activity detection kept from Whisper.",
+                "# TYPE upshirsa_skipped_audio_seconds_total counter",
+                f"upshirsa_skipped_audio_seconds_total {self.skipped_seconds:.3f}",
+                "# HELP upshirsa_peak_rss_bytes Highest peak resident memory reported by any job process.",
+                "# TYPE upshirsa_peak_rss_bytes gauge",
+                f"upshirsa_peak_rss_bytes {int(self.peak_rss_mb * 1024 * 1024)}",
+            ]
+            if self.last_rtf is not None:
+                lines += [
+                    "# HELP upshirsa_realtime_factor Transcription real-time factor of the last job.",
+                    "# TYPE upshirsa_realtime_factor gauge",
+                    f"upshirsa_realtime_factor {self.last_rtf}",
+                ]
+            return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _metrics_handler():
+    # Only processes that serve the endpoint pay for importing http.server
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the console
+            pass
+
+    return MetricsHandler
+
+
+def start_metrics_server(default_port):
+    # UPSHIRSA_METRICS_PORT overrides the port, 0 disables the endpoint
+    port = int(os.environ.get("UPSHIRSA_METRICS_PORT", default_port))
+    if not port:
+        return None
+    host = os.environ.get("UPSHIRSA_METRICS_HOST", "127.0.0.1")
+    from http.server import ThreadingHTTPServer
+    try:
+        server = ThreadingHTTPServer((host, port), _metrics_handler())
+    except OSError as e:
+        print(f"Error starting metrics endpoint on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+
+from backends import get_backend
+
+# Upper bound for the memory held by cached models, in MB (0 disables the cap)
+MAX_CACHE_MB = int(os.environ.get("UPSHIRSA_MODEL_CACHE_MB", "4096"))
+# Comma separated model sizes the servers load at startup
+PRELOAD_MODELS = [m for m in os.environ.get("UPSHIRSA_PRELOAD_MODELS", "base").split(",") if m]
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_loading_locks = {}
+
+
+class CachedModel:
+    """A loaded model plus the lock that serializes inference on it."""
+
+    def __init__(self, key, model, backend):
+        self.key = key
+        self.model = model
+        self.backend = backend
+        # whisper installs kv-cache hooks on the model while decoding, so two
+        # threads must not run transcribe() on the same instance at once
+        self.lock = threading.Lock()
+        self.size_mb = backend.memory_mb(model, key[0])
+
+    @property
+    def fp16(self):
+        return self.key[2]
+
+    def transcribe(self, audio, **options):
+        # Whisper-style segment dicts, whatever the backend
+        with self.lock:
+            return self.backend.transcribe(self.model, audio, self.fp16, options)
+
+    def transcribe_batch(self, windows, **options):
+        # One list of segments per window, each on the window's own clock
+        with self.lock:
+            return self.backend.transcribe_batch(self.model, windows, self.fp16, options)
+
+
+def _model_key(model_size, device, fp16, backend):
+    if device is None:
+        device = backend.default_device()
+    # None means half precision wherever it is supported, as whisper's own
+    # transcribe() defaults to; on CPU it falls back to fp32 either way
+    if fp16 is None:
+        fp16 = True
+    if device == "cpu":
+        fp16 = False
+    return (model_size, device, bool(fp16), backend.name)
+
+
+def _evict(keep_key):
+    if MAX_CACHE_MB <= 0:
+        return
+    total = sum(entry.size_mb for entry in _cache.values())
+    while total > MAX_CACHE_MB and len(_cache) > 1:
+        key, entry = next(iter(_cache.items()))
+        if key == keep_key:
+            _cache.move_to_end(key)
+            continue
+        del _cache[key]
+        total -= entry.size_mb
+        print(f"Evicted model {key} from cache ({entry.size_mb:.0f} MB)")
+
+
+def get_model(model_size="base", device=None, fp16=None, backend=None):
+    backend = get_backend(backend)
+    key = _model_key(model_size, device, fp16, backend)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            return entry
+        loading_lock = _loading_locks.setdefault(key, threading.Lock())
+
+    # Load outside the registry lock so other sizes stay available, but only
+    # let one thread load a given key
+    with loading_lock:
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None:
+                _cache.move_to_end(key)
+                return entry
+        # Backends import their engine here: whisper pulls in torch, which takes seconds to load
+        entry = CachedModel(key, backend.load(model_size, key[1], key[2]), backend)
+        with _cache_lock:
+            _cache[key] = entry
+            _evict(key)
+            _loading_locks.pop(key, None)
+        print(f"Loaded model {key} ({entry.size_mb:.0f} MB)")
+        return entry
+
+
+def warm_up(model_sizes=None, device=None, fp16=None, backend=None):
+    if model_sizes is None:
+        model_sizes = PRELOAD_MODELS
+    for model_size in model_sizes:
+        try:
+            get_model(model_size, device=device, fp16=fp16, backend=backend)
+        except Exception as e:
+            print(f"Error warming up model '{model_size}': {e}")
+
+
+def warm_up_in_background(model_sizes=None):
+    thread = threading.Thread(target=warm_up, args=(model_sizes,), daemon=True)
+    thread.start()
+    return thread
+
+
+def cached_models():
+    with _cache_lock:
+        return list(_cache.keys())
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,29 @@
+# 'burn' renders subtitles into the frames, 'soft' muxes them as a selectable track,
+# 'none' produces only the SRT and PDF without touching the video
+SUBTITLE_MODES = ('burn', 'soft', 'none')
+
+# Artifacts a job can produce; only the stages they need are run
+OUTPUT_KINDS = ('srt', 'vtt', 'txt', 'json', 'pdf', 'burned', 'muxed')
+VIDEO_OUTPUTS = {'burned', 'muxed'}
+
+# The outputs each subtitle mode stands for
+MODE_OUTPUTS = {
+    'burn': {'burned', 'pdf'},
+    'soft': {'muxed', 'pdf'},
+    'none': {'srt', 'pdf'},
+}
+
+
+def resolve_outputs(outputs=None, subtitle_mode="burn"):
+    # An explicit set of outputs wins over the subtitle mode shorthand
+    if outputs is None:
+        if subtitle_mode not in SUBTITLE_MODES:
+            raise ValueError(f"Unknown subtitle mode '{subtitle_mode}', expected one of {SUBTITLE_MODES}")
+        return set(MODE_OUTPUTS[subtitle_mode])
+    outputs = set(outputs)
+    unknown = outputs - set(OUTPUT_KINDS)
+    if unknown:
+        raise ValueError(f"Unknown outputs {sorted(unknown)}, expected some of {OUTPUT_KINDS}")
+    if not outputs:
+        raise ValueError("At least one output has to be requested")
+    return outputs
@@ -0,0 +1,103 @@
+import os
+import hashlib
+import tempfile
+
+import ffmpeg
+
+# Whisper works on 16 kHz mono audio
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+
+# Decoded audio goes to disk rather than the (tmpfs) job workspace: on tmpfs a
+# multi-hour recording would sit in RAM, which is what the store is there to avoid
+PCM_DIR = os.environ.get("UPSHIRSA_PCM_DIR")
+
+READ_BLOCK = 1024 * 1024
+
+
+class PCMStore:
+    """Decoded mono s16le audio in a file, read back one window at a time.
+
+    Slicing is free: it returns another store over the same file. Only load()
+    maps the window's bytes and converts them, so memory follows the window
+    size rather than the length of the recording. A store pickles as its path
+    and bounds, which lets worker processes read their own windows.
+    """
+
+    def __init__(self, path, start=0, stop=None, sample_rate=SAMPLE_RATE):
+        total = os.path.getsize(path) // BYTES_PER_SAMPLE
+        self.path = path
+        self.sample_rate = sample_rate
+        self.start = min(start, total)
+        self.stop = total if stop is None else max(self.start, min(stop, total))
+        self._fingerprint = None
+
+    @classmethod
+    def decode(cls, media_path, pcm_path=None, sample_rate=SAMPLE_RATE):
+        # ffmpeg writes the file itself, so the samples never pass through Python
+        if pcm_path is None:
+            fd, pcm_path = tempfile.mkstemp(prefix="upshirsa_", suffix=".pcm", dir=PCM_DIR)
+            os.close(fd)
+        try:
+            (
+                ffmpeg.input(media_path, threads=0)
+                .output(pcm_path, format='s16le', acodec='pcm_s16le', ac=1, ar=sample_rate)
+                .run(cmd=['ffmpeg', '-nostdin'], overwrite_output=True, capture_stdout=True, capture_stderr=True)
+            )
+        except BaseException:
+            if os.path.exists(pcm_path):
+                os.remove(pcm_path)
+            raise
+        return cls(pcm_path, sample_rate=sample_rate)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("PCMStore only supports contiguous slices")
+        start, stop, _ = key.indices(len(self))
+        return PCMStore(self.path, self.start + start, self.start + stop, self.sample_rate)
+
+    @property
+    def duration(self):
+        return len(self) / self.sample_rate
+
+    def load(self, dtype="float32"):
+        # The window as an array (float32 in [-1, 1) like decode_audio, or int16)
+        import numpy as np
+        if not len(self):
+            return np.zeros(0, dtype=dtype)
+        samples = np.memmap(self.path, dtype=np.int16, mode='r', offset=self.start * BYTES_PER_SAMPLE, shape=(len(self),))
+        try:
+            if np.dtype(dtype) == np.int16:
+                return np.array(samples)
+            audio = samples.astype(np.float32)
+            audio *= 1 / 32768.0
+            return audio
+        finally:
+            # Unmap right away so the window's pages leave our resident set
+            del samples
+
+    def fingerprint(self):
+        # sha256 of the raw samples, read in blocks (see transcript_cache.audio_fingerprint)
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            remaining = len(self) * BYTES_PER_SAMPLE
+            with open(self.path, 'rb') as f:
+                f.seek(self.start * BYTES_PER_SAMPLE)
+                while remaining > 0:
+                    block = f.read(min(READ_BLOCK, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __repr__(self):
+        return f"PCMStore({self.path!r}, {self.start}, {self.stop})"
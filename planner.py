@@ -0,0 +1,139 @@
+import os
+
+from outputs import VIDEO_OUTPUTS, resolve_outputs
+
+# Telegram bots can send files up to 50 MB; leave room for the container
+TARGET_MB = float(os.environ.get("UPSHIRSA_TARGET_MB", 48))
+# Seconds a job may spend downloading and encoding the video (0: no limit)
+TIME_BUDGET_S = float(os.environ.get("UPSHIRSA_TIME_BUDGET_S", 900))
+# Assumed download speed in Mbit/s, for the time estimate
+DOWNLOAD_MBPS = float(os.environ.get("UPSHIRSA_DOWNLOAD_MBPS", 40))
+# Multiplies the encode speeds below; raise it on machines faster than 4 cores
+ENCODE_SPEED_SCALE = float(os.environ.get("UPSHIRSA_ENCODE_SPEED", 1.0))
+
+# Speech needs far less than music; every kbps saved goes to the picture
+AUDIO_KBPS = 64
+# Share of the target size the audio and video streams may use; the rest is container overhead
+SIZE_MARGIN = 0.95
+# Below this video bitrate a height looks worse than the next one down
+MIN_VIDEO_KBPS = {1080: 2500, 720: 1200, 480: 600, 360: 350, 240: 200, 144: 100}
+# Below this nothing is worth watching, so the video outputs are dropped
+FLOOR_VIDEO_KBPS = 50
+# libx264 'medium' encode speed at each height, in seconds of video per second, on 4 cores
+ENCODE_SPEED = {1080: 1.0, 720: 2.2, 480: 5.0, 360: 8.0, 240: 14.0, 144: 25.0}
+# Presets from best compression to fastest, with their speed relative to 'medium'
+PRESETS = (('medium', 1.0), ('faster', 1.8), ('veryfast', 2.8), ('superfast', 4.5), ('ultrafast', 7.0))
+
+
+class Plan:
+    """The download resolution and encode settings chosen for one job."""
+
+    def __init__(self, quality, preset=None, video_kbps=None, size_mb=None, seconds=None, fits=True, reason=""):
+        self.quality = quality
+        self.preset = preset
+        self.video_kbps = video_kbps
+        self.size_mb = size_mb
+        self.seconds = seconds
+        self.fits = fits
+        self.reason = reason
+
+    def describe(self):
+        parts = [f"Selected quality: {self.quality}"]
+        if self.video_kbps is not None:
+            parts.append(f"{self.video_kbps} kbps, preset {self.preset}")
+        if self.size_mb is not None:
+            parts.append(f"about {self.size_mb:.0f} MB")
+        if self.seconds is not None:
+            parts.append(f"about {self.seconds:.0f}s to download and encode")
+        text = ", ".join(parts)
+        return f"{text} ({self.reason})" if self.reason else text
+
+    def apply(self, options):
+        # The job options with the planned encode settings; settings given
+        # explicitly win. Video outputs that can't fit are dropped.
+        options = dict(options)
+        for key, value in (('video_bitrate', self.video_kbps), ('preset', self.preset)):
+            if value is not None and options.get(key) is None:
+                options[key] = value
+        if not self.fits:
+            outputs = resolve_outputs(options.get('outputs'), options.get('subtitle_mode', 'burn'))
+            kept = outputs - VIDEO_OUTPUTS
+            if not kept:
+                raise ValueError(self.reason)
+            options['outputs'] = sorted(kept)
+        return options
+
+    def __repr__(self):
+        return f"Plan({self.quality!r}, preset={self.preset!r}, video_kbps={self.video_kbps}, fits={self.fits})"
+
+
+def _size_mb(video_kbps, duration):
+    return (video_kbps + AUDIO_KBPS) * 1000 * duration / 8 / (1024 * 1024)
+
+
+def _download_seconds(size_bytes):
+    if not size_bytes or not DOWNLOAD_MBPS:
+        return 0.0
+    return size_bytes * 8 / (DOWNLOAD_MBPS * 1000 * 1000)
+
+
+def _encode_seconds(duration, height, speed):
+    base = ENCODE_SPEED.get(height) or min(ENCODE_SPEED.values())
+    return duration / (base * speed * ENCODE_SPEED_SCALE)
+
+
+def plan_quality(duration, sizes, target_mb=None, time_budget=None, burn=True, soft=False):
+    # sizes maps the available qualities ('720p') to their estimated download
+    # size in bytes (None when unknown). Picks the highest quality, and the
+    # best-compressing preset, whose output fits target_mb and whose download
+    # and encode fit time_budget. Burned output is encoded at a capped bitrate
+    # so it fits the first time; a soft-subtitle output is the download itself.
+    target_mb = TARGET_MB if target_mb is None else target_mb
+    time_budget = TIME_BUDGET_S if time_budget is None else time_budget
+    heights = sorted((int(q.rstrip('p')) for q in sizes), reverse=True)
+    if not heights:
+        raise ValueError("No video qualities available")
+    duration = duration or 0
+    video_kbps = None
+    if burn and target_mb and duration:
+        video_kbps = int(target_mb * 1024 * 1024 * 8 / 1000 * SIZE_MARGIN / duration) - AUDIO_KBPS
+
+    for height in heights:
+        quality = f"{height}p"
+        source = sizes.get(quality)
+        source_mb = source / (1024 * 1024) if source else None
+        download_s = _download_seconds(source)
+        if soft and target_mb and source_mb and source_mb > target_mb:
+            continue
+        if not burn:
+            if time_budget and download_s > time_budget:
+                continue
+            return Plan(quality, size_mb=source_mb, seconds=download_s)
+        # The lowest quality is still better than no video down to the floor
+        min_kbps = MIN_VIDEO_KBPS.get(height, FLOOR_VIDEO_KBPS) if height != heights[-1] else FLOOR_VIDEO_KBPS
+        if video_kbps is not None and video_kbps < min_kbps:
+            continue
+        for preset, speed in PRESETS:
+            seconds = download_s + _encode_seconds(duration, height, speed)
+            if not time_budget or seconds <= time_budget:
+                size_mb = _size_mb(video_kbps, duration) if video_kbps is not None else None
+                return Plan(quality, preset, video_kbps, size_mb, seconds)
+
+    # Nothing meets both budgets: the cheapest plan, flagged if its output can't be delivered
+    height = heights[-1]
+    quality = f"{height}p"
+    source = sizes.get(quality)
+    source_mb = source / (1024 * 1024) if source else None
+    preset, speed = PRESETS[-1]
+    seconds = _download_seconds(source) + (_encode_seconds(duration, height, speed) if burn else 0.0)
+    reason = "over the time budget" if time_budget and seconds > time_budget else ""
+    if burn and video_kbps is not None and video_kbps < FLOOR_VIDEO_KBPS:
+        return Plan(quality, fits=False, seconds=seconds,
+                    reason=f"too long to fit a watchable video in {target_mb:g} MB")
+    if soft and target_mb and source_mb and source_mb > target_mb:
+        return Plan(quality, fits=False, size_mb=source_mb, seconds=seconds,
+                    reason=f"even {quality} is over {target_mb:g} MB")
+    if not burn:
+        return Plan(quality, size_mb=source_mb, seconds=seconds, reason=reason)
+    size_mb = _size_mb(video_kbps, duration) if video_kbps is not None else None
+    return Plan(quality, preset, video_kbps, size_mb, seconds, reason=reason)
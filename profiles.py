@@ -0,0 +1,16 @@
+# Named speed/accuracy trade-offs for Whisper decoding, passed straight to
+# model.transcribe(). 'accurate' is Whisper's default decoding with word-level
+# alignment; 'fast' decodes greedily at temperature 0 only (no fallback retries)
+# and skips the cross-attention alignment pass, so subtitle word times are
+# interpolated from the segment text instead (see subtitles.interpolate_words).
+PROFILES = {
+    'accurate': {'word_timestamps': True},
+    'fast': {'word_timestamps': False, 'temperature': 0.0, 'beam_size': None, 'best_of': None},
+}
+DEFAULT_PROFILE = 'accurate'
+
+
+def decode_options(profile=DEFAULT_PROFILE):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown decoding profile '{profile}', expected one of {sorted(PROFILES)}")
+    return dict(PROFILES[profile])
@@ -0,0 +1,298 @@
+import os
+import signal
+import asyncio
+import itertools
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rough resident memory of one job (Whisper model + decoded audio + ffmpeg), in MB
+JOB_MEMORY_MB = int(os.environ.get("UPSHIRSA_JOB_MEMORY_MB", "2048"))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _total_memory_mb():
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_worker_count():
+    configured = os.environ.get("UPSHIRSA_WORKERS")
+    if configured:
+        return max(1, int(configured))
+    # Whisper is multi-threaded already, so give each job at least two cores
+    by_cpu = max(1, (os.cpu_count() or 1) // 2)
+    memory = _total_memory_mb()
+    by_memory = max(1, int(memory // JOB_MEMORY_MB)) if memory else by_cpu
+    return min(by_cpu, by_memory)
+
+
+def _worker_main(conn, threads, preload):
+    # A process group of its own, so cancelling a job also stops the ffmpeg
+    # and transcription processes it started (see WorkerProcess.kill)
+    if hasattr(os, "setsid"):
+        os.setsid()
+    # Split the cores between workers instead of every torch pool using all of them
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    # Jobs may emit events from several threads, and a pipe is not thread-safe
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    # Stage events go to the parent as they happen, for its metrics and progress reports
+    metrics.add_listener(lambda event: send(("event", event)))
+    if preload:
+        from models import warm_up
+        warm_up()
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        fn, args, kwargs = message
+        try:
+            send(("ok", fn(*args, **kwargs)))
+        except Exception as e:
+            send(("error", f"{e}"))
+
+
+class WorkerProcess:
+    """A long-lived child process that runs jobs and keeps its models warm.
+
+    Jobs run out of process so that cancelling one can actually stop it: the
+    child and everything it started are terminated, and a fresh one is
+    started for the next job.
+    """
+
+    def __init__(self, threads=1, preload=True):
+        self.threads = threads
+        self.preload = preload
+        self.process = None
+        self.conn = None
+        self.killed = False
+        # The job running now, so a cancel that arrives late can't kill the next one
+        self.job_id = None
+        # Guards process start/stop so a kill can't race the next job's start
+        self.lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.process is not None and self.process.is_alive():
+                return
+            self._spawn()
+
+    def _spawn(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, self.threads, self.preload), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def start(self):
+        self._ensure_started()
+
+    def run(self, fn, args, kwargs, on_event=None, job_id=None):
+        # Blocking; called from a thread so the event loop keeps serving chats
+        self._ensure_started()
+        with self.lock:
+            self.killed = False
+            self.job_id = job_id
+        try:
+            self.conn.send((fn, args, kwargs))
+            while True:
+                status, payload = self.conn.recv()
+                if status != "event":
+                    break
+                metrics.record_event(payload)
+                if on_event is not None:
+                    on_event(payload)
+        except (EOFError, OSError):
+            if self.killed:
+                raise JobCancelled("Job was cancelled")
+            # Start a fresh process for the next job
+            self.kill()
+            raise RuntimeError("Worker process exited unexpectedly")
+        finally:
+            with self.lock:
+                self.job_id = None
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def kill(self, job_id=None):
+        # With a job_id, only while that job is still running here; True if killed
+        with self.lock:
+            if job_id is not None and self.job_id != job_id:
+                return False
+            self.killed = True
+            self._terminate()
+            return True
+
+    def _terminate(self):
+        if self.process is not None and self.process.is_alive():
+            try:
+                # The whole group: ffmpeg and pool processes die with the worker
+                os.killpg(self.process.pid, signal.SIGTERM)
+            except (AttributeError, OSError):
+                self.process.terminate()
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                try:
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                except (AttributeError, OSError):
+                    self.process.kill()
+                self.process.join(timeout=5)
+        self.process = None
+
+    def stop(self):
+        with self.lock:
+            if self.process is not None and self.process.is_alive():
+                try:
+                    self.conn.send(None)
+                except OSError:
+                    pass
+                self.process.join(timeout=5)
+            self._terminate()
+
+
+class Job:
+    def __init__(self, job_id, user_id, fn, args, kwargs):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.state = "queued"
+        self.worker = None
+        self.future = asyncio.get_running_loop().create_future()
+        # Metrics events (stage timings) streamed from the worker while the job runs
+        self.events = asyncio.Queue()
+
+    async def result(self):
+        return await self.future
+
+
+class JobScheduler:
+    """Fixed pool of worker processes fed round-robin from per-user queues."""
+
+    def __init__(self, workers=None, per_user_limit=1, preload=True):
+        self.worker_count = workers or default_worker_count()
+        self.per_user_limit = per_user_limit
+        threads = max(1, (os.cpu_count() or 1) // self.worker_count)
+        self.workers = [WorkerProcess(threads=threads, preload=preload) for _ in range(self.worker_count)]
+        self.queues = OrderedDict()
+        self.running = {}
+        self.ids = itertools.count(1)
+        self.condition = None
+        self.tasks = []
+
+    async def start(self):
+        self.condition = asyncio.Condition()
+        for worker in self.workers:
+            await asyncio.to_thread(worker.start)
+            self.tasks.append(asyncio.create_task(self._worker_loop(worker)))
+        logger.info(f"Job scheduler started with {self.worker_count} worker(s)")
+
+    async def shutdown(self):
+        for task in self.tasks:
+            task.cancel()
+        for worker in self.workers:
+            await asyncio.to_thread(worker.stop)
+
+    async def submit(self, user_id, fn, *args, **kwargs):
+        job = Job(next(self.ids), user_id, fn, args, kwargs)
+        async with self.condition:
+            self.queues.setdefault(user_id, deque()).append(job)
+            self.condition.notify_all()
+        return job
+
+    def position(self, job):
+        # 1-based place among queued jobs in submission order
+        if job.state != "queued":
+            return 0
+        queued = [j for q in self.queues.values() for j in q]
+        return sum(1 for j in queued if j.job_id < job.job_id) + 1
+
+    def _running_count(self, user_id):
+        return sum(1 for job in self.running.values() if job.user_id == user_id)
+
+    def _next_job(self):
+        # Round-robin over users: take from the first eligible user and move
+        # them to the back so one user's burst can't starve everybody else
+        for user_id in list(self.queues):
+            queue = self.queues[user_id]
+            if not queue:
+                del self.queues[user_id]
+                continue
+            if self._running_count(user_id) >= self.per_user_limit:
+                continue
+            job = queue.popleft()
+            self.queues.move_to_end(user_id)
+            if not queue:
+                del self.queues[user_id]
+            return job
+        return None
+
+    async def _worker_loop(self, worker):
+        while True:
+            async with self.condition:
+                job = self._next_job()
+                while job is None:
+                    await self.condition.wait()
+                    job = self._next_job()
+                job.state = "running"
+                job.worker = worker
+                self.running[job.job_id] = job
+            loop = asyncio.get_running_loop()
+            try:
+                result = await asyncio.to_thread(
+                    worker.run, job.fn, job.args, job.kwargs,
+                    lambda event: loop.call_soon_threadsafe(job.events.put_nowait, event), job.job_id,
+                )
+                job.state = "done"
+                if not job.future.done():
+                    job.future.set_result(result)
+            except JobCancelled as e:
+                job.state = "cancelled"
+                if not job.future.done():
+                    job.future.set_exception(e)
+            except Exception as e:
+                job.state = "failed"
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                job.worker = None
+                async with self.condition:
+                    self.running.pop(job.job_id, None)
+                    self.condition.notify_all()
+
+    async def cancel_user(self, user_id):
+        cancelled = 0
+        async with self.condition:
+            for job in self.queues.pop(user_id, deque()):
+                job.state = "cancelled"
+                job.future.set_exception(JobCancelled("Job was cancelled"))
+                cancelled += 1
+            running = [(job, job.worker) for job in self.running.values() if job.user_id == user_id]
+        for job, worker in running:
+            # The job may have finished, and its worker moved on to someone
+            # else's, since the lock was released; kill() checks under its own
+            if worker is not None and await asyncio.to_thread(worker.kill, job.job_id):
+                cancelled += 1
+        return cancelled
@@ -0,0 +1,300 @@
+import os
+import re
+import copy
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import storage
+from storage import cache_dir
+
+# YouTube metadata and downloads shared by every job on the machine. A job
+# used to run yt-dlp's extraction up to three times (planning the quality,
+# then once per download) and delete its downloads when it finished. Now the
+# metadata is extracted once per video and kept for METADATA_TTL_S, downloads
+# are made from it, and the files stay in a size-capped LRU store so repeat
+# requests for the same video never touch the network. Identical requests in
+# flight at the same time, from threads or processes, wait for the one doing
+# the work instead of repeating it. A job holds a lease on the downloads it
+# uses until it finishes, and eviction passes over leased entries.
+
+METADATA_DIR = cache_dir("UPSHIRSA_METADATA_DIR", "metadata")
+# The stream URLs inside the metadata expire after about six hours
+METADATA_TTL_S = float(os.environ.get("UPSHIRSA_METADATA_TTL_S", "1800"))
+SOURCE_DIR = cache_dir("UPSHIRSA_SOURCE_DIR", "sources")
+# Total size of stored downloads before the least recently used are evicted, in MB
+MAX_SOURCE_MB = float(os.environ.get("UPSHIRSA_SOURCE_CACHE_MB", "4096"))
+
+_YOUTUBE_ID_PATTERN = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/)|youtu\.be/)([A-Za-z0-9_-]{11})'
+)
+
+_memory = {}
+_memory_lock = threading.Lock()
+_flight_locks = {}
+_flight_locks_lock = threading.Lock()
+
+
+def youtube_video_id(video_url):
+    match = _YOUTUBE_ID_PATTERN.search(video_url)
+    return match.group(1) if match else None
+
+
+def source_key(video_url):
+    # Every URL form of a video (watch, youtu.be, shorts, extra parameters) maps to its id
+    video_id = youtube_video_id(video_url)
+    if video_id:
+        return video_id
+    return "url-" + hashlib.sha256(video_url.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def _lock_file(name):
+    os.makedirs(os.path.join(SOURCE_DIR, ".locks"), exist_ok=True)
+    return open(os.path.join(SOURCE_DIR, ".locks", name), "a")
+
+
+def _flock(f, operation, blocking=True):
+    # False if a non-blocking lock is held elsewhere. Without fcntl (Windows)
+    # every lock succeeds, which only costs the coalescing and the leases.
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    try:
+        fcntl.flock(f, getattr(fcntl, operation) | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+@contextmanager
+def single_flight(name):
+    # Only one holder per name at a time: threads queue on a lock, processes
+    # on an exclusive lock file. Whoever gets it next finds the finished work.
+    with _flight_locks_lock:
+        lock = _flight_locks.setdefault(name, threading.Lock())
+    with lock:
+        with _lock_file(f"{name}.lock") as f:
+            _flock(f, "LOCK_EX")
+            yield
+
+
+class Leases:
+    """The stored downloads a job is using, kept from eviction until release().
+
+    Each lease is a shared lock on the entry's lease file; evict() removes an
+    entry only while it can take that lock exclusively, so leases work across
+    threads and processes and vanish with a process that crashes.
+    """
+
+    def __init__(self):
+        self.files = []
+
+    def hold(self, key, variant):
+        f = _lock_file(f"{key}.{variant}.lease")
+        _flock(f, "LOCK_SH")
+        self.files.append(f)
+
+    def release(self):
+        for f in self.files:
+            f.close()
+        self.files = []
+
+
+def yt_dlp_extract(video_url):
+    import yt_dlp
+    ydl_opts = {
+        'format': 'bestvideo+bestaudio/best',
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info_dict = ydl.extract_info(video_url, download=False)
+        # The same cleaning yt-dlp applies to --write-info-json files, so the
+        # info can be stored as JSON and fed back to it for a download
+        return ydl.sanitize_info(info_dict, remove_private_keys=True)
+
+
+def yt_dlp_download(info_dict, format_spec, outtmpl, possible_exts):
+    import yt_dlp
+    ydl_opts = {
+        'format': format_spec,
+        'outtmpl': outtmpl,
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Picks the formats from the cached metadata, as --load-info-json does
+        result = ydl.process_ie_result(copy.deepcopy(info_dict), download=True)
+        video_path = ydl.prepare_filename(result)
+    # Handle cases where the downloaded filename might have different extensions
+    if not os.path.exists(video_path):
+        base_path = os.path.splitext(video_path)[0]
+        for ext in possible_exts:
+            trial_path = f"{base_path}.{ext}"
+            if os.path.exists(trial_path):
+                video_path = trial_path
+                break
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Downloaded video file not found: {video_path}")
+    return video_path
+
+
+def _metadata_path(key):
+    return os.path.join(METADATA_DIR, f"{key}.json")
+
+
+def _fresh(fetched_at):
+    return time.time() - fetched_at < METADATA_TTL_S
+
+
+def _load_metadata(key):
+    with _memory_lock:
+        cached = _memory.get(key)
+    if cached and _fresh(cached[0]):
+        return cached[1]
+    path = _metadata_path(key)
+    try:
+        if not _fresh(os.path.getmtime(path)):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            info_dict = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable metadata cache entry {path}: {e}")
+        return None
+    with _memory_lock:
+        _memory[key] = (os.path.getmtime(path), info_dict)
+    return info_dict
+
+
+def _store_metadata(key, info_dict):
+    with _memory_lock:
+        _memory[key] = (time.time(), info_dict)
+    try:
+        # Renamed into place, so other processes see either nothing or the whole file
+        storage.atomic_write_json(_metadata_path(key), info_dict)
+    except (OSError, TypeError, ValueError) as e:
+        # Other processes just extract again
+        print(f"Error writing metadata cache: {e}")
+
+
+def forget_metadata(video_url):
+    key = source_key(video_url)
+    with _memory_lock:
+        _memory.pop(key, None)
+    try:
+        os.remove(_metadata_path(key))
+    except FileNotFoundError:
+        pass
+
+
+def get_info(video_url, extractor=None):
+    # yt-dlp's info dict for a video, extracted at most once per METADATA_TTL_S
+    key = source_key(video_url)
+    info_dict = _load_metadata(key)
+    if info_dict is not None:
+        return info_dict
+    with single_flight(f"info-{key}"):
+        # Somebody else may have extracted it while we waited
+        info_dict = _load_metadata(key)
+        if info_dict is None:
+            info_dict = (extractor or yt_dlp_extract)(video_url)
+            _store_metadata(key, info_dict)
+        return info_dict
+
+
+def _stored(key, variant, possible_exts):
+    prefix = f"{key}.{variant}."
+    try:
+        names = os.listdir(SOURCE_DIR)
+    except FileNotFoundError:
+        return None
+    for name in names:
+        # Only finished downloads are moved here, see _download
+        if name.startswith(prefix) and name[len(prefix):] in possible_exts:
+            return os.path.join(SOURCE_DIR, name)
+    return None
+
+
+def is_stored(path):
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(SOURCE_DIR)
+
+
+def fetch_source(video_url, variant, format_spec, possible_exts, extractor=None, downloader=None, leases=None):
+    # Path of the video_url download for variant ('720p', 'audio'), from the
+    # store when it is there; otherwise downloaded into it once. With leases,
+    # the entry is leased before it is looked up, so it can't be evicted
+    # between being found and being used.
+    key = source_key(video_url)
+    if leases is not None:
+        leases.hold(key, variant)
+    path = _stored(key, variant, possible_exts)
+    if path is None:
+        with single_flight(f"source-{key}.{variant}"):
+            path = _stored(key, variant, possible_exts)
+            if path is None:
+                path = _download(video_url, key, variant, format_spec, possible_exts, extractor, downloader)
+                evict(keep=path)
+                return path
+    try:
+        # Touch the entry so eviction treats it as recently used
+        os.utime(path)
+    except FileNotFoundError:
+        # Evicted in the meantime
+        return fetch_source(video_url, variant, format_spec, possible_exts, extractor, downloader, leases)
+    return path
+
+
+def _download(video_url, key, variant, format_spec, possible_exts, extractor, downloader):
+    # yt-dlp's partial and per-stream files stay in a private directory until
+    # the download is complete, so they are never found or evicted half-written
+    os.makedirs(os.path.join(SOURCE_DIR, ".partial"), exist_ok=True)
+    partial_dir = tempfile.mkdtemp(dir=os.path.join(SOURCE_DIR, ".partial"))
+    outtmpl = os.path.join(partial_dir, f"{key}.{variant}.%(ext)s")
+    downloader = downloader or yt_dlp_download
+    try:
+        try:
+            downloaded = downloader(get_info(video_url, extractor), format_spec, outtmpl, possible_exts)
+        except Exception as e:
+            # Stream URLs can expire or be revoked before the TTL; try once more with fresh metadata
+            print(f"Download from cached metadata failed ({e}), extracting again")
+            forget_metadata(video_url)
+            downloaded = downloader(get_info(video_url, extractor), format_spec, outtmpl, possible_exts)
+        path = os.path.join(SOURCE_DIR, os.path.basename(downloaded))
+        os.replace(downloaded, path)
+        return path
+    finally:
+        shutil.rmtree(partial_dir, ignore_errors=True)
+
+
+def _entries():
+    return storage.lru_entries(SOURCE_DIR)
+
+
+def _remove_unleased(path, keep=None):
+    # Removes an entry unless a job holds a lease on it (or it is keep)
+    if keep and os.path.abspath(path) == os.path.abspath(keep):
+        return False
+    name = os.path.basename(path).rsplit(".", 1)[0]
+    with _lock_file(f"{name}.lease") as f:
+        if not _flock(f, "LOCK_EX", blocking=False):
+            return False
+        return storage.remove_entry(path)
+
+
+def evict(max_mb=None, keep=None):
+    # Oldest first, never the download that was just made or one in use
+    storage.evict(_entries(), MAX_SOURCE_MB if max_mb is None else max_mb,
+                  remove=lambda path: _remove_unleased(path, keep))
+
+
+def purge():
+    return storage.purge(_entries(), remove=_remove_unleased)
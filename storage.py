@@ -0,0 +1,82 @@
+import os
+import json
+import tempfile
+
+# Everything kept between runs (job checkpoints, transcript cache, downloads)
+# lives under one base directory. It is absolute, so the daemon, the bot and
+# the CLI find the same jobs and caches whatever directory they were started in.
+CACHE_ROOT = os.path.abspath(os.environ.get(
+    "UPSHIRSA_CACHE_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"),
+))
+
+
+def cache_dir(env_var, name):
+    # The directory for one kind of data: env_var when set, otherwise CACHE_ROOT/name
+    return os.path.abspath(os.environ.get(env_var) or os.path.join(CACHE_ROOT, name))
+
+
+def atomic_write_json(path, data):
+    # Write to a temporary file and rename it into place, so a crash never
+    # leaves half a file and a concurrent reader sees the old or the new one
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def lru_entries(directory, suffix=None, recursive=False):
+    # (mtime, size, path) of every file in directory, or under it when recursive.
+    # Readers touch the files they use, so the mtime is the time of last use.
+    if recursive:
+        listing = [(root, files) for root, _, files in os.walk(directory)]
+    else:
+        try:
+            listing = [(directory, os.listdir(directory))]
+        except FileNotFoundError:
+            listing = []
+    entries = []
+    for root, names in listing:
+        for name in names:
+            if suffix and not name.endswith(suffix):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.isfile(path):
+                entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def remove_entry(path):
+    # True once the entry is gone; a missing one was evicted by another job first
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def evict(entries, max_mb, remove=remove_entry):
+    # Removes the least recently used entries until the rest fit in max_mb.
+    # remove(path) returns False for an entry that has to stay.
+    entries = sorted(entries)
+    total = sum(size for _, size, _ in entries)
+    limit = max_mb * 1024 * 1024
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        if remove(path):
+            total -= size
+
+
+def purge(entries, remove=remove_entry):
+    return sum(1 for _, _, path in entries if remove(path))
@@ -0,0 +1,174 @@
+import os
+import re
+
+# Formats we can write, by file extension
+SUBTITLE_FORMATS = {'.srt': 'srt', '.vtt': 'vtt', '.ass': 'ass'}
+
+# The burn-in style as a native ASS style, so libass needs no force_style override.
+# PlayResY=288 is what libass assumes for SRT input, so sizes match the old SRT burn.
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 384
+PlayResY: 288
+WrapStyle: 0
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,16,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,1,1,2,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+_ASS_DIALOGUE = re.compile(r"^Dialogue:\s*([^,]*),([^,]*),([^,]*),(.*)$")
+
+
+def subtitle_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SUBTITLE_FORMATS:
+        raise ValueError(f"Unsupported subtitle format '{ext}', expected one of {sorted(SUBTITLE_FORMATS)}")
+    return SUBTITLE_FORMATS[ext]
+
+
+def interpolate_words(segment):
+    # Word times for a segment transcribed without word timestamps: the
+    # segment's duration is shared out by character count (spaces included),
+    # which tracks speaking time far better than equal shares
+    words = segment['text'].split()
+    total = sum(len(word) for word in words) + len(words) - 1
+    if total <= 0:
+        return []
+    start = segment['start']
+    per_char = (segment['end'] - start) / total
+    timed = []
+    for word in words:
+        end = start + len(word) * per_char
+        timed.append({'word': word, 'start': start, 'end': end})
+        start = end + per_char
+    return timed
+
+
+def iter_cues(segments, max_chars=42, max_duration=3):
+    # Yields (start, end, text) in seconds. A cue is closed before the word that
+    # would push it past max_chars characters or max_duration seconds; cues never
+    # span segments. Only the words of the current cue are held in memory.
+    for segment in segments:
+        words = segment.get('words') or interpolate_words(segment)
+        parts = []
+        length = 0
+        start = end = None
+        for word_info in words:
+            word = word_info['word'].strip()
+            if not word:
+                continue
+            if start is None:
+                start = word_info['start']
+            if parts and (length + len(word) + 1 > max_chars or word_info['end'] - start > max_duration):
+                yield start, end, " ".join(parts)
+                parts = []
+                length = 0
+                start = word_info['start']
+            parts.append(word)
+            length += len(word) + 1
+            end = word_info['end']
+        if parts:
+            yield start, end, " ".join(parts)
+
+
+def _clock(seconds, separator, digits=3):
+    millis = int(round(max(seconds, 0.0) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    if digits == 2:
+        return f"{hours}:{minutes:02d}:{secs:02d}{separator}{millis // 10:02d}"
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def _parse_ass_clock(value):
+    hours, minutes, seconds = value.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+class SubtitleWriter:
+    """Writes cues to an SRT, WebVTT or ASS file as they are produced.
+
+    Segments can be fed one at a time with write_segments() while a
+    transcription is still running; nothing but the current cue is buffered.
+    """
+
+    def __init__(self, path, fmt=None, max_chars=42, max_duration=3):
+        self.path = path
+        self.format = fmt or subtitle_format(path)
+        self.max_chars = max_chars
+        self.max_duration = max_duration
+        self.count = 0
+        self.file = open(path, 'w', encoding='utf-8')
+        if self.format == 'vtt':
+            self.file.write("WEBVTT\n\n")
+        elif self.format == 'ass':
+            self.file.write(ASS_HEADER)
+
+    def write_cue(self, start, end, text):
+        self.count += 1
+        if self.format == 'srt':
+            self.file.write(f"{self.count}\n{_clock(start, ',')} --> {_clock(end, ',')}\n{text}\n\n")
+        elif self.format == 'vtt':
+            text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            self.file.write(f"{_clock(start, '.')} --> {_clock(end, '.')}\n{text}\n\n")
+        else:
+            # Braces start override blocks in ASS
+            text = text.replace('{', '(').replace('}', ')').replace('\n', '\\N')
+            self.file.write(f"Dialogue: 0,{_clock(start, '.', 2)},{_clock(end, '.', 2)},Default,,0,0,0,,{text}\n")
+
+    def write_segments(self, segments):
+        for start, end, text in iter_cues(segments, self.max_chars, self.max_duration):
+            self.write_cue(start, end, text)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_subtitles(segments, paths, max_chars=42, max_duration=3):
+    # Single pass over the segments (which may be a generator) into one file
+    # per path; the format follows each path's extension
+    if isinstance(paths, str):
+        paths = [paths]
+    writers = []
+    try:
+        for path in paths:
+            writers.append(SubtitleWriter(path, max_chars=max_chars, max_duration=max_duration))
+        for cue in iter_cues(segments, max_chars, max_duration):
+            for writer in writers:
+                writer.write_cue(*cue)
+    finally:
+        for writer in writers:
+            writer.close()
+    return writers[0].count if writers else 0
+
+
+def shift_ass(ass_path, output_path, start, end):
+    # ASS counterpart of utils.shift_srt: keep the events overlapping [start, end)
+    # on the segment's own clock, with the header (and so the style) unchanged
+    kept = 0
+    with open(ass_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as dst:
+        for line in src:
+            match = _ASS_DIALOGUE.match(line)
+            if not match:
+                dst.write(line)
+                continue
+            layer, cue_start, cue_end, rest = match.groups()
+            cue_start, cue_end = _parse_ass_clock(cue_start), _parse_ass_clock(cue_end)
+            if cue_end <= start or cue_start >= end:
+                continue
+            cue_start = max(cue_start - start, 0.0)
+            cue_end = min(cue_end, end) - start
+            dst.write(f"Dialogue: {layer},{_clock(cue_start, '.', 2)},{_clock(cue_end, '.', 2)},{rest}\n")
+            kept += 1
+    return kept > 0
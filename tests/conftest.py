@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import checkpoints
+import sources
+import transcript_cache
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: takes tens of seconds (skip with -m 'not slow')")
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    # Nothing a test stores may land in (or be read from) the real cache/
+    monkeypatch.setattr(checkpoints, "JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(transcript_cache, "CACHE_DIR", str(tmp_path / "transcripts"))
+    monkeypatch.setattr(sources, "SOURCE_DIR", str(tmp_path / "sources"))
+    monkeypatch.setattr(sources, "METADATA_DIR", str(tmp_path / "metadata"))
+    monkeypatch.setattr(sources, "_memory", {})
+    return tmp_path
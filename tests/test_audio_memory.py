@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+# Peak RSS the windowed feed may add over the imports while a 3-hour input is
+# decoded, fingerprinted and transcribed window by window. The whole waveform
+# as float32 would be about 690 MB.
+MAX_GROWTH_MB = float(os.environ.get("UPSHIRSA_AUDIO_RSS_MB", 150))
+HOURS = 3
+
+# Runs in a fresh process, so ru_maxrss covers nothing but this. The fake
+# backend loads every window it is given, as Whisper does, and returns one
+# segment per window.
+CHILD = r'''
+import json, resource, sys
+import numpy
+import backends, utils
+
+class FakeBackend:
+    name = "fake"
+    batches = False
+
+    def default_device(self):
+        return "cpu"
+
+    def load(self, model_size, device, fp16):
+        return None
+
+    def memory_mb(self, model, model_size):
+        return 0
+
+    def transcribe(self, model, audio, fp16, options):
+        assert audio.dtype == numpy.float32
+        return [{'id': 0, 'start': 0.0, 'end': len(audio) / utils.SAMPLE_RATE, 'text': " window"}]
+
+backends.BACKENDS["fake"] = FakeBackend()
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+segments = utils.transcribe_video(sys.argv[1], backend="fake", chunk_length=300, use_cache=False)
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'segments': len(segments), 'growth_mb': (peak - baseline) / 1024}))
+'''
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or sys.platform != "linux", reason="needs ffmpeg and Linux RSS")
+def test_three_hour_input_stays_under_the_rss_ceiling(tmp_path):
+    path = str(tmp_path / "long.flac")
+    # A steady tone: small to store, yet every decoded sample is non-zero
+    subprocess.run(['ffmpeg', '-nostdin', '-y', '-loglevel', 'error', '-f', 'lavfi',
+                    '-i', f'sine=frequency=440:sample_rate=16000:duration={HOURS * 3600}', '-ac', '1', '-c:a', 'flac',
+                    path], check=True)
+    env = dict(os.environ, UPSHIRSA_PCM_DIR=str(tmp_path), UPSHIRSA_METRICS_LOG="off")
+    result = subprocess.run([sys.executable, '-c', CHILD, path], cwd=ROOT, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    # 300 s windows overlapping by 5 s, each transcribed once
+    assert measured['segments'] == HOURS * 3600 // 300
+    assert measured['growth_mb'] < MAX_GROWTH_MB
+    # The decoded store is removed once the transcript exists
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".pcm")] == []
@@ -0,0 +1,201 @@
+import os
+import sys
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+import srt
+
+import backends
+import models
+from backends import CTranslate2Backend, _timestamped_segments, get_backend
+
+# The parts of faster-whisper's Segment and Word that the backend reads
+Segment = namedtuple('Segment', 'id seek start end text tokens temperature avg_logprob compression_ratio '
+                                'no_speech_prob words')
+Word = namedtuple('Word', 'start end word probability')
+
+
+class FakeWhisperModel:
+    """Stands in for faster_whisper.WhisperModel: records the options, yields segments lazily."""
+
+    def __init__(self, segments):
+        self.segments = segments
+        self.options = None
+
+    def transcribe(self, audio, **options):
+        self.options = options
+        return iter(self.segments), SimpleNamespace(language="en")
+
+
+def ct2_segment(start, end, text, words=None):
+    return Segment(7, 0, start, end, text, (50364, 1000, 50414), 0.0, -0.2, 1.1, 0.01, words)
+
+
+def test_get_backend():
+    assert get_backend().name == backends.DEFAULT_BACKEND
+    assert get_backend("faster-whisper") is backends.BACKENDS["faster-whisper"]
+    with pytest.raises(ValueError):
+        get_backend("nope")
+
+
+def test_ct2_options_follow_whisper_defaults():
+    options = CTranslate2Backend().options({'temperature': (0.0, 0.2), 'beam_size': None, 'best_of': None})
+    assert options == {'temperature': (0.0, 0.2), 'beam_size': 1}
+    assert CTranslate2Backend().options({'beam_size': 5, 'best_of': 3}) == {'beam_size': 5, 'best_of': 3}
+
+
+def test_ct2_segments_become_whisper_dicts():
+    model = FakeWhisperModel([
+        ct2_segment(0.0, 2.5, " Hello there.", [Word(0.0, 1.0, " Hello", 0.9), Word(1.2, 2.5, " there.", 0.8)]),
+        ct2_segment(2.5, 4.0, " Bye."),
+    ])
+    segments = CTranslate2Backend().transcribe(model, "audio", False, {'word_timestamps': True})
+    assert model.options == {'word_timestamps': True, 'beam_size': 1}
+    assert [s['id'] for s in segments] == [0, 1]
+    first = segments[0]
+    assert (first['start'], first['end'], first['text']) == (0.0, 2.5, " Hello there.")
+    assert first['tokens'] == [50364, 1000, 50414]
+    assert first['words'] == [
+        {'word': " Hello", 'start': 0.0, 'end': 1.0, 'probability': 0.9},
+        {'word': " there.", 'start': 1.2, 'end': 2.5, 'probability': 0.8},
+    ]
+    assert 'words' not in segments[1]
+    for key in ('seek', 'temperature', 'avg_logprob', 'compression_ratio', 'no_speech_prob'):
+        assert key in segments[1]
+
+
+def test_ct2_batch_is_one_window_at_a_time():
+    model = FakeWhisperModel([ct2_segment(0.0, 1.0, " Hi.")])
+    results = CTranslate2Backend().transcribe_batch(model, ["a", "b"], False, {})
+    assert [[s['text'] for s in result] for result in results] == [[" Hi."], [" Hi."]]
+
+
+def test_missing_faster_whisper_is_reported(monkeypatch):
+    # faster-whisper is optional; without it only this backend fails, with an install hint
+    monkeypatch.setitem(sys.modules, "faster_whisper", None)
+    with pytest.raises(RuntimeError, match="pip install faster-whisper"):
+        CTranslate2Backend().load("tiny", "cpu", False)
+
+
+class FakeTokenizer:
+    eot = 50257
+    timestamp_begin = 50364
+
+    def decode(self, tokens):
+        return "".join(f" w{token}" for token in tokens)
+
+
+def decoded(tokens):
+    return SimpleNamespace(tokens=tokens, temperature=0.0, avg_logprob=-0.3, compression_ratio=1.2, no_speech_prob=0.1)
+
+
+def stamp(seconds):
+    return FakeTokenizer.timestamp_begin + int(round(seconds / 0.02))
+
+
+def test_timestamped_segments_split_at_timestamp_pairs():
+    tokens = [stamp(0), 1, 2, stamp(2), stamp(2), 3, stamp(4.5), stamp(5), 4]
+    segments = _timestamped_segments(decoded(tokens), FakeTokenizer(), duration=8.0)
+    assert [(s['start'], s['end'], s['text']) for s in segments] == [
+        (0.0, 2.0, " w1 w2"), (2.0, 4.5, " w3"), (5.0, 8.0, " w4"),
+    ]
+    assert [s['id'] for s in segments] == [0, 1, 2]
+
+
+def test_timestamped_segments_skip_empty_text_and_clamp():
+    tokens = [stamp(0), stamp(1), stamp(1), FakeTokenizer.eot, stamp(2), stamp(29), 5, stamp(31)]
+    segments = _timestamped_segments(decoded(tokens), FakeTokenizer(), duration=30.0)
+    assert [(s['start'], s['end'], s['text']) for s in segments] == [(29.0, 30.0, " w5")]
+
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self):
+        self.loads = []
+
+    def default_device(self):
+        return "cuda"
+
+    def load(self, model_size, device, fp16):
+        self.loads.append((model_size, device, fp16))
+        return object()
+
+    def memory_mb(self, model, model_size):
+        return 10
+
+    def transcribe(self, model, audio, fp16, options):
+        return [{'id': 0, 'start': 0.0, 'end': 1.0, 'text': audio}]
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setitem(backends.BACKENDS, backend.name, backend)
+    models.clear_cache()
+    yield backend
+    models.clear_cache()
+
+
+def test_models_are_cached_per_backend_and_device(fake_backend):
+    model = models.get_model("base", backend="fake")
+    assert model is models.get_model("base", device="cuda", fp16=True, backend="fake")
+    # Half precision on GPU unless asked otherwise, like whisper's own transcribe()
+    assert model.key == ("base", "cuda", True, "fake")
+    assert models.get_model("base", device="cuda", fp16=False, backend="fake") is not model
+    # fp16 only applies on GPU, so on CPU every request shares one model
+    assert models.get_model("base", device="cpu", fp16=True, backend="fake") is models.get_model(
+        "base", device="cpu", backend="fake")
+    assert fake_backend.loads == [("base", "cuda", True), ("base", "cuda", False), ("base", "cpu", False)]
+    assert model.transcribe("hello")[0]['text'] == "hello"
+
+
+def test_local_ct2_models_are_found_from_any_directory(tmp_path, monkeypatch):
+    assert os.path.isabs(backends.CT2_MODEL_DIR)
+    monkeypatch.setattr(backends, "CT2_MODEL_DIR", str(tmp_path / "ct2"))
+    (tmp_path / "ct2" / "base").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path / "ct2")
+    assert CTranslate2Backend().model_path("base") == str(tmp_path / "ct2" / "base")
+    # Sizes without a local model come from the hub
+    assert CTranslate2Backend().model_path("small") == "small"
+
+
+class FakeOpenAIWhisperModel:
+    """Stands in for a whisper model: transcribe() returns its result dict."""
+
+    def transcribe(self, audio, fp16=False, **options):
+        return {'text': " Hello there. Bye.", 'language': "en", 'segments': [
+            {'id': 0, 'seek': 0, 'start': 0.0, 'end': 2.5, 'text': " Hello there.", 'tokens': [50364, 1000, 50489],
+             'temperature': 0.0, 'avg_logprob': -0.2, 'compression_ratio': 1.1, 'no_speech_prob': 0.01,
+             'words': [{'word': " Hello", 'start': 0.0, 'end': 1.0, 'probability': 0.9},
+                       {'word': " there.", 'start': 1.2, 'end': 2.5, 'probability': 0.8}]},
+            {'id': 1, 'seek': 0, 'start': 2.5, 'end': 4.0, 'text': " Bye.", 'tokens': [50489, 1001, 50564],
+             'temperature': 0.0, 'avg_logprob': -0.3, 'compression_ratio': 1.0, 'no_speech_prob': 0.02},
+        ]}
+
+
+@pytest.mark.parametrize("engine", ["whisper", "whisper-batched", "faster-whisper"])
+def test_every_backend_output_is_written_by_the_writers(engine, tmp_path):
+    from utils import create_pdf, create_srt
+    if engine == "whisper":
+        segments = backends.WhisperBackend().transcribe(FakeOpenAIWhisperModel(), "audio", False, {})
+    elif engine == "whisper-batched":
+        tokens = [stamp(0), 1, 2, stamp(2.5), stamp(2.5), 3, stamp(4)]
+        segments = _timestamped_segments(decoded(tokens), FakeTokenizer(), duration=30.0)
+    else:
+        model = FakeWhisperModel([
+            ct2_segment(0.0, 2.5, " Hello there.", [Word(0.0, 1.0, " Hello", 0.9), Word(1.2, 2.5, " there.", 0.8)]),
+            ct2_segment(2.5, 4.0, " Bye."),
+        ])
+        segments = CTranslate2Backend().transcribe(model, "audio", False, {'word_timestamps': True})
+
+    srt_path, pdf_path = str(tmp_path / "out.srt"), str(tmp_path / "out.pdf")
+    create_srt(segments, srt_path)
+    create_pdf(segments, pdf_path)
+    with open(srt_path, encoding="utf-8") as f:
+        cues = list(srt.parse(f.read()))
+    assert " ".join(cue.content for cue in cues).split() == " ".join(s['text'] for s in segments).split()
+    assert cues[0].start.total_seconds() == 0 and cues[-1].end.total_seconds() <= 4.0
+    with open(pdf_path, 'rb') as f:
+        assert f.read(5) == b"%PDF-"
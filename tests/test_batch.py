@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import batch
+from utils import load_cached_transcript, store_cached_transcript, transcript_options
+
+URL = "https://youtu.be/dQw4w9WgXcQ"
+SEGMENTS = [{'id': 0, 'start': 0.0, 'end': 2.0, 'text': " Never gonna give you up."}]
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    # Any download fails the item, so a skipped one shows as a finished item
+    calls = []
+
+    def download(*args, **kwargs):
+        calls.append(args)
+        raise RuntimeError("no network in tests")
+
+    monkeypatch.setattr(batch, "download_youtube_audio", download)
+    monkeypatch.setattr(batch, "download_youtube_video", download)
+    return calls
+
+
+@pytest.fixture
+def cached():
+    key, _ = load_cached_transcript("base", transcript_options(), source_id="dQw4w9WgXcQ")
+    store_cached_transcript(key, SEGMENTS)
+
+
+def test_cached_transcript_only_items_skip_the_download(downloads, cached, tmp_path):
+    [item] = batch.run_batch([URL], output_dir=str(tmp_path / "out"), outputs=["srt", "txt"])
+    assert item.status == "done", item.error
+    assert downloads == []
+    assert sorted(item.job.outputs) == ["srt", "txt"]
+    with open(item.job.outputs["txt"], encoding="utf-8") as f:
+        assert f.read().strip() == "Never gonna give you up."
+    assert os.path.basename(item.job.outputs["srt"]).startswith("subtitles_dQw4w9WgXcQ_")
+
+
+def test_video_outputs_still_download(downloads, cached, tmp_path):
+    [item] = batch.run_batch([URL], output_dir=str(tmp_path / "out"), outputs=["burned"])
+    assert (item.status, item.stage) == ("failed", "download")
+    assert len(downloads) == 1
+
+
+def test_uncached_items_download(downloads, tmp_path):
+    [item] = batch.run_batch([URL], output_dir=str(tmp_path / "out"), outputs=["srt"])
+    assert (item.status, item.stage) == ("failed", "download")
+    assert len(downloads) == 1
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import utils
+from pcm_store import PCMStore
+from utils import SAMPLE_RATE, _shift_segments, stitch_segments
+
+
+def segment(start, end, text, words=None):
+    result = {'start': start, 'end': end, 'text': text}
+    if words is not None:
+        result['words'] = words
+    return result
+
+
+def word(start, text):
+    return {'word': text, 'start': start, 'end': start + 0.4}
+
+
+def test_stitch_splits_overlaps_at_their_midpoint():
+    # Windows at 0 and 10 s overlapping by 4 s: the cut is at 12 s
+    first = [segment(0, 5, "a"), segment(9, 11.9, "b"), segment(11, 13.5, "c")]
+    second = [segment(10, 11.9, "b"), segment(11, 13.5, "c"), segment(13, 16, "d")]
+    stitched = stitch_segments([first, second], [0, 10], overlap=4)
+    assert [s['text'] for s in stitched] == ["a", "b", "c", "d"]
+    assert [s['id'] for s in stitched] == [0, 1, 2, 3]
+
+
+def test_stitch_keeps_each_word_once():
+    first = [segment(10, 14, " one two three", [word(10.5, " one"), word(11.5, " two"), word(12.5, " three")])]
+    second = [segment(10, 14, " one two three", [word(10.5, " one"), word(11.5, " two"), word(12.5, " three")])]
+    stitched = stitch_segments([first, second], [0, 10], overlap=4)
+    assert [s['text'] for s in stitched] == [" one two", " three"]
+    assert (stitched[0]['start'], stitched[0]['end']) == (10.5, 11.9)
+    assert stitched[1]['start'] == 12.5
+    # The input segments are left alone
+    assert len(first[0]['words']) == 3
+
+
+def test_shift_segments_moves_words_too():
+    shifted = _shift_segments([segment(1, 2, "a", [word(1, "a")])], 30)
+    assert (shifted[0]['start'], shifted[0]['end']) == (31, 32)
+    assert shifted[0]['words'][0]['start'] == 31
+
+
+@pytest.fixture
+def fake_transcribe(monkeypatch):
+    # One word per second of the window, named after its second on the whole
+    # recording, so a correct stitch lists every second exactly once
+    calls = []
+
+    def transcribe_audio(audio, model_size="base", device=None, fp16=False, profile=None, backend=None):
+        calls.append({'audio': audio, 'device': device, 'backend': backend})
+        first = audio.start // SAMPLE_RATE
+        return [segment(t, t + 0.9, f" {first + t}", [word(t, f" {first + t}")])
+                for t in range(int(len(audio) / SAMPLE_RATE))]
+
+    monkeypatch.setattr(utils, "transcribe_audio", transcribe_audio)
+    return calls
+
+
+@pytest.fixture
+def long_store(tmp_path):
+    path = tmp_path / "long.pcm"
+    np.zeros(95 * SAMPLE_RATE, dtype=np.int16).tofile(path)
+    return PCMStore(str(path))
+
+
+def test_chunked_transcription_covers_every_second_once(fake_transcribe, long_store):
+    segments = utils.transcribe_audio_parallel(long_store, workers=1, chunk_length=30, overlap=5)
+    assert [s['text'] for s in segments] == [f" {t}" for t in range(95)]
+    assert [s['id'] for s in segments] == list(range(95))
+    # Windows are read from the store one at a time, never the whole recording
+    assert len(fake_transcribe) == 3
+    assert all(isinstance(call['audio'], PCMStore) and len(call['audio']) <= 35 * SAMPLE_RATE
+               for call in fake_transcribe)
+
+
+def test_device_is_left_to_the_model_cache(fake_transcribe, long_store):
+    # None lets get_model pick the backend's default device (CUDA when there is one)
+    utils.transcribe_audio_parallel(long_store, workers=1, chunk_length=30)
+    utils.transcribe_audio_parallel(long_store[:10 * SAMPLE_RATE], workers=1, chunk_length=30)
+    assert {call['device'] for call in fake_transcribe} == {None}
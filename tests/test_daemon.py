@@ -0,0 +1,32 @@
+import pytest
+
+from daemon import check_request
+
+
+def request(command='youtube', args=("https://youtu.be/dQw4w9WgXcQ", "720p"), **options):
+    return {'command': command, 'args': list(args), 'options': options}
+
+
+def test_cli_and_ui_requests_pass():
+    command, args, options = check_request(request(outputs=["srt"], profile="fast", output_dir="/tmp/out",
+                                                   target_mb=50, job_id="0123456789ab"))
+    assert command == 'youtube' and args[1] == "720p"
+    assert options == {'outputs': ["srt"], 'profile': "fast", 'output_dir': "/tmp/out", 'target_mb': 50,
+                       'job_id': "0123456789ab"}
+    assert check_request(request('local', ["/tmp/video.mp4"], model_size="base"))[0] == 'local'
+
+
+@pytest.mark.parametrize("bad", [
+    request(command='shell'),
+    request(command=None),
+    request(args=["https://youtu.be/dQw4w9WgXcQ"]),
+    request('local', ["/tmp/video.mp4"], target_mb=50),
+    request(checkpoint_dir="/etc"),
+    request(job_id="../../etc"),
+    request(output_dir="relative/out"),
+    {'command': 'youtube', 'args': ["u", "720p"], 'options': ["outputs"]},
+    ["youtube"],
+])
+def test_other_requests_are_rejected(bad):
+    with pytest.raises(ValueError):
+        check_request(bad)
@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+# Importing these must not load any of the modules that take seconds or
+# hundreds of MB (benchmarks/import_time.py also times it)
+HEAVY_MODULES = {'torch', 'whisper', 'faster_whisper', 'ctranslate2', 'yt_dlp', 'numpy', 'fpdf', 'moviepy',
+                 'gradio', 'telegram'}
+
+
+def loaded_packages(statement):
+    # Top-level packages in sys.modules after running statement in a fresh interpreter
+    code = f"import sys, json\n{statement}\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return {name.split('.')[0] for name in json.loads(result.stdout.splitlines()[-1])}
+
+
+@pytest.mark.parametrize("module", ["utils", "batch", "daemon", "scheduler", "models", "backends", "batching"])
+def test_import_stays_light(module):
+    assert not loaded_packages(f"import {module}") & HEAVY_MODULES
+
+
+def test_cli_help_stays_light():
+    statement = ("import runpy; sys.argv = ['main.py', '--help']\n"
+                 "try: runpy.run_path('main.py', run_name='__main__')\n"
+                 "except SystemExit: pass")
+    packages = loaded_packages(statement)
+    assert 'argparse' in packages
+    assert not packages & HEAVY_MODULES
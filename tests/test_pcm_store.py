@@ -0,0 +1,78 @@
+import hashlib
+import pickle
+
+import numpy as np
+import pytest
+
+from pcm_store import PCMStore
+from transcript_cache import audio_fingerprint
+from utils import SAMPLE_RATE, split_audio
+
+
+@pytest.fixture
+def samples():
+    return (np.arange(10 * SAMPLE_RATE) % 65536 - 32768).astype(np.int16)
+
+
+@pytest.fixture
+def store(tmp_path, samples):
+    path = tmp_path / "audio.pcm"
+    samples.tofile(path)
+    return PCMStore(str(path))
+
+
+def test_whole_store(store, samples):
+    assert len(store) == len(samples)
+    assert store.duration == 10
+    assert np.array_equal(store.load("int16"), samples)
+    assert np.allclose(store.load(), samples / 32768.0)
+    assert store.load().dtype == np.float32
+
+
+def test_slices_read_their_window_only(store, samples):
+    window = store[SAMPLE_RATE:3 * SAMPLE_RATE]
+    assert isinstance(window, PCMStore)
+    assert (window.start, window.stop) == (SAMPLE_RATE, 3 * SAMPLE_RATE)
+    assert np.array_equal(window.load("int16"), samples[SAMPLE_RATE:3 * SAMPLE_RATE])
+    # Slices of slices stay relative to the window
+    assert np.array_equal(window[100:200].load("int16"), samples[SAMPLE_RATE + 100:SAMPLE_RATE + 200])
+
+
+def test_slices_are_clamped_like_arrays(store, samples):
+    assert len(store[-SAMPLE_RATE:]) == SAMPLE_RATE
+    assert len(store[len(samples):len(samples) + 100]) == 0
+    assert store[5:5].load().shape == (0,)
+    assert len(store[:100 * SAMPLE_RATE]) == len(samples)
+
+
+def test_only_contiguous_slices(store):
+    with pytest.raises(TypeError):
+        store[::2]
+    with pytest.raises(TypeError):
+        store[3]
+
+
+def test_fingerprint_matches_the_decoded_array(store, samples):
+    window = store[1000:50000]
+    assert window.fingerprint() == hashlib.sha256(samples[1000:50000].tobytes()).hexdigest()
+    assert audio_fingerprint(window) == audio_fingerprint(samples[1000:50000])
+
+
+def test_pickles_as_path_and_bounds(store, samples):
+    window = pickle.loads(pickle.dumps(store[2000:4000]))
+    assert np.array_equal(window.load("int16"), samples[2000:4000])
+
+
+def test_remove(store):
+    store.remove()
+    store.remove()
+
+
+def test_split_audio_windows_are_stores(store):
+    windows = split_audio(store, chunk_length=3, overlap=1)
+    # The last window reaches the end, so no window is made of overlap alone
+    assert [offset for offset, _ in windows] == [0, 3, 6]
+    assert all(isinstance(window, PCMStore) for _, window in windows)
+    assert [(window.start, window.stop) for _, window in windows] == [
+        (0, 4 * SAMPLE_RATE), (3 * SAMPLE_RATE, 7 * SAMPLE_RATE), (6 * SAMPLE_RATE, 10 * SAMPLE_RATE),
+    ]
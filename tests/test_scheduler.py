@@ -0,0 +1,70 @@
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+from scheduler import JobCancelled, JobScheduler, WorkerProcess
+
+
+def run_child(pid_path):
+    # Stands in for a stage that runs ffmpeg: a child process the job waits on
+    child = subprocess.Popen(["sleep", "60"])
+    with open(pid_path, "w") as f:
+        f.write(str(child.pid))
+    child.wait()
+
+
+def wait_for(path, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path) or not open(path).read():
+        assert time.monotonic() < deadline, f"{path} never appeared"
+        time.sleep(0.05)
+    return int(open(path).read())
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # A zombie child of the worker is dead too
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().split(")")[-1].split()[0] != "Z"
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg") or not os.path.isdir("/proc"), reason="needs POSIX process groups")
+def test_cancel_stops_the_processes_a_job_started(tmp_path):
+    pid_path = str(tmp_path / "child.pid")
+
+    async def scenario():
+        scheduler = JobScheduler(workers=1, preload=False)
+        await scheduler.start()
+        job = await scheduler.submit("user", run_child, pid_path)
+        child = await asyncio.to_thread(wait_for, pid_path)
+        assert await scheduler.cancel_user("user") == 1
+        with pytest.raises(JobCancelled):
+            await job.result()
+        await scheduler.shutdown()
+        return child
+
+    child = asyncio.run(scenario())
+    deadline = time.monotonic() + 5
+    while alive(child) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not alive(child)
+
+
+def test_late_cancel_leaves_the_next_job_alone():
+    worker = WorkerProcess(preload=False)
+    worker.start()
+    try:
+        worker.job_id = 2
+        # A cancel for job 1, which already finished on this worker
+        assert worker.kill(1) is False
+        assert worker.process is not None and worker.process.is_alive()
+        assert worker.kill(2) is True
+        assert worker.process is None
+    finally:
+        worker.stop()
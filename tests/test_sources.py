@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+
+import pytest
+
+import sources
+import storage
+
+FORMAT = ('720p', 'bestvideo[height<=720]+bestaudio/best[height<=720]', ['mp4'])
+
+
+class FakeYtDlp:
+    """Counts extractions and downloads; writes size bytes per download."""
+
+    def __init__(self, delay=0.0, size=1024 * 1024, failures=0):
+        self.delay = delay
+        self.size = size
+        self.failures = failures
+        self.extractions = 0
+        self.downloads = 0
+        self.lock = threading.Lock()
+
+    def extract(self, video_url):
+        with self.lock:
+            self.extractions += 1
+        time.sleep(self.delay)
+        return {'id': sources.youtube_video_id(video_url), 'extraction': self.extractions}
+
+    def download(self, info_dict, format_spec, outtmpl, possible_exts):
+        with self.lock:
+            self.downloads += 1
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("HTTP Error 403: Forbidden")
+        time.sleep(self.delay)
+        path = outtmpl.replace('%(ext)s', 'mp4')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * self.size)
+        return path
+
+    def fetch(self, video_url, leases=None):
+        variant, format_spec, exts = FORMAT
+        return sources.fetch_source(video_url, variant, format_spec, exts,
+                                    extractor=self.extract, downloader=self.download, leases=leases)
+
+
+def stored_ids():
+    return sorted(name.split('.')[0] for name in os.listdir(sources.SOURCE_DIR) if not name.startswith('.'))
+
+
+def fetch_each(yt, ids):
+    # Distinct mtimes, so the LRU order is the fetch order
+    paths = {}
+    for video_id in ids:
+        paths[video_id] = yt.fetch(f"https://youtu.be/{video_id}")
+        os.utime(paths[video_id], (time.time() - 100 + len(paths), time.time() - 100 + len(paths)))
+    return paths
+
+
+def test_every_url_form_maps_to_the_video_id():
+    for url in ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "https://youtu.be/dQw4w9WgXcQ?t=42",
+                "https://www.youtube.com/shorts/dQw4w9WgXcQ", "https://m.youtube.com/watch?feature=x&v=dQw4w9WgXcQ"):
+        assert sources.source_key(url) == "dQw4w9WgXcQ"
+    assert sources.source_key("https://example.com/a.mp4").startswith("url-")
+    assert sources.source_key("https://example.com/a.mp4") != sources.source_key("https://example.com/b.mp4")
+
+
+def test_concurrent_requests_are_coalesced():
+    yt = FakeYtDlp(delay=0.1)
+    urls = ["https://www.youtube.com/watch?v=dQw4w9WgXcQ", "https://youtu.be/dQw4w9WgXcQ"]
+    paths = [None] * 6
+
+    def run(index):
+        paths[index] = yt.fetch(urls[index % 2])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (yt.extractions, yt.downloads) == (1, 1)
+    assert len(set(paths)) == 1 and sources.is_stored(paths[0])
+    # Nothing half-written is left next to the finished download
+    assert os.listdir(os.path.join(sources.SOURCE_DIR, ".partial")) == []
+
+
+def test_metadata_is_reused_until_it_expires(monkeypatch):
+    yt = FakeYtDlp()
+    url = "https://youtu.be/dQw4w9WgXcQ"
+    sources.get_info(url, extractor=yt.extract)
+    sources.get_info(url, extractor=yt.extract)
+    # Another process finds it on disk
+    sources._memory.clear()
+    assert sources.get_info(url, extractor=yt.extract)['extraction'] == 1
+    monkeypatch.setattr(sources, "METADATA_TTL_S", 0)
+    assert sources.get_info(url, extractor=yt.extract)['extraction'] == 2
+
+
+def test_failed_download_retries_with_fresh_metadata():
+    yt = FakeYtDlp(failures=1)
+    path = yt.fetch("https://youtu.be/dQw4w9WgXcQ")
+    assert os.path.getsize(path) == yt.size
+    assert (yt.extractions, yt.downloads) == (2, 2)
+
+
+def test_download_failing_twice_is_raised():
+    yt = FakeYtDlp(failures=2)
+    with pytest.raises(RuntimeError):
+        yt.fetch("https://youtu.be/dQw4w9WgXcQ")
+    assert stored_ids() == []
+
+
+def test_least_recently_used_downloads_are_evicted(monkeypatch):
+    monkeypatch.setattr(sources, "MAX_SOURCE_MB", 2.5)
+    yt = FakeYtDlp()
+    fetch_each(yt, ["aaaaaaaaaaa", "bbbbbbbbbbb"])
+    # Using a download again makes it the most recent
+    yt.fetch("https://youtu.be/aaaaaaaaaaa")
+    yt.fetch("https://youtu.be/ccccccccccc")
+    assert stored_ids() == ["aaaaaaaaaaa", "ccccccccccc"]
+    assert yt.downloads == 3
+
+
+def test_evicted_download_is_fetched_again():
+    yt = FakeYtDlp()
+    path = yt.fetch("https://youtu.be/aaaaaaaaaaa")
+    sources.evict(max_mb=0)
+    assert not os.path.exists(path)
+    assert yt.fetch("https://youtu.be/aaaaaaaaaaa") == path
+    assert os.path.exists(path) and yt.downloads == 2
+
+
+def test_leased_downloads_are_not_evicted_or_purged():
+    yt = FakeYtDlp()
+    leases = sources.Leases()
+    leased = yt.fetch("https://youtu.be/aaaaaaaaaaa", leases=leases)
+    other = yt.fetch("https://youtu.be/bbbbbbbbbbb")
+    sources.evict(max_mb=0)
+    assert os.path.exists(leased) and not os.path.exists(other)
+    assert sources.purge() == 0 and os.path.exists(leased)
+    leases.release()
+    assert sources.purge() == 1 and not os.path.exists(leased)
+
+
+def test_lease_held_by_another_job_blocks_eviction():
+    # Two jobs on the same video: the first one finishing must not free the
+    # download while the second is still using it
+    yt = FakeYtDlp()
+    first, second = sources.Leases(), sources.Leases()
+    path = yt.fetch("https://youtu.be/aaaaaaaaaaa", leases=first)
+    yt.fetch("https://youtu.be/aaaaaaaaaaa", leases=second)
+    first.release()
+    sources.evict(max_mb=0)
+    assert os.path.exists(path)
+    second.release()
+    sources.evict(max_mb=0)
+    assert not os.path.exists(path)
+
+
+def test_metadata_write_failure_leaves_no_temp_file():
+    sources._store_metadata("broken", {'not json': object()})
+    assert os.listdir(sources.METADATA_DIR) == []
+    # The process still has it in memory
+    assert "broken" in sources._memory
+
+
+def test_atomic_write_keeps_the_old_file_on_failure(tmp_path):
+    path = str(tmp_path / "data" / "entry.json")
+    storage.atomic_write_json(path, {'a': 1})
+    with pytest.raises(TypeError):
+        storage.atomic_write_json(path, {'a': object()})
+    assert os.listdir(tmp_path / "data") == ["entry.json"]
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == '{"a": 1}'
+
+
+def test_lru_eviction_skips_entries_that_must_stay(tmp_path):
+    paths = []
+    for index in range(4):
+        path = tmp_path / f"{index}.bin"
+        path.write_bytes(b'\0' * 1024 * 1024)
+        os.utime(path, (1000 + index, 1000 + index))
+        paths.append(str(path))
+    storage.evict(storage.lru_entries(str(tmp_path)), 2,
+                  remove=lambda path: path != paths[0] and storage.remove_entry(path))
+    assert sorted(os.listdir(tmp_path)) == ["0.bin", "3.bin"]
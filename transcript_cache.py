@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+
+import storage
+
+CACHE_DIR = storage.cache_dir("UPSHIRSA_CACHE_DIR", "transcripts")
+# Total size of cached transcripts before the least recently used are evicted, in MB
+MAX_CACHE_MB = float(os.environ.get("UPSHIRSA_TRANSCRIPT_CACHE_MB", "512"))
+
+
+def audio_fingerprint(audio):
+    # A PCMStore hashes its file in blocks instead of loading it
+    if hasattr(audio, "fingerprint"):
+        return audio.fingerprint()
+    return hashlib.sha256(memoryview(audio).cast("B")).hexdigest()
+
+
+def cache_key(model_size, options=None, audio=None, source_id=None):
+    # Prefer a stable source id (e.g. a YouTube video id); otherwise hash the decoded audio
+    if source_id:
+        source = f"id:{source_id}"
+    elif audio is not None:
+        source = f"pcm:{audio_fingerprint(audio)}"
+    else:
+        raise ValueError("cache_key needs either audio or a source_id")
+    settings = json.dumps({"model": model_size, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(f"{source}|{settings}".encode("utf-8")).hexdigest()
+
+
+def _entry_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, key[:2], f"{key}.json")
+
+
+def load(key, cache_dir=None):
+    path = _entry_path(key, cache_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            segments = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable transcript cache entry {path}: {e}")
+        return None
+    try:
+        # Touch the entry so eviction treats it as recently used
+        os.utime(path)
+    except OSError:
+        pass
+    return segments
+
+
+def store(key, segments, cache_dir=None):
+    # Renamed into place, so a concurrent reader sees either nothing or the complete entry
+    storage.atomic_write_json(_entry_path(key, cache_dir), segments)
+    evict(cache_dir=cache_dir)
+
+
+def _entries(cache_dir=None):
+    return storage.lru_entries(cache_dir or CACHE_DIR, suffix=".json", recursive=True)
+
+
+def evict(max_mb=None, cache_dir=None):
+    storage.evict(_entries(cache_dir), MAX_CACHE_MB if max_mb is None else max_mb)
+
+
+def purge(cache_dir=None):
+    return storage.purge(_entries(cache_dir))
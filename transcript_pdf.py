@@ -0,0 +1,155 @@
+import os
+from datetime import timedelta
+
+from fpdf import FPDF
+
+# A Unicode TTF to embed (only the glyphs used end up in the file); without one
+# we fall back to the core Helvetica font and replace non-Latin-1 characters
+FONT_PATH = os.environ.get("UPSHIRSA_PDF_FONT")
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial Unicode.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+)
+
+# Stay clear of Telegram's 50 MB document limit
+MAX_PDF_MB = float(os.environ.get("UPSHIRSA_PDF_MAX_MB", 45))
+
+MARGIN = 15
+# (font size, line height, gap between segments) in pt/mm
+LAYOUTS = {
+    'regular': (12, 10, 1),
+    'compact': (10, 6, 1),
+}
+TIMESTAMP_WIDTH = 20
+
+
+def find_font():
+    if FONT_PATH:
+        return FONT_PATH
+    for path in FONT_CANDIDATES:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _timestamp(seconds):
+    return str(timedelta(seconds=seconds)).split('.')[0]
+
+
+class _Layout:
+    """Wraps and places lines itself, so every line is a single pdf.text() call."""
+
+    def __init__(self, pdf, font_size, line_height, unicode_font):
+        self.pdf = pdf
+        self.line_height = line_height
+        self.unicode_font = unicode_font
+        self.widths = {}
+        self.space = pdf.get_string_width(" ")
+        # Baseline offset so text sits inside its line like a cell would
+        self.baseline = (line_height + font_size * 0.3528 * 0.7) / 2
+        self.bottom = pdf.h - MARGIN
+        self.y = MARGIN
+
+    def clean(self, text):
+        if self.unicode_font:
+            return text
+        return text.encode('latin-1', 'replace').decode('latin-1')
+
+    def width(self, word):
+        width = self.widths.get(word)
+        if width is None:
+            width = self.widths[word] = self.pdf.get_string_width(word)
+        return width
+
+    def wrap(self, text, max_width):
+        lines = []
+        current = []
+        current_width = 0.0
+        for word in text.split():
+            word_width = self.width(word)
+            if word_width > max_width:
+                # Unbroken runs (long URLs, CJK text) are cut by character
+                for part in self._split_word(word, max_width):
+                    if current:
+                        lines.append(" ".join(current))
+                    current, current_width = [part], self.width(part)
+                continue
+            needed = word_width if not current else current_width + self.space + word_width
+            if current and needed > max_width:
+                lines.append(" ".join(current))
+                current, current_width = [word], word_width
+            else:
+                current.append(word)
+                current_width = needed
+        if current:
+            lines.append(" ".join(current))
+        return lines or [""]
+
+    def _split_word(self, word, max_width):
+        part = ""
+        for char in word:
+            if part and self.pdf.get_string_width(part + char) > max_width:
+                yield part
+                part = ""
+            part += char
+        if part:
+            yield part
+
+    def ensure_room(self, lines):
+        if self.y + lines * self.line_height > self.bottom:
+            self.pdf.add_page()
+            self.y = MARGIN
+
+    def line(self, x, text):
+        self.ensure_room(1)
+        self.pdf.text(x, self.y + self.baseline, text)
+        self.y += self.line_height
+
+
+def render_pdf(segments, pdf_path, compact=False, max_mb=None):
+    font_size, line_height, gap = LAYOUTS['compact' if compact else 'regular']
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=False)
+    pdf.set_margins(MARGIN, MARGIN, MARGIN)
+    font = find_font()
+    if font:
+        pdf.add_font("Transcript", "", font)
+        pdf.set_font("Transcript", size=font_size)
+    else:
+        pdf.set_font("Helvetica", size=font_size)
+    pdf.add_page()
+    layout = _Layout(pdf, font_size, line_height, unicode_font=bool(font))
+    text_width = pdf.w - 2 * MARGIN
+
+    for segment in segments:
+        start_time = _timestamp(segment['start'])
+        lines = layout.wrap(layout.clean(segment['text'].strip()), text_width - (TIMESTAMP_WIDTH if compact else 0))
+        if compact:
+            # Timestamp column and text share a row
+            layout.ensure_room(1)
+            pdf.text(MARGIN, layout.y + layout.baseline, start_time)
+            for line in lines:
+                layout.line(MARGIN + TIMESTAMP_WIDTH, line)
+        else:
+            end_time = _timestamp(segment['end'])
+            # Keep the timestamp together with the first line of its text
+            layout.ensure_room(2)
+            layout.line(MARGIN, f"[{start_time} - {end_time}]")
+            for line in lines:
+                layout.line(MARGIN, line)
+        layout.y += gap
+
+    data = pdf.output()
+    limit = MAX_PDF_MB if max_mb is None else max_mb
+    if limit and len(data) > limit * 1024 * 1024:
+        if not compact:
+            return render_pdf(segments, pdf_path, compact=True, max_mb=max_mb)
+        raise ValueError(f"Transcript PDF would be {len(data) / (1024 * 1024):.1f} MB, over the {limit:g} MB limit")
+    with open(pdf_path, 'wb') as f:
+        f.write(data)
+    return pdf.page_no()
@@ -1,19 +1,39 @@
 import os
+import uuid
 import gradio as gr
-from utils import (
-    fetch_video_info,
-    download_youtube_video,
-    process_video
-)
+from utils import fetch_video_info
+from profiles import DEFAULT_PROFILE
+from daemon import available, run_job
+import metrics
+from models import warm_up_in_background
 import shutil
 
+# Labels for the outputs offered in the UI; only the checked ones are produced
+OUTPUT_CHOICES = [
+    ("Video with burned-in subtitles", "burned"),
+    ("Video with a subtitle track (fast, no re-encode)", "muxed"),
+    ("PDF transcript", "pdf"),
+    ("SRT subtitles", "srt"),
+    ("WebVTT subtitles", "vtt"),
+    ("Plain text", "txt"),
+    ("JSON segments", "json"),
+]
+DEFAULT_OUTPUTS = ["burned", "pdf"]
+
+PROFILE_CHOICES = [
+    ("Accurate (word-level timing)", "accurate"),
+    ("Fast (greedy decoding, estimated word timing)", "fast"),
+]
+
 # Ensure output directories exist
 os.makedirs("output", exist_ok=True)
 os.makedirs("temp_video", exist_ok=True)
 
-def handle_upload_video(video_file):
+def handle_upload_video(video_file, outputs=DEFAULT_OUTPUTS, profile=DEFAULT_PROFILE):
     if not video_file:
-        return None, None, "Please upload a video file."
+        return None, "Please upload a video file."
+    if not outputs:
+        return None, "Please choose at least one output."
     try:
         video_path = video_file  # Use the file path string directly
 
@@ -23,20 +43,19 @@ def handle_upload_video(video_file):
         # Ensure the temp_video directory exists
         os.makedirs(temp_video_dir, exist_ok=True)
 
-        # Construct the new path
-        new_path = os.path.join(temp_video_dir, os.path.basename(video_path))
+        # Construct the new path, prefixed so two uploads with the same name don't collide
+        new_path = os.path.join(temp_video_dir, f"{uuid.uuid4().hex[:8]}_{os.path.basename(video_path)}")
 
         # Move the uploaded video to temp_video directory using shutil.move
         if not os.path.abspath(video_path).startswith(temp_video_dir):
             shutil.move(video_path, new_path)
             video_path = new_path
 
-        process_video(video_path)
-        output_video_path = os.path.join("output", f"output_{os.path.basename(video_path)}")
-        output_pdf_path = os.path.join("output", f"transcript_{os.path.basename(video_path)}.pdf")
-        return output_video_path, output_pdf_path, ""
+        # Runs on the worker daemon when one is up, otherwise in this process
+        produced = run_job('local', [video_path], {'outputs': outputs, 'profile': profile, 'output_dir': "output"})
+        return list(produced.values()), ""
     except Exception as e:
-        return None, None, f"Error processing uploaded video: {str(e)}"
+        return None, f"Error processing uploaded video: {str(e)}"
 
 def fetch_video_info_ui(video_url):
     if not video_url:
@@ -55,25 +74,29 @@ def fetch_video_info_ui(video_url):
 
 
 
-def handle_process_video_ui(video_url, selected_quality="720p"):  # Default to 720p
+def handle_process_video_ui(video_url, selected_quality="auto", outputs=DEFAULT_OUTPUTS, profile=DEFAULT_PROFILE):  # Planned from the size and time budgets
     if not video_url:
-        return None, None, "Please enter a YouTube URL."
-    try:
-        video_path = download_youtube_video(video_url, selected_quality)
-    except Exception as e:
-        return None, None, str(e)
-    
+        return None, "Please enter a YouTube URL."
+    if not outputs:
+        return None, "Please choose at least one output."
     try:
-        process_video(video_path)
-        output_video_path = os.path.join("output", f"output_{os.path.basename(video_path)}")
-        output_pdf_path = os.path.join("output", f"transcript_{os.path.basename(video_path)}.pdf")
-        return output_video_path, output_pdf_path, ""
+        produced = run_job('youtube', [video_url, selected_quality],
+                           {'outputs': outputs, 'profile': profile, 'output_dir': "output"})
+        return list(produced.values()), ""
     except Exception as e:
-        return None, None, f"Error processing video: {str(e)}"
+        return None, f"Error processing video: {str(e)}"
 
 
 # Gradio UI with Tabs
 def launch_ui():
+    # Jobs go to the worker daemon when one is up, and it keeps its own models
+    # warm. Only without one is the model loaded here, while the UI starts, so
+    # the first job doesn't pay for it (a daemon that stops later just means
+    # the first job run here loads it).
+    if not available():
+        warm_up_in_background()
+    metrics.start_metrics_server(9465)
+
     with gr.Blocks() as app:
         # Centered title with custom styling
         gr.Markdown(
@@ -91,18 +114,21 @@ def launch_ui():
             
             with gr.Row():
                 upload_video = gr.Video(label="Upload Video File")
+
+            upload_outputs = gr.CheckboxGroup(OUTPUT_CHOICES, value=DEFAULT_OUTPUTS, label="Outputs")
+            upload_profile = gr.Radio(PROFILE_CHOICES, value=DEFAULT_PROFILE, label="Transcription")
             
             process_upload_button = gr.Button("Process Uploaded Video 🎬")
             
             with gr.Row():
-                upload_output_video = gr.File(label="Download the Captioned Video 📥")
-                upload_output_pdf = gr.File(label="Download the Transcript PDF 📄")
+                upload_output_files = gr.File(label="Download the Results 📥", file_count="multiple")
+                upload_status = gr.Textbox(label="Status", interactive=False)
             
             # Upload video processing
             process_upload_button.click(
                 handle_upload_video,
-                inputs=[upload_video],
-                outputs=[upload_output_video, upload_output_pdf]
+                inputs=[upload_video, upload_outputs, upload_profile],
+                outputs=[upload_output_files, upload_status]
             )
         
         with gr.Tab("YouTube Link"):
@@ -110,18 +136,21 @@ def launch_ui():
             
             with gr.Row():
                 youtube_url = gr.Textbox(label="Enter YouTube Video URL", placeholder="https://www.youtube.com/watch?v=example")
+
+            youtube_outputs = gr.CheckboxGroup(OUTPUT_CHOICES, value=DEFAULT_OUTPUTS, label="Outputs")
+            youtube_profile = gr.Radio(PROFILE_CHOICES, value=DEFAULT_PROFILE, label="Transcription")
             
             process_youtube_button = gr.Button("Process YouTube Video 🎬")
             
             with gr.Row():
-                youtube_output_video = gr.File(label="Download the Captioned Video 📥")
-                youtube_output_pdf = gr.File(label="Download the Transcript PDF 📄")
+                youtube_output_files = gr.File(label="Download the Results 📥", file_count="multiple")
+                youtube_status = gr.Textbox(label="Status", interactive=False)
             
             # Process YouTube video
             process_youtube_button.click(
-                lambda url: handle_process_video_ui(url, "720p"),  # Use the default quality directly
-                inputs=[youtube_url],
-                outputs=[youtube_output_video, youtube_output_pdf]
+                lambda url, outputs, profile: handle_process_video_ui(url, "auto", outputs, profile),  # Let the planner pick the quality
+                inputs=[youtube_url, youtube_outputs, youtube_profile],
+                outputs=[youtube_output_files, youtube_status]
             )
 
     app.launch(share=True)
@@ -1,184 +1,815 @@
 import os
+import json
+import uuid
 import shutil
-import yt_dlp
+import multiprocessing
+import tempfile
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import ffmpeg
 import srt
-from moviepy.editor import VideoFileClip
-import whisper
-from fpdf import FPDF
 from datetime import timedelta
+from models import get_model
+import transcript_cache
+import metrics
+import checkpoints
+import batching
+import sources
+from sources import youtube_video_id
+from vad import speech_regions
+from jobs import VideoJob
+from pcm_store import SAMPLE_RATE, PCMStore
+from subtitles import write_subtitles, shift_ass
+from planner import AUDIO_KBPS, plan_quality
+from backends import get_backend
+from profiles import DEFAULT_PROFILE, PROFILES, decode_options
+from outputs import OUTPUT_KINDS, VIDEO_OUTPUTS, resolve_outputs
 
-def extract_audio(video_path, audio_path):
+# numpy, yt_dlp, fpdf and Whisper (torch) are imported inside the functions that
+# use them, so importing this module stays cheap for the CLI, the bot and --help
+
+@metrics.timed("extract_audio")
+def decode_audio(video_path, sample_rate=SAMPLE_RATE, dtype="float32"):
+    import numpy as np
+    # Decode once with ffmpeg straight to mono PCM on a pipe, no intermediate file
     try:
-        video = VideoFileClip(video_path)
-        video.audio.write_audiofile(audio_path)
-    except Exception as e:
+        out, _ = (
+            ffmpeg.input(video_path, threads=0)
+            .output('-', format='s16le', acodec='pcm_s16le', ac=1, ar=sample_rate)
+            .run(cmd=['ffmpeg', '-nostdin'], capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        print(f"Error decoding audio: {e.stderr.decode(errors='replace') if e.stderr else e}")
+        raise
+    audio = np.frombuffer(out, np.int16)
+    metrics.note_audio_duration(len(audio) / sample_rate)
+    if np.dtype(dtype) == np.int16:
+        return audio
+    return audio.astype(np.float32) / 32768.0
+
+@metrics.timed("extract_audio")
+def decode_audio_store(video_path, pcm_path=None, sample_rate=SAMPLE_RATE):
+    # Like decode_audio, but the samples stay in a file on disk and are read
+    # back a window at a time, so long recordings don't have to fit in memory
+    try:
+        store = PCMStore.decode(video_path, pcm_path, sample_rate=sample_rate)
+    except ffmpeg.Error as e:
+        print(f"Error decoding audio: {e.stderr.decode(errors='replace') if e.stderr else e}")
+        raise
+    metrics.note_audio_duration(store.duration)
+    return store
+
+@metrics.timed("extract_audio")
+def extract_audio(video_path, audio_path, sample_rate=SAMPLE_RATE):
+    try:
+        (
+            ffmpeg.input(video_path)
+            .output(audio_path, acodec='pcm_s16le', ac=1, ar=sample_rate)
+            .run(overwrite_output=True, quiet=True)
+        )
+    except ffmpeg.Error as e:
         print(f"Error extracting audio: {e}")
         raise
 
-def transcribe_audio(audio_path, model_size="base"):
+@metrics.timed("transcribe_audio")
+def transcribe_audio(audio, model_size="base", device=None, fp16=None, profile=DEFAULT_PROFILE, backend=None):
+    # audio is a file path, a 16 kHz mono float32 array from decode_audio or a
+    # PCMStore window, which is only read into memory here
     try:
-        model = whisper.load_model(model_size)
-        # Enable word-level timestamps
-        result = model.transcribe(audio_path, word_timestamps=True)
-        return result['segments']
+        if isinstance(audio, PCMStore):
+            audio = audio.load()
+        if batching.enabled(backend):
+            return transcribe_batched(audio, model_size=model_size, device=device, fp16=fp16, profile=profile,
+                                      backend=backend)
+        # Reuse an already loaded model instead of reading the weights every job
+        model = get_model(model_size, device=device, fp16=fp16, backend=backend)
+        # The profile picks the decoding strategy and whether words get timestamps
+        return model.transcribe(audio, **decode_options(profile))
     except Exception as e:
         print(f"Error transcribing audio: {e}")
         raise
 
-def create_srt(segments, srt_path, max_chars=42, max_duration=3):
-    subtitles = []
-    index = 1
+def split_audio(audio, chunk_length=300, overlap=5, sample_rate=SAMPLE_RATE):
+    # Windows start every chunk_length seconds and run overlap seconds into the
+    # next one, so words cut at a window edge are heard whole by one of them
+    step = int(chunk_length * sample_rate)
+    extra = int(overlap * sample_rate)
+    chunks = []
+    for start in range(0, max(len(audio), 1), step):
+        chunks.append((start / sample_rate, audio[start:start + step + extra]))
+        if start + step + extra >= len(audio):
+            break
+    return chunks
+
+def transcribe_batched(audio, model_size="base", device=None, fp16=None, profile=DEFAULT_PROFILE, backend=None):
+    # Hands 30 s windows to the process-wide batch service (see batching.py),
+    # where they are decoded together with the windows of every other job
+    if isinstance(audio, str):
+        audio = decode_audio(audio)
+    windows = split_audio(audio, chunk_length=batching.WINDOW_SECONDS - batching.WINDOW_OVERLAP,
+                          overlap=batching.WINDOW_OVERLAP)
+    service = batching.get_service(model_size, device=device, fp16=fp16, backend=backend)
+    options = decode_options(profile)
+    requests = [service.submit(window, options) for _, window in windows]
+    chunk_segments = [_shift_segments(request.result(), offset) for (offset, _), request in zip(windows, requests)]
+    return stitch_segments(chunk_segments, [offset for offset, _ in windows], overlap=batching.WINDOW_OVERLAP)
+
+def _init_transcribe_worker(model_size, device, backend):
+    # Each pool process loads its own copy of the model once
+    get_model(model_size, device=device, backend=backend)
+
+def _transcribe_chunk(args):
+    offset, chunk, model_size, device, profile, backend = args
+    segments = transcribe_audio(chunk, model_size=model_size, device=device, profile=profile, backend=backend)
+    return _shift_segments(segments, offset)
+
+def _shift_segments(segments, offset):
     for segment in segments:
-        words = segment.get('words', [])
-        if not words:
-            words = [{'word': w, 'start': segment['start'], 'end': segment['end']} for w in segment['text'].split()]
-        current_sub = ""
-        phrase_start = None
-
-        for word_info in words:
-            word = word_info['word'].strip()
-            word_start = word_info['start']
-            word_end = word_info['end']
-            if not phrase_start:
-                phrase_start = timedelta(seconds=word_start)
-                start_time = phrase_start
-            end_time = timedelta(seconds=word_end)
-            duration = (end_time - phrase_start).total_seconds()
-
-            if len(current_sub) + len(word) + 1 > max_chars or duration > max_duration:
-                subtitles.append(srt.Subtitle(index=index, start=start_time, end=end_time, content=current_sub.strip()))
-                index += 1
-                current_sub = word + " "
-                phrase_start = timedelta(seconds=word_start)
-                start_time = phrase_start
+        segment['start'] += offset
+        segment['end'] += offset
+        for word in segment.get('words', []):
+            word['start'] += offset
+            word['end'] += offset
+    return segments
+
+def stitch_segments(chunk_segments, chunk_starts, overlap=5):
+    # Every overlap is split at its midpoint: words starting before it belong to
+    # the earlier window, the rest to the later one, so nothing is emitted twice
+    stitched = []
+    for i, segments in enumerate(chunk_segments):
+        lower = chunk_starts[i] + overlap / 2 if i > 0 else float('-inf')
+        upper = chunk_starts[i + 1] + overlap / 2 if i + 1 < len(chunk_starts) else float('inf')
+        for segment in segments:
+            words = segment.get('words')
+            if words:
+                kept = [w for w in words if lower <= w['start'] < upper]
+                if not kept:
+                    continue
+                if len(kept) != len(words):
+                    segment = dict(segment, words=kept)
+                    segment['start'] = kept[0]['start']
+                    segment['end'] = kept[-1]['end']
+                    segment['text'] = "".join(w['word'] for w in kept)
             else:
-                current_sub += word + " "
+                middle = (segment['start'] + segment['end']) / 2
+                if not lower <= middle < upper:
+                    continue
+            stitched.append(segment)
+    for index, segment in enumerate(stitched):
+        segment['id'] = index
+    return stitched
 
-        if current_sub:
-            subtitles.append(srt.Subtitle(index=index, start=phrase_start, end=end_time, content=current_sub.strip()))
-            index += 1
+@metrics.timed("vad")
+def detect_speech(audio, sample_rate=SAMPLE_RATE):
+    # Speech regions in seconds (see vad.py), with the share of audio skipped reported
+    regions = speech_regions(audio, sample_rate)
+    total = len(audio) / sample_rate
+    speech = sum(end - start for start, end in regions)
+    metrics.note_speech_duration(speech)
+    if total:
+        print(f"Voice activity: {len(regions)} speech region(s), skipping {1 - speech / total:.0%} of the audio")
+    return regions
 
-    srt_content = srt.compose(subtitles)
+@metrics.timed("transcribe_audio")
+def transcribe_audio_parallel(audio, model_size="base", workers=None, chunk_length=300, overlap=5, device=None,
+                              checkpoint_dir=None, vad=False, profile=DEFAULT_PROFILE, backend=None):
+    # Audio longer than one chunk is transcribed window by window, in parallel
+    # with workers > 1 and in order otherwise, so Whisper never holds more than
+    # chunk_length seconds of it. With vad only the speech regions are
+    # transcribed, each split the same way. With a checkpoint_dir every
+    # finished chunk is saved there, and chunks saved by an interrupted run are not redone.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    regions = [(0.0, len(audio) / SAMPLE_RATE)]
+    if vad:
+        regions = detect_speech(audio)
+    # (offset in seconds on the original timeline, audio, region index)
+    chunks = []
+    for region, (start, end) in enumerate(regions):
+        first = int(start * SAMPLE_RATE)
+        for offset, chunk in split_audio(audio[first:int(end * SAMPLE_RATE)], chunk_length=chunk_length, overlap=overlap):
+            chunks.append((first / SAMPLE_RATE + offset, chunk, region))
+    if not chunks:
+        return []
+    if len(chunks) == 1 and not vad:
+        return transcribe_audio(audio, model_size=model_size, device=device, profile=profile, backend=backend)
     try:
-        with open(srt_path, 'w', encoding='utf-8') as f:
-            f.write(srt_content)
+        checkpoint_paths = [None] * len(chunks)
+        chunk_segments = [None] * len(chunks)
+        if checkpoint_dir:
+            for i, (offset, _, _) in enumerate(chunks):
+                checkpoint_paths[i] = checkpoints.chunk_checkpoint_path(
+                    checkpoint_dir, offset, model_size, chunk_length, overlap, vad, profile, get_backend(backend).name,
+                )
+                chunk_segments[i] = checkpoints.load_json(checkpoint_paths[i])
+        pending = [i for i, segments in enumerate(chunk_segments) if segments is None]
+        if len(pending) < len(chunks):
+            print(f"Resuming transcription: {len(chunks) - len(pending)} of {len(chunks)} chunks already done")
+        if pending and (workers <= 1 or len(pending) == 1):
+            for i in pending:
+                chunk_segments[i] = _transcribe_chunk((chunks[i][0], chunks[i][1], model_size, device, profile, backend))
+                if checkpoint_paths[i]:
+                    checkpoints.save_json(checkpoint_paths[i], chunk_segments[i])
+        elif pending:
+            # spawn keeps torch's thread pools from being inherited by the workers
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(pending)),
+                mp_context=context,
+                initializer=_init_transcribe_worker,
+                initargs=(model_size, device, backend),
+            ) as pool:
+                futures = {
+                    pool.submit(_transcribe_chunk, (chunks[i][0], chunks[i][1], model_size, device, profile, backend)): i for i in pending
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    chunk_segments[i] = future.result()
+                    if checkpoint_paths[i]:
+                        checkpoints.save_json(checkpoint_paths[i], chunk_segments[i])
+        # Overlapping chunks are stitched within each region; regions never overlap
+        segments = []
+        for region in range(len(regions)):
+            members = [i for i, chunk in enumerate(chunks) if chunk[2] == region]
+            if members:
+                segments += stitch_segments([chunk_segments[i] for i in members], [chunks[i][0] for i in members],
+                                            overlap=overlap)
+        for index, segment in enumerate(segments):
+            segment['id'] = index
+        return segments
     except Exception as e:
-        print(f"Error writing SRT file: {e}")
+        print(f"Error transcribing audio in chunks: {e}")
         raise
 
-def create_pdf(segments, pdf_path):
+@metrics.timed("create_subtitles")
+def create_subtitles(segments, paths, max_chars=42, max_duration=3):
+    # Streams the cues into every requested file (.srt, .vtt or .ass) in one pass
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font("Arial", size=12)
-
-        for segment in segments:
-            start_time = str(timedelta(seconds=segment['start'])).split('.')[0]
-            end_time = str(timedelta(seconds=segment['end'])).split('.')[0]
-            text = segment['text'].strip()
+        write_subtitles(segments, paths, max_chars=max_chars, max_duration=max_duration)
+    except Exception as e:
+        print(f"Error writing subtitle file: {e}")
+        raise
 
-            pdf.multi_cell(0, 10, f"[{start_time} - {end_time}]")
-            pdf.multi_cell(0, 10, text)
-            pdf.ln(1)
+def create_srt(segments, srt_path, max_chars=42, max_duration=3):
+    create_subtitles(segments, srt_path, max_chars=max_chars, max_duration=max_duration)
 
-        pdf.output(pdf_path)
-        print(f"PDF transcript created at: {pdf_path}")
+@metrics.timed("create_pdf")
+def create_pdf(segments, pdf_path, compact=False):
+    from transcript_pdf import render_pdf
+    try:
+        pages = render_pdf(segments, pdf_path, compact=compact)
+        print(f"PDF transcript created at: {pdf_path} ({pages} pages)")
     except Exception as e:
         print(f"Error creating PDF: {e}")
         raise
 
-def embed_subtitles_hardcode(video_path, srt_path, output_path):
+@metrics.timed("create_txt")
+def create_txt(segments, txt_path):
     try:
-        subtitle_style = (
-            "FontSize=16,PrimaryColour=&HFFFFFF&,BackColour=&H80000000&,"
-            "BorderStyle=1,Outline=1,OutlineColour=&H000000&,Shadow=1,ShadowColour=&H000000&,"
-            "Alignment=2,MarginV=10"
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            for segment in segments:
+                f.write(segment['text'].strip() + "\n")
+    except Exception as e:
+        print(f"Error writing text transcript: {e}")
+        raise
+
+@metrics.timed("create_json")
+def create_json(segments, json_path):
+    try:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(segments, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"Error writing JSON transcript: {e}")
+        raise
+
+SUBTITLE_STYLE = (
+    "FontSize=16,PrimaryColour=&HFFFFFF&,BackColour=&H80000000&,"
+    "BorderStyle=1,Outline=1,OutlineColour=&H000000&,Shadow=1,ShadowColour=&H000000&,"
+    "Alignment=2,MarginV=10"
+)
+
+def _encoder_options(preset=None, crf=None, threads=None, video_bitrate=None):
+    # Only pass what was asked for so the defaults stay ffmpeg's own
+    options = {}
+    if preset is not None:
+        options['preset'] = preset
+    if crf is not None:
+        options['crf'] = crf
+    if threads is not None:
+        options['threads'] = threads
+    if video_bitrate is not None:
+        # Rate control with a capped VBV buffer, so the output size is known
+        # before encoding (see planner.plan_quality); audio is pinned to match
+        options['b:v'] = f"{video_bitrate}k"
+        options['maxrate'] = f"{video_bitrate}k"
+        options['bufsize'] = f"{video_bitrate * 2}k"
+        options['b:a'] = f"{AUDIO_KBPS}k"
+    return options
+
+def _subtitle_filter(subtitle_path):
+    # ASS files carry their own style; anything else gets SUBTITLE_STYLE forced on
+    if subtitle_path.lower().endswith('.ass'):
+        return f"ass={subtitle_path}"
+    return f"subtitles={subtitle_path}:force_style='{SUBTITLE_STYLE}'"
+
+@metrics.timed("embed_subtitles_hardcode")
+def embed_subtitles_hardcode(video_path, srt_path, output_path, preset=None, crf=None, threads=None,
+                             video_bitrate=None):
+    try:
+        ffmpeg_filter = _subtitle_filter(srt_path)
+        (
+            ffmpeg.input(video_path)
+            .output(output_path, vf=ffmpeg_filter, **_encoder_options(preset, crf, threads, video_bitrate))
+            .run(overwrite_output=True)
         )
-        ffmpeg_filter = f"subtitles={srt_path}:force_style='{subtitle_style}'"
-        ffmpeg.input(video_path).output(output_path, vf=ffmpeg_filter).run(overwrite_output=True)
     except ffmpeg.Error as e:
         print(f"FFmpeg error: {e}")
         raise
 
-def fetch_video_info(video_url):
-    ydl_opts = {
-        'format': 'bestvideo+bestaudio/best',
-        'noplaylist': True,
-        'quiet': True,
-        'no_warnings': True,
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+def keyframe_times(video_path):
+    # Only keyframes are decoded, which is far cheaper than a full pass
+    probe = ffmpeg.probe(video_path, select_streams='v:0', skip_frame='nokey', show_entries='frame=pts_time')
+    return sorted(float(f['pts_time']) for f in probe.get('frames', []) if f.get('pts_time') not in (None, 'N/A'))
+
+def split_points(keyframes, duration, segments):
+    # Cut at the keyframe closest to each equal share of the duration
+    cuts = [0.0]
+    for k in range(1, segments):
+        target = duration * k / segments
+        candidates = [t for t in keyframes if t > cuts[-1]]
+        if not candidates:
+            break
+        cut = min(candidates, key=lambda t: abs(t - target))
+        if cut < duration:
+            cuts.append(cut)
+    cuts.append(duration)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def shift_srt(srt_path, output_path, start, end):
+    # Keep the cues that overlap [start, end) and move them to the segment's own clock
+    with open(srt_path, 'r', encoding='utf-8') as f:
+        subtitles = list(srt.parse(f.read()))
+    offset = timedelta(seconds=start)
+    limit = timedelta(seconds=end)
+    shifted = []
+    for sub in subtitles:
+        if sub.end <= offset or sub.start >= limit:
+            continue
+        shifted.append(srt.Subtitle(
+            index=len(shifted) + 1,
+            start=max(sub.start - offset, timedelta(0)),
+            end=min(sub.end, limit) - offset,
+            content=sub.content,
+        ))
+    if not shifted:
+        return False
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(srt.compose(shifted))
+    return True
+
+def _burn_segment(video_path, srt_path, segment_path, start, end, encoder_options):
+    stream = ffmpeg.input(video_path, ss=start, t=end - start)
+    options = dict(encoder_options, an=None)
+    if srt_path:
+        options['vf'] = _subtitle_filter(srt_path)
+    stream.output(segment_path, vcodec='libx264', **options).run(overwrite_output=True, quiet=True)
+
+# Containers the H.264 pieces of a parallel burn can be joined into without re-encoding
+H264_CONTAINERS = ('.mp4', '.mkv', '.mov', '.m4v')
+
+def parallel_burn_output_path(output_path):
+    # Other containers (WebM from YouTube) can't hold H.264, so those outputs become MP4
+    base, ext = os.path.splitext(output_path)
+    if ext.lower() in H264_CONTAINERS:
+        return output_path
+    return f"{base}.mp4"
+
+@metrics.timed("embed_subtitles_hardcode")
+def embed_subtitles_hardcode_parallel(video_path, srt_path, output_path, segments=None, preset=None, crf=None,
+                                      threads=None, work_dir=None, video_bitrate=None):
+    # Burn N keyframe-aligned pieces in separate ffmpeg processes, then join them
+    # losslessly with the concat demuxer and add the original audio back once.
+    # Returns the path written, see parallel_burn_output_path.
+    output_path = parallel_burn_output_path(output_path)
+    cpus = os.cpu_count() or 1
+    if segments is None:
+        segments = cpus
+    if threads is None:
+        threads = max(1, cpus // segments)
+    try:
+        probe = ffmpeg.probe(video_path)
+        duration = float(probe['format']['duration'])
+        has_audio = any(s.get('codec_type') == 'audio' for s in probe.get('streams', []))
+        pieces = split_points(keyframe_times(video_path), duration, segments)
+        if len(pieces) <= 1:
+            embed_subtitles_hardcode(video_path, srt_path, output_path, preset=preset, crf=crf,
+                                     video_bitrate=video_bitrate)
+            return output_path
+
+        work_dir = tempfile.mkdtemp(prefix="burn_", dir=work_dir or os.path.dirname(os.path.abspath(output_path)))
         try:
-            info_dict = ydl.extract_info(video_url, download=False)
-            print(f"Info dict: {info_dict}")  # Debugging output
-            formats = info_dict.get('formats', [])
-            # Extract available qualities
-            valid_qualities = {'144p', '240p', '360p', '480p', '720p', '1080p'}
-            qualities = {}
-            for fmt in formats:
-                height = fmt.get('height')
-                if height:
-                    quality = f"{height}p"
-                    if quality in valid_qualities and quality not in qualities:
-                        qualities[quality] = None
-            # Sort qualities
-            sorted_qualities = sorted(qualities.keys(), key=lambda x: int(x.rstrip('p')), reverse=True)
-            return sorted_qualities
-        except Exception as e:
-            return f"Error fetching video info: {str(e)}"
+            encoder_options = _encoder_options(preset, crf, threads, video_bitrate)
+            subtitle_ext = os.path.splitext(srt_path)[1].lower()
+            shift = shift_ass if subtitle_ext == '.ass' else shift_srt
+            jobs = []
+            for i, (start, end) in enumerate(pieces):
+                piece_srt = os.path.join(work_dir, f"segment_{i:04d}{subtitle_ext}")
+                if not shift(srt_path, piece_srt, start, end):
+                    piece_srt = None
+                jobs.append((video_path, piece_srt, os.path.join(work_dir, f"segment_{i:04d}.mp4"), start, end, encoder_options))
+            with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+                for future in [pool.submit(_burn_segment, *job) for job in jobs]:
+                    future.result()
 
+            list_path = os.path.join(work_dir, "segments.txt")
+            with open(list_path, 'w', encoding='utf-8') as f:
+                for job in jobs:
+                    f.write(f"file '{job[2]}'\n")
+            video = ffmpeg.input(list_path, format='concat', safe=0)['v']
+            streams = [video, ffmpeg.input(video_path)['a']] if has_audio else [video]
+            audio_options = {'b:a': encoder_options['b:a']} if 'b:a' in encoder_options else {}
+            ffmpeg.output(*streams, output_path, vcodec='copy', **audio_options).run(overwrite_output=True, quiet=True)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return output_path
+    except ffmpeg.Error as e:
+        print(f"FFmpeg error: {e.stderr.decode(errors='replace') if e.stderr else e}")
+        raise
 
+# Subtitle codec each container can carry as a soft track
+SOFT_SUBTITLE_CODECS = {
+    '.mp4': 'mov_text',
+    '.m4v': 'mov_text',
+    '.mov': 'mov_text',
+    '.mkv': 'srt',
+    '.webm': 'webvtt',
+}
 
-def download_youtube_video(video_url, selected_quality, download_dir="temp_video"):
-    quality_number = selected_quality.split('p')[0]
+def soft_subtitle_output_path(output_path):
+    # Containers without a subtitle codec are remuxed into MKV
+    base, ext = os.path.splitext(output_path)
+    if ext.lower() in SOFT_SUBTITLE_CODECS:
+        return output_path
+    return f"{base}.mkv"
+
+@metrics.timed("embed_subtitles_soft")
+def embed_subtitles_soft(video_path, srt_path, output_path):
+    # Stream-copy audio and video and add the SRT as a subtitle track: no re-encode
+    try:
+        codec = SOFT_SUBTITLE_CODECS[os.path.splitext(output_path)[1].lower()]
+        video = ffmpeg.input(video_path)
+        subtitles = ffmpeg.input(srt_path)
+        has_audio = any(s.get('codec_type') == 'audio' for s in ffmpeg.probe(video_path).get('streams', []))
+        streams = [video['v'], video['a'], subtitles['s']] if has_audio else [video['v'], subtitles['s']]
+        (
+            ffmpeg.output(*streams, output_path, c='copy', scodec=codec, **{'disposition:s:0': 'default'})
+            .run(overwrite_output=True, quiet=True)
+        )
+    except ffmpeg.Error as e:
+        print(f"FFmpeg error: {e.stderr.decode(errors='replace') if e.stderr else e}")
+        raise
+
+# Qualities offered for download
+VALID_QUALITIES = ('144p', '240p', '360p', '480p', '720p', '1080p')
+
+def fetch_video_details(video_url):
+    # Duration and the estimated download size in bytes (None when unknown) of
+    # every available quality: its largest video stream plus the best audio.
+    # The metadata is cached, so the downloads that follow don't extract it again.
+    info_dict = sources.get_info(video_url)
+    duration = info_dict.get('duration') or 0
+
+    def size(fmt):
+        estimate = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not estimate and fmt.get('tbr') and duration:
+            estimate = fmt['tbr'] * 1000 / 8 * duration
+        return estimate or None
+
+    formats = info_dict.get('formats', [])
+    audio_sizes = [size(fmt) for fmt in formats if fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')]
+    audio = max((s for s in audio_sizes if s), default=0)
+    sizes = {}
+    for fmt in formats:
+        height = fmt.get('height')
+        quality = f"{height}p" if height else None
+        if quality not in VALID_QUALITIES:
+            continue
+        estimate = size(fmt)
+        if estimate and fmt.get('acodec') in (None, 'none'):
+            estimate += audio
+        if quality not in sizes or (estimate or 0) > (sizes[quality] or 0):
+            sizes[quality] = estimate
+    return {'duration': duration, 'sizes': sizes}
+
+def fetch_video_info(video_url):
+    try:
+        sizes = fetch_video_details(video_url)['sizes']
+        # Sort qualities
+        return sorted(sizes, key=lambda x: int(x.rstrip('p')), reverse=True)
+    except Exception as e:
+        return f"Error fetching video info: {str(e)}"
+
+def plan_youtube(video_url, outputs, target_mb=None, time_budget=None):
+    # outputs is a resolved set of output kinds (see resolve_outputs)
+    details = fetch_video_details(video_url)
+    return plan_quality(details['duration'], details['sizes'], target_mb=target_mb, time_budget=time_budget,
+                        burn='burned' in outputs, soft='muxed' in outputs)
+
+
+def is_playlist_url(url):
+    return 'list=' in url or '/playlist' in url
+
+def list_playlist_urls(playlist_url):
+    import yt_dlp
+    # Flat extraction only lists the entries, it doesn't resolve every video
     ydl_opts = {
-        'format': f'bestvideo[height<={quality_number}]+bestaudio/best[height<={quality_number}]',
-        'outtmpl': os.path.join(download_dir, '%(title)s.%(ext)s'),
-        'noplaylist': True,
+        'extract_flat': 'in_playlist',
         'quiet': True,
         'no_warnings': True,
     }
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         try:
-            info_dict = ydl.extract_info(video_url, download=True)
-            video_path = ydl.prepare_filename(info_dict)
-            # Handle cases where the downloaded filename might have different extensions
-            if not os.path.exists(video_path):
-                possible_exts = ['mp4', 'webm', 'mkv']
-                base_path = os.path.splitext(video_path)[0]
-                for ext in possible_exts:
-                    trial_path = f"{base_path}.{ext}"
-                    if os.path.exists(trial_path):
-                        video_path = trial_path
-                        break
-            if not os.path.exists(video_path):
-                raise FileNotFoundError(f"Downloaded video file not found: {video_path}")
-            return video_path
+            info_dict = ydl.extract_info(playlist_url, download=False)
         except Exception as e:
-            raise Exception(f"Error downloading video: {str(e)}")
+            raise Exception(f"Error reading playlist: {str(e)}")
+    urls = []
+    for entry in info_dict.get('entries') or []:
+        url = entry.get('url') or entry.get('webpage_url')
+        if not url and entry.get('id'):
+            url = f"https://www.youtube.com/watch?v={entry['id']}"
+        if url:
+            urls.append(url)
+    return urls
+
+# Downloads go to the shared source store (see sources.py), where later jobs
+# for the same video find them. Pass a sources.Leases to keep the download
+# from being evicted until the job releases it.
+
+@metrics.timed("download")
+def download_youtube_video(video_url, selected_quality, leases=None):
+    quality_number = selected_quality.split('p')[0]
+    try:
+        return sources.fetch_source(
+            video_url,
+            selected_quality,
+            f'bestvideo[height<={quality_number}]+bestaudio/best[height<={quality_number}]',
+            ['mp4', 'webm', 'mkv'],
+            leases=leases,
+        )
+    except Exception as e:
+        raise Exception(f"Error downloading video: {str(e)}")
 
-def process_video(video_path, model_size="base"):
-    audio_path = "temp_audio.wav"
-    srt_path = "temp_subtitles.srt"
-    output_video_path = os.path.join("output", f"output_{os.path.basename(video_path)}")
-    output_pdf_path = os.path.join("output", f"transcript_{os.path.basename(video_path)}.pdf")
+@metrics.timed("download_audio")
+def download_youtube_audio(video_url, leases=None):
+    # The audio-only stream is a small fraction of the video, so transcription can start early
+    try:
+        return sources.fetch_source(video_url, 'audio', 'bestaudio/best', ['m4a', 'webm', 'opus', 'mp3', 'mp4'],
+                                    leases=leases)
+    except Exception as e:
+        raise Exception(f"Error downloading video: {str(e)}")
 
+def transcript_options(chunk_length=300, vad=False, profile=DEFAULT_PROFILE, backend=None):
+    # Everything that changes the transcript has to be part of the cache key.
+    # The worker count doesn't: the same windows are transcribed either way.
+    options = dict(decode_options(profile), chunk_length=chunk_length, vad=vad)
+    backend = get_backend(backend).name
+    if backend != 'whisper':
+        # Whisper transcripts keep the keys they were cached under before backends existed
+        options['backend'] = backend
+    if batching.enabled(backend):
+        # Fixed 30 s windows decode slightly differently from Whisper's own seeking
+        options['batched'] = True
+    return options
+
+def load_cached_transcript(model_size, options, audio=None, source_id=None):
+    # Returns (key, segments); segments is None on a miss
+    key = transcript_cache.cache_key(model_size, options, audio=audio, source_id=source_id)
+    return key, transcript_cache.load(key)
+
+def store_cached_transcript(key, segments):
     try:
-        extract_audio(video_path, audio_path)
-        segments = transcribe_audio(audio_path, model_size=model_size)
-        create_srt(segments, srt_path)
-        embed_subtitles_hardcode(video_path, srt_path, output_video_path)
-        create_pdf(segments, output_pdf_path)
-        print("Video and PDF processing completed successfully.")
+        transcript_cache.store(key, segments)
+    except Exception as e:
+        # A cache failure must never fail the job itself
+        print(f"Error writing transcript cache: {e}")
+
+def transcribe_decoded(audio, model_size="base", workers=1, chunk_length=300, checkpoint_dir=None, vad=False,
+                       profile=DEFAULT_PROFILE, backend=None, device=None):
+    # device None picks the GPU when there is one, as models.get_model does
+    return transcribe_audio_parallel(audio, model_size=model_size, workers=workers, chunk_length=chunk_length,
+                                     checkpoint_dir=checkpoint_dir, vad=vad, profile=profile, backend=backend,
+                                     device=device)
+
+def transcribe_video(audio_source, model_size="base", workers=1, chunk_length=300, use_cache=True, source_id=None,
+                     checkpoint_dir=None, vad=False, profile=DEFAULT_PROFILE, backend=None, device=None):
+    # audio_source is a media path, or a callable returning one that is only
+    # called when the transcript isn't cached
+    options = transcript_options(chunk_length, vad, profile, backend)
+    key = None
+    if use_cache and source_id:
+        key, segments = load_cached_transcript(model_size, options, source_id=source_id)
+        if segments is not None:
+            print(f"Using cached transcript for {source_id}")
+            return segments
+
+    audio = decode_audio_store(audio_source() if callable(audio_source) else audio_source)
+    try:
+        if use_cache and key is None:
+            key, segments = load_cached_transcript(model_size, options, audio=audio)
+            if segments is not None:
+                print("Using cached transcript for identical audio")
+                return segments
+
+        segments = transcribe_decoded(audio, model_size=model_size, workers=workers, chunk_length=chunk_length,
+                                      checkpoint_dir=checkpoint_dir, vad=vad, profile=profile, backend=backend,
+                                      device=device)
     finally:
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-        if os.path.exists(srt_path):
-            os.remove(srt_path)
-        if os.path.exists(video_path):
-            os.remove(video_path)  # Remove the downloaded video to save space
+        audio.remove()
+    if use_cache:
+        store_cached_transcript(key, segments)
+    return segments
+
+def write_transcripts(job, outputs, compact_pdf=False):
+    # Every subtitle file comes from one streaming pass: the requested SRT/VTT,
+    # a styled ASS for burn-in and a workspace SRT for the soft track
+    job.output_video_path = None
+    subtitle_paths = []
+    for kind, path in (('srt', job.output_srt_path), ('vtt', job.output_vtt_path)):
+        if kind in outputs:
+            subtitle_paths.append(path)
+            job.outputs[kind] = path
+    if 'burned' in outputs:
+        subtitle_paths.append(job.ass_path)
+    if 'muxed' in outputs:
+        subtitle_paths.append(job.srt_path)
+    if subtitle_paths:
+        create_subtitles(job.segments, subtitle_paths)
+    if 'txt' in outputs:
+        create_txt(job.segments, job.output_txt_path)
+        job.outputs['txt'] = job.output_txt_path
+    if 'json' in outputs:
+        create_json(job.segments, job.output_json_path)
+        job.outputs['json'] = job.output_json_path
+    if 'pdf' in outputs:
+        create_pdf(job.segments, job.output_pdf_path, compact=compact_pdf)
+        job.outputs['pdf'] = job.output_pdf_path
+
+def render_video(job, video_path, outputs, burn_segments=1, preset=None, crf=None, video_bitrate=None):
+    job.use_video(video_path)
+    burned_path = job.output_video_path
+    if 'burned' in outputs:
+        if burn_segments > 1:
+            burned_path = embed_subtitles_hardcode_parallel(
+                video_path, job.ass_path, burned_path, segments=burn_segments, preset=preset, crf=crf,
+                video_bitrate=video_bitrate,
+            )
+        else:
+            embed_subtitles_hardcode(video_path, job.ass_path, burned_path, preset=preset, crf=crf,
+                                     video_bitrate=video_bitrate)
+        job.outputs['burned'] = burned_path
+    if 'muxed' in outputs:
+        muxed_path = job.output_video_path
+        if 'burned' in outputs:
+            base, ext = os.path.splitext(job.output_video_path)
+            muxed_path = f"{base}_soft{ext}"
+        muxed_path = soft_subtitle_output_path(muxed_path)
+        embed_subtitles_soft(video_path, job.srt_path, muxed_path)
+        job.outputs['muxed'] = muxed_path
+    # The main video for front-ends that only show one
+    job.output_video_path = job.outputs.get('burned') or job.outputs.get('muxed')
+
+def _run_pipeline(job, audio_source, video_source, model_size="base", workers=1, chunk_length=300, use_cache=True,
+                  vad=False, profile=DEFAULT_PROFILE, backend=None, source_id=None, subtitle_mode="burn", outputs=None,
+                  compact_pdf=False, burn_segments=1, preset=None, crf=None, video_bitrate=None, manifest=None):
+    # video_source may be a callable that blocks until the video is available,
+    # so everything that only needs the transcript runs before it is called.
+    # Stages recorded in the manifest by an earlier, failed run are skipped.
+    outputs = resolve_outputs(outputs, subtitle_mode)
+    job.segments = manifest.load_segments() if manifest else None
+    if job.segments is None:
+        job.segments = transcribe_video(
+            audio_source, model_size=model_size, workers=workers, chunk_length=chunk_length,
+            use_cache=use_cache, source_id=source_id, checkpoint_dir=manifest.chunk_dir if manifest else None, vad=vad,
+            profile=profile, backend=backend,
+        )
+        if manifest:
+            manifest.save_segments(job.segments)
+    write_transcripts(job, outputs, compact_pdf=compact_pdf)
+    if not outputs & VIDEO_OUTPUTS:
+        print("Transcript processing completed successfully.")
+        return job
+
+    rendered = manifest.done('render') if manifest else None
+    if rendered:
+        job.outputs.update(rendered['outputs'])
+        job.output_video_path = job.outputs.get('burned') or job.outputs.get('muxed')
+        print("Video was already rendered by an earlier run.")
+        return job
+    video_path = video_source() if callable(video_source) else video_source
+    render_video(job, video_path, outputs, burn_segments=burn_segments, preset=preset, crf=crf,
+                 video_bitrate=video_bitrate)
+    if manifest:
+        manifest.complete('render', outputs={kind: job.outputs[kind] for kind in VIDEO_OUTPUTS if kind in job.outputs})
+    print("Video and transcript processing completed successfully.")
+    return job
+
+def _job_failed(manifest, error):
+    # The source, downloads and checkpoints are kept so the job can pick up where it stopped
+    manifest.fail(error)
+    print(f"Job {manifest.job_id} failed: {error}")
+    print(f"Resume it with: python main.py resume {manifest.job_id}")
+
+def process_video(video_path, output_dir="output", use_tmpfs=None, job_id=None, **options):
+    # Fail on bad options before any work is done
+    resolve_outputs(options.get('outputs'), options.get('subtitle_mode', 'burn'))
+    # Each call gets its own workspace, so concurrent jobs never share intermediates
+    job = VideoJob(video_path, output_dir=output_dir, use_tmpfs=use_tmpfs, job_id=job_id)
+    manifest = checkpoints.JobManifest.open(
+        job.job_id, 'local', [video_path], dict(options, output_dir=output_dir, use_tmpfs=use_tmpfs),
+    )
+    os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        with metrics.job(job.job_id, source=video_path):
+            _run_pipeline(job, video_path, video_path, manifest=manifest, **options)
+    except Exception as e:
+        _job_failed(manifest, e)
+        raise
+    finally:
+        job.cleanup()
+    manifest.finish()
+    if os.path.exists(video_path):
+        os.remove(video_path)  # Remove the downloaded video to save space
+    return job
+
+def process_youtube_url(video_url, selected_quality, output_dir="output", use_tmpfs=None,
+                        job_id=None, target_mb=None, time_budget=None, **options):
+    # Manifests written before downloads moved to the source store still carry it
+    options.pop('download_dir', None)
+    if selected_quality == 'auto':
+        # Pick the resolution and encode settings that fit the size and time budgets
+        plan = plan_youtube(video_url, resolve_outputs(options.get('outputs'), options.get('subtitle_mode', 'burn')),
+                            target_mb=target_mb, time_budget=time_budget)
+        print(plan.describe())
+        selected_quality, options = plan.quality, plan.apply(options)
+    # Fetch the small audio-only stream first and transcribe it while the video
+    # downloads in the background; jobs without a video output skip that download
+    needs_video = bool(resolve_outputs(options.get('outputs'), options.get('subtitle_mode', 'burn')) & VIDEO_OUTPUTS)
+    video_id = youtube_video_id(video_url)
+    job = VideoJob(f"{video_id or 'youtube'}.mp4", output_dir=output_dir, use_tmpfs=use_tmpfs, job_id=job_id)
+    manifest = checkpoints.JobManifest.open(
+        job.job_id, 'youtube', [video_url, selected_quality],
+        dict(options, output_dir=output_dir, use_tmpfs=use_tmpfs),
+    )
+    os.makedirs(output_dir, exist_ok=True)
+
+    leases = sources.Leases()
+
+    def download(stage, fn, *args):
+        # A download finished by an earlier run is reused while it is still
+        # there; one in the source store is fetched again, which leases it
+        done = manifest.done(stage)
+        if done and os.path.exists(done['path']) and not sources.is_stored(done['path']):
+            return done['path']
+        path = fn(*args, leases=leases)
+        manifest.complete(stage, path=path)
+        return path
+
+    def fetch_audio():
+        return download('download_audio', download_youtube_audio, video_url)
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    with metrics.job(job.job_id, source=video_url):
+        video_future = None
+        if needs_video:
+            # Run in a copy of our context so the download is attributed to this job
+            video_future = pool.submit(
+                contextvars.copy_context().run, download, 'download_video', download_youtube_video, video_url,
+                selected_quality,
+            )
+        try:
+            _run_pipeline(job, fetch_audio, video_future.result if video_future else None,
+                          source_id=video_id, manifest=manifest, **options)
+        except Exception as e:
+            # Report the failure now rather than after the video download finishes
+            if video_future:
+                video_future.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            _job_failed(manifest, e)
+            raise
+        finally:
+            pool.shutdown(wait=False)
+            job.cleanup()
+            leases.release()
+
+    # Downloads in the source store stay for the next job on the same video;
+    # only a finished job gives up any others
+    for stage in ('download_audio', 'download_video'):
+        done = manifest.data['stages'].get(stage)
+        if done and os.path.exists(done['path']) and not sources.is_stored(done['path']):
+            os.remove(done['path'])  # Remove the downloaded files to save space
+    manifest.finish()
+    return job
 
 def handle_upload_video(video_file):
     if not video_file:
@@ -192,18 +823,16 @@ def handle_upload_video(video_file):
         # Ensure the temp_video directory exists
         os.makedirs(temp_video_dir, exist_ok=True)
 
-        # Construct the new path
-        new_path = os.path.join(temp_video_dir, os.path.basename(video_path))
+        # Construct the new path, prefixed so two uploads with the same name don't collide
+        new_path = os.path.join(temp_video_dir, f"{uuid.uuid4().hex[:8]}_{os.path.basename(video_path)}")
 
         # Move the uploaded video to temp_video directory using shutil.move
         if not os.path.abspath(video_path).startswith(temp_video_dir):
             shutil.move(video_path, new_path)
             video_path = new_path
 
-        process_video(video_path)
-        output_video_path = os.path.join("output", f"output_{os.path.basename(video_path)}")
-        output_pdf_path = os.path.join("output", f"transcript_{os.path.basename(video_path)}.pdf")
-        return output_video_path, output_pdf_path, ""
+        job = process_video(video_path)
+        return job.output_video_path, job.output_pdf_path, ""
     except Exception as e:
         return None, None, f"Error processing uploaded video: {str(e)}"
 
@@ -219,14 +848,7 @@ def handle_process_video(video_url, selected_quality):
     if not video_url:
         return None, None, "Please enter a YouTube URL."
     try:
-        video_path = download_youtube_video(video_url, selected_quality)
-    except Exception as e:
-        return None, None, str(e)
-    
-    try:
-        process_video(video_path)
-        output_video_path = os.path.join("output", f"output_{os.path.basename(video_path)}")
-        output_pdf_path = os.path.join("output", f"transcript_{os.path.basename(video_path)}.pdf")
-        return output_video_path, output_pdf_path, ""
+        job = process_youtube_url(video_url, selected_quality)
+        return job.output_video_path, job.output_pdf_path, ""
     except Exception as e:
         return None, None, f"Error processing video: {str(e)}"
@@ -0,0 +1,69 @@
+import os
+
+# Energy-based voice activity detection: frames well above the recording's own
+# noise floor are speech. It needs nothing but numpy and scans an hour of audio
+# in well under a second, so silences, intros and quiet music beds can be left
+# out of transcription (where Whisper also tends to hallucinate text).
+
+FRAME_SECONDS = 0.03
+# A frame is speech when it is this much louder than the noise floor...
+MARGIN_DB = float(os.environ.get("UPSHIRSA_VAD_MARGIN_DB", 12))
+# ...and louder than this absolute level in dBFS
+MIN_DB = -50.0
+# Percentile of the frame levels taken as the noise floor
+FLOOR_PERCENTILE = 10
+# Speech regions are padded, joined across pauses shorter than MIN_SILENCE_SECONDS
+# (every region costs Whisper at least one 30 s window, so only long gaps are
+# worth skipping) and dropped when shorter than MIN_SPEECH_SECONDS
+PAD_SECONDS = 0.3
+MIN_SILENCE_SECONDS = 3.0
+MIN_SPEECH_SECONDS = 0.8
+# Audio is scanned this many seconds at a time, so a PCMStore is never loaded whole
+SCAN_SECONDS = 300
+
+
+def frame_levels(audio, sample_rate):
+    # dBFS level of every frame of audio (an array from decode_audio or a PCMStore)
+    import numpy as np
+    frame = int(FRAME_SECONDS * sample_rate)
+    step = frame * int(SCAN_SECONDS / FRAME_SECONDS)
+    levels = []
+    for start in range(0, len(audio), step):
+        window = audio[start:start + step]
+        if hasattr(window, 'load'):
+            window = window.load()
+        if window.dtype == np.int16:
+            window = window.astype(np.float32) / 32768.0
+        count = len(window) // frame
+        if not count:
+            continue
+        frames = window[:count * frame].reshape(count, frame)
+        power = np.mean(np.square(frames, dtype=np.float64), axis=1)
+        levels.append(10 * np.log10(power + 1e-12))
+    return np.concatenate(levels) if levels else np.zeros(0)
+
+
+def speech_regions(audio, sample_rate):
+    # [(start, end)] in seconds on the original timeline
+    import numpy as np
+    duration = len(audio) / sample_rate
+    levels = frame_levels(audio, sample_rate)
+    if not len(levels) or levels.max() <= MIN_DB:
+        return []
+    floor = np.percentile(levels, FLOOR_PERCENTILE)
+    if np.percentile(levels, 90) - floor < MARGIN_DB:
+        # Too little dynamic range to tell speech from background: keep it all
+        return [(0.0, duration)]
+    speech = levels > max(floor + MARGIN_DB, MIN_DB)
+
+    # Frame indices where runs of speech start and end
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    regions = []
+    for first, last in zip(edges[0::2], edges[1::2]):
+        start = max(float(first) * FRAME_SECONDS - PAD_SECONDS, 0.0)
+        end = min(float(last) * FRAME_SECONDS + PAD_SECONDS, duration)
+        if regions and start - regions[-1][1] < MIN_SILENCE_SECONDS:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    return [(start, end) for start, end in regions if end - start >= MIN_SPEECH_SECONDS]